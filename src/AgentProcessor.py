@@ -1,4 +1,7 @@
-import gradio as gr
+# gradio and matplotlib are imported where they are used, so the headless
+# runner (src/run.py) can use this class without paying for UI startup
+import asyncio
+import os
 import time
 import pandas as pd
 from microsoft_agents.activity import ActivityTypes, load_configuration_from_env
@@ -6,16 +9,64 @@ from microsoft_agents.copilotstudio.client import (
     ConnectionSettings,
     CopilotClient,
 )
-import matplotlib.pyplot as plt
 import numpy as np
-resultsdf = pd.DataFrame(columns=['Serial', 'Query', 'Response', 'Time','Char-Len'])
-resultsaidf = pd.DataFrame(columns=['Serial', 'Query', 'PlannerStep', 'Thought', 'Tool', 'Arguments'])
+from src.clock_sync import TimeSplit, server_time
+from src.corpus import Query
+from src.failures import STATUSES, RetryPolicy, classify
+from src.harness_profiler import EventLoopMonitor, HarnessProfiler, RunProfiler
+from src.latency_model import LatencyModel, sample_rows
+from src.load_engine import LoadEngine
+from src.recorder import ActivityRecorder, RecordingClient, ReplayClient
+from src.result_store import ResultStore
+from src.run_store import RunStore, new_run_id
+from src.scenario import ScenarioCorpus, TurnDepth, open_corpus
+from src.soak import RollingWindows
+from src.streaming_stats import LatencyHistogram, StreamingStats
+from src.tool_attribution import ToolAttribution, draw_waterfall, plan_shape
+# Schemas of the per-run result stores, column -> dtype
+RESULT_COLUMNS = {'Serial': 'int64', 'Query': object, 'Response': object, 'Time': 'float64', 'Char-Len': 'int64',
+                  'User': 'int64', 'ConversationId': object, 'SendLag': 'float64', 'Offset': 'float64',
+                  'FirstActivity': 'float64', 'PlanReceived': 'float64', 'ToolTime': 'float64', 'StreamEnd': 'float64',
+                  'AuthWait': 'float64', 'Turn': 'int64', 'Scenario': object, 'Warmup': 'bool', 'QueryId': object, 'Category': object,
+                  'ExpectedTool': object, 'ToolMatch': object, 'Plan': object,
+                  'Target': object, 'Status': object, 'Retries': 'int64', 'RetryTime': 'float64', 'Error': object,
+                  'Overhead': 'float64', 'LoopLag': 'float64', 'Stalled': 'bool',
+                  'ServerTime': 'float64', 'NetworkTime': 'float64', 'Upstream': 'float64', 'Delivery': 'float64',
+                  'DeliveryMax': 'float64', 'ClockOffset': 'float64', 'InFlight': 'int64'}
+PLANNER_COLUMNS = {'Serial': 'int64', 'Query': object, 'PlannerStep': object, 'Thought': object, 'Tool': object,
+                   'Arguments': object, 'Elapsed': 'float64', 'Duration': 'float64'}
+# Paired Triggered/Finished planner events; Sample is the Serial of the query's resultsdf row
+SPAN_COLUMNS = {'Sample': 'int64', 'Query': object, 'Tool': object, 'Start': 'float64', 'End': 'float64',
+                'Duration': 'float64'}
 import sys
 
 class AgentProcessor:
+    # Rows of each table sent to the browser per refresh while a run is in progress
+    LIVE_ROWS = 500
+    # Most queries the latency driver fit reads; larger (soak) runs are sampled down to this
+    MODEL_ROWS = 50000
+    # UI mode label -> ArrivalScheduler mode; closed loop has no schedule
+    ARRIVAL_MODES = {"Closed loop": None, "Open loop (constant)": "constant", "Open loop (Poisson)": "poisson"}
+    # Statistics tab label -> resultsdf column; every phase is seconds since the query was sent
+    PHASES = {"First Activity": "FirstActivity", "Plan Received": "PlanReceived", "Tool Time": "ToolTime",
+              "First Message": "Time", "Stream End": "StreamEnd"}
+    # Phase columns appended to resultsdf after the Offset column
+    PHASE_COLUMNS = ['FirstActivity', 'PlanReceived', 'ToolTime', 'StreamEnd']
+    # Rows per spilled chunk in soak runs
+    SPILL_ROWS = 10000
+
     def __init__(self, name, connection):
         self.name = name
         self.connection = connection
+        # A/B label of the configuration this processor measures (see src/ab_test.py)
+        self.target = None
+        # Per-query failure handling: no retries and no timeout unless a run sets them
+        self.retry_policy = RetryPolicy()
+        self.query_timeout = None
+        self.exporter = None
+        # Samples event-loop lag while queries are in flight; started by the first query
+        self.loop_monitor = EventLoopMonitor()
+        self.reset_results()
 
     @property
     def data(self):
@@ -49,16 +100,43 @@ class AgentProcessor:
         # Join the formatted strings for all dictionaries
         return " \n ".join(formatted_items)
 
-    def generate_boxplot(self, data):
-        # Create the figure and axis objects
-        fig, ax = plt.subplots()
-        
+    def timed_boxplot(self, stats):
+        with self.profiler.section('boxplot'):
+            return self.generate_boxplot(stats)
+
+    def generate_boxplot(self, stats, fig=None, title="Response Time Box Plot", xlabel="Query"):
+        # Redraw the run's single figure from the streaming histogram instead of
+        # creating a new pyplot figure (never closed) from every sample. stats may
+        # also be {label: StreamingStats}, one box each, drawn on fig
+        if fig is None:
+            if self.figure is None:
+                from matplotlib.figure import Figure
+                self.figure = Figure()
+            fig = self.figure
+        fig.clear()
+        ax = fig.add_subplot()
+        if not isinstance(stats, dict):
+            stats = {'Response Times': stats}
+        boxes = []
+        for label, series in stats.items():
+            if series.count == 0:
+                continue
+            # Whiskers at 1.5 IQR, clipped to the observed range
+            q1, median, q3 = series.histogram.percentiles([25, 50, 75])
+            iqr = q3 - q1
+            boxes.append({'label': label, 'med': median, 'q1': q1, 'q3': q3,
+                          'whislo': max(series.min, q1 - 1.5 * iqr), 'whishi': min(series.max, q3 + 1.5 * iqr),
+                          'fliers': [value for value in (series.min, series.max)
+                                     if value < q1 - 1.5 * iqr or value > q3 + 1.5 * iqr]})
+        if not boxes:
+            return fig
+
         # Generate the box plot
-        ax.boxplot([data], labels=['Response Times'])
+        ax.bxp(boxes)
         
         # Set plot title and labels
-        ax.set_title("Response Time Box Plot")
-        ax.set_xlabel("Query")
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
         ax.set_ylabel("Values")
         ax.set_axis_on()
         ax.set_facecolor('white')
@@ -66,164 +144,591 @@ class AgentProcessor:
         ax.yaxis.grid(True)
         return fig
     
+    def waterfall(self, serial):
+        # Waterfall figure of one query of the current run, by its resultsdf Serial
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(9, 4))
+        serial = int(serial or 0)
+        if not 1 <= serial <= len(self.samples):
+            fig.add_subplot().set_title(f"No query with Serial {serial} in this run")
+            return fig
+        # Chunk by chunk, so a query of a spilled soak run does not load the whole run
+        sample = next(frame for frame in self.samples.frames(serial - 1) if serial - 1 in frame.index).loc[serial - 1]
+        spans = pd.concat([frame[frame['Sample'] == serial] for frame in self.spans.frames()])
+        return draw_waterfall(fig, sample, spans[spans['Sample'] == serial].sort_values('Start'))
+
     def extract_and_format_json_data_without_keys(self, jsoncat):
         result = ""
         for item in jsoncat:
             result += str(item) + "\n"
         return result
     
-    async def ask_question_file(self):
+    def live_frame(self, store, sent):
+        # While a run is in progress only the newest LIVE_ROWS rows are sent to the
+        # browser, and nothing at all when no row was added since the last refresh
+        import gradio as gr
+
+        if len(store) == sent:
+            return gr.update()
+        return store.tail(self.LIVE_ROWS)
+
+    def build_outputs(self, running, status):
+        import gradio as gr
+
+        started = time.perf_counter()
+        if running:
+            resultsdf = self.live_frame(self.samples, self.sent_samples)
+            resultsaidf = self.live_frame(self.planner, self.sent_planner)
+        elif self.soak_dir:
+            # Soak runs never send the full tables; the trend plot shows the whole run
+            resultsdf = self.samples.tail(self.LIVE_ROWS)
+            resultsaidf = self.planner.tail(self.LIVE_ROWS)
+        else:
+            resultsdf = self.samples.to_frame()
+            resultsaidf = self.merge_dataframes(self.planner.to_frame())
+        self.sent_samples = len(self.samples)
+        self.sent_planner = len(self.planner)
+        self.last_refresh = time.perf_counter()
+        stats = self.stats
+        empty = stats.count == 0
+        # Headline numbers come from the streaming accumulators, so a refresh
+        # costs the same on sample 100 as on sample 100,000
+        p90, p95, p99, p999 = [round(value, 2) if value is not None else 0
+                               for value in stats.histogram.percentiles([90, 95, 99, 99.9])]
+        # Outputs wired to btn.click in main.py, in the same order
+        outputs = (
+            gr.update(interactive=not running),
+            gr.update(interactive=True),
+            status,
+            round(stats.mean, 2) if not empty else 0,
+            round(stats.percentile(50), 2) if not empty else 0,
+            round(stats.max, 2) if not empty else 0,
+            round(stats.min, 2) if not empty else 0,
+            round(stats.std, 2),
+            resultsdf,
+            resultsdf,
+            resultsaidf,
+            round(stats.correlation, 4),
+            self.timed_boxplot(stats),
+            round(self.lag_stats.mean, 4),
+            round(self.lag_stats.max, 4) if self.lag_stats.count else 0,
+            self.phase_percentiles(),
+            p90,
+            p95,
+            p99,
+            p999,
+            self.attribution.tool_frame(),
+            self.attribution.plan_frame(),
+            self.outcomes(),
+            self.windows.trend()
+        )
+        # Timed here, the refresh is reported next to the per-query overhead it causes
+        self.profiler.add('ui refresh', time.perf_counter() - started)
+        return outputs + (self.profiler.frame(self.loop_monitor), self.depth.trend(), self.time_split.frame(),
+                          gr.update() if running else self.model.drivers(), gr.update() if running else self.model.outliers())
+
+    def summary(self):
+        # Summary statistics persisted with every run in the run store
+        stats = self.stats
+        summary = {'Samples': stats.count, 'Mean': stats.mean if stats.count else None,
+                   'Max': stats.max if stats.count else None, 'Min': stats.min if stats.count else None,
+                   'Deviation': stats.std, 'Token Corr': stats.correlation, 'Planner Rows': len(self.planner),
+                   'AuthWait Max': self.auth_stats.max if self.auth_stats.count else None,
+                   'Warmup Samples': self.warmup_samples,
+                   'ConversationStart Mean': self.start_stats.mean if self.start_stats.count else None,
+                   'ConversationStart Max': self.start_stats.max if self.start_stats.count else None,
+                   'Connections Opened': self.connection_counts['opened'],
+                   'Connections Reused': self.connection_counts['reused'],
+                   'Error Rate': self.error_rate(),
+                   'Retries': sum(self.outcome_retries.values())}
+        for status in STATUSES:
+            if status != 'ok' and status in self.outcome_histograms:
+                summary[f'Status {status}'] = self.outcome_histograms[status].total
+        for q, value in zip([50, 90, 95, 99, 99.9], stats.histogram.percentiles([50, 90, 95, 99, 99.9])):
+            summary[f'Time p{q}'] = value
+        for column, histogram in self.phase_histograms.items():
+            if column != 'Time':
+                for q, value in zip([50, 90, 95, 99], histogram.percentiles([50, 90, 95, 99])):
+                    summary[f'{column} p{q}'] = value
+        for label, histogram in self.turn_histograms.items():
+            summary[f'{label} p50'] = histogram.percentile(50)
+        summary.update(self.windows.drift() or {})
+        summary.update(self.depth.growth() or {})
+        summary.update(self.time_split.summary())
+        if self.profiler.overhead.total:
+            summary['Overhead p50'], summary['Overhead p95'] = self.profiler.overhead.percentiles([50, 95])
+            summary['LoopLag Max'] = self.loop_monitor.histogram.max if self.loop_monitor.histogram.total else None
+            summary['Stalled Samples'] = self.profiler.stalled
+        return summary
+
+    def agent_name(self):
+        settings = getattr(self.connection, 'settings', None)
+        return getattr(settings, 'agent_identifier', None) or getattr(settings, 'direct_connect_url', None) or self.name
+
+    def save_run(self, tag, config):
+        # Persist both tables and the summary; returns the new run id
+        run_id = new_run_id()
+        RunStore().save_run(run_id, self.agent_name(), tag, self.run_started_at, self.samples.frames(),
+                            self.planner.frames(), self.summary(), config)
+        print(f"Run {run_id} saved to the run store.")
+        return run_id
+
+    def reset_results(self, soak_dir=None, window=60.0):
+        # Fresh result stores and run clock (used for the Offset column) per run.
+        # A soak run (soak_dir set) spills the raw rows to soak_dir in chunks and
+        # only keeps the rolling windows and streaming statistics in memory
+        self.soak_dir = soak_dir
+        if soak_dir:
+            os.makedirs(soak_dir, exist_ok=True)
+        spill = {name: os.path.join(soak_dir, name) if soak_dir else None
+                 for name in ('samples', 'planner', 'spans', 'windows.csv')}
+        self.samples = ResultStore(RESULT_COLUMNS, spill=spill['samples'], chunk_rows=self.SPILL_ROWS)
+        self.planner = ResultStore(PLANNER_COLUMNS, spill=spill['planner'], chunk_rows=self.SPILL_ROWS)
+        self.spans = ResultStore(SPAN_COLUMNS, spill=spill['spans'], chunk_rows=self.SPILL_ROWS)
+        self.windows = RollingWindows(window or 60.0, path=spill['windows.csv'])
+        # Latency by conversation depth (the Turn column), see src/scenario.py
+        self.depth = TurnDepth()
+        # Server vs network split from the activities' server timestamps (src/clock_sync.py)
+        self.time_split = TimeSplit()
+        # Latency drivers, fitted once the run has ended (src/latency_model.py)
+        self.model = LatencyModel()
+        # Harness sections, per-query overhead and stalls (src/harness_profiler.py)
+        self.profiler = HarnessProfiler()
+        self.loop_monitor.reset()
+        self.attribution = ToolAttribution()
+        # Incremental statistics, updated once per sample
+        self.stats = StreamingStats()
+        self.lag_stats = StreamingStats()
+        self.auth_stats = StreamingStats()
+        self.phase_histograms = {column: LatencyHistogram() for column in self.PHASES.values()}
+        self.step_histogram = LatencyHistogram()
+        # Cold path costs, reported next to (not inside) the headline numbers:
+        # start_conversation time, first turn vs later turns of a conversation,
+        # and how many HTTP connections the run opened vs reused
+        self.start_stats = StreamingStats()
+        self.turn_histograms = {'Cold Turn': LatencyHistogram(), 'Warm Turn': LatencyHistogram()}
+        self.conversation_turns = {}
+        self.warmup_samples = 0
+        self.connection_counts = {'opened': 0, 'reused': 0}
+        # Status -> time-to-outcome histogram and retry count of measured queries
+        self.outcome_histograms = {}
+        self.outcome_retries = {}
+        # Queries currently being sent or retried (exported by src/metrics_exporter.py)
+        self.in_flight = 0
+        # UI refresh bookkeeping: rows already sent and time of the last update
+        self.sent_samples = 0
+        self.sent_planner = 0
+        self.last_refresh = 0.0
+        self.figure = None
+        self.run_started = time.perf_counter()
+        self.run_started_at = time.time()
+
+    def add_planner_row(self, query, step, thought, tool, arguments, elapsed, duration=None):
+        self.planner.append({'Serial': len(self.planner) + 1, 'Query': query, 'PlannerStep': step, 'Thought': thought,
+                             'Tool': tool, 'Arguments': arguments, 'Elapsed': round(elapsed, 4),
+                             'Duration': round(duration, 4) if duration is not None else None})
+        if duration is not None:
+            self.step_histogram.record(duration)
+
+    def phase_percentiles(self):
+        # p50/p90/p95/p99 of every phase plus the individual step durations
+        rows = []
+        histograms = [(label, self.phase_histograms[column]) for label, column in self.PHASES.items()]
+        histograms += [('Plan Step', self.step_histogram), ('Conversation Start', self.start_stats.histogram)]
+        for label, histogram in histograms + list(self.turn_histograms.items()):
+            rows.append([label] + [round(value, 3) if value is not None else None
+                                   for value in histogram.percentiles([50, 90, 95, 99])])
+        return pd.DataFrame(rows, columns=['Phase', 'p50', 'p90', 'p95', 'p99'])
+
+    async def wait_for_token(self):
+        # Seconds spent waiting for an expired token to be refreshed; normally 0
+        # because the provider refreshes ahead of expiry
+        provider = getattr(self.connection, 'token_provider', None)
+        if provider is None or provider.valid():
+            return 0.0
+        started = time.perf_counter()
+        await asyncio.to_thread(provider.token)
+        return time.perf_counter() - started
+
+    @staticmethod
+    def tool_match(expected_tool, tools):
+        # Whether the planner triggered the expected tool, by schema name or its last segment
+        if not expected_tool:
+            return None
+        return any(tool == expected_tool or tool.split('.')[-1] == expected_tool for tool in tools)
+
+    def record_conversation_start(self, seconds):
+        self.start_stats.add(seconds)
+
+    def log(self, text):
+        # print(), timed as its own harness section
+        started = time.perf_counter()
+        print(text)
+        self.profiler.add('print', time.perf_counter() - started)
+
+    def handle_activity(self, query, reply, elapsed, attempt, open_steps):
+        # One activity of a reply stream; returns True at the end of the conversation
+        phases = attempt['phases']
+        if phases['FirstActivity'] is None:
+            phases['FirstActivity'] = elapsed
+        if reply.type == ActivityTypes.event:
+            self.log(f" - {reply}")
+            with self.profiler.section('planner rows'):
+                if reply.value_type == "DynamicPlanReceived":
+                    if phases['PlanReceived'] is None:
+                        phases['PlanReceived'] = elapsed
+                    attempt['plans'].append([str(step) for step in reply.value['steps']])
+                    self.add_planner_row(query,
+                                         reply.value_type,
+                                         self.extract_and_format_json_data(reply.value['toolDefinitions'], ['displayName', 'description']),
+                                         self.extract_and_format_json_data(reply.value['toolDefinitions'], ['schemaName']) +  self.extract_and_format_json_data_without_keys(reply.value['steps']),
+                                         '',
+                                         elapsed)
+                elif reply.value_type == "DynamicPlanStepTriggered":
+                    attempt['tools'].add(reply.value['taskDialogId'])
+                    open_steps[reply.value.get('stepId', reply.value['taskDialogId'])] = elapsed
+                    self.add_planner_row(query, reply.value_type, reply.value['thought'], reply.value['taskDialogId'], '', elapsed)
+                elif reply.value_type == "DynamicPlanStepBindUpdate":
+                    self.add_planner_row(query, reply.value_type, '', reply.value['taskDialogId'], str(reply.value['arguments']), elapsed)
+                elif reply.value_type == "DynamicPlanStepFinished":
+                    # Pair with the matching Triggered event to get the step duration
+                    triggered = open_steps.pop(reply.value.get('stepId', reply.value['taskDialogId']), None)
+                    duration = elapsed - triggered if triggered is not None else None
+                    if duration is not None:
+                        phases['ToolTime'] += duration
+                        attempt['spans'].append((reply.value['taskDialogId'], triggered, elapsed))
+                    self.add_planner_row(query, reply.value_type, '', reply.value['taskDialogId'], '', elapsed, duration)
+        elif reply.type == ActivityTypes.message:
+            self.log(f"\n{reply.text}")
+            if reply.suggested_actions:
+                for action in reply.suggested_actions.actions:
+                    self.log(f" - {action.title}")
+            if reply.text is not None and reply.type == ActivityTypes.message:
+                self.log(f"\n{reply.text}" + "\n --- Final Response ---\n")
+                if phases['FirstMessage'] is None:
+                    phases['FirstMessage'] = elapsed
+                    self.log(f"Total time taken: {elapsed:.6f} seconds")
+                attempt['texts'].append(reply.text)
+        elif reply.type == ActivityTypes.end_of_conversation:
+            self.log("\nEnd of conversation.")
+            return True
+        return False
+
+    async def read_reply(self, query, conversation_id, start_time, attempt):
+        # Streams one reply into `attempt`; phases are seconds since start_time.
+        # The time spent handling each activity is harness overhead inside the
+        # measured window: the next read waits for it
+        open_steps = {}
+        replies = self.connection.ask_question(query, conversation_id)
+        try:
+            async for reply in replies:
+                received = time.perf_counter()
+                done = self.handle_activity(query, reply, received - start_time, attempt, open_steps)
+                stamp = server_time(reply)
+                if stamp is not None:
+                    kind = 'message' if reply.type == ActivityTypes.message and reply.text else reply.value_type or reply.type
+                    attempt['stamps'].append((stamp, received, kind))
+                handled = time.perf_counter() - received
+                attempt['overhead'] += handled
+                self.profiler.add('activity handling', handled)
+                if done:
+                    break
+        finally:
+            # Close the stream now rather than at garbage collection, so its connection goes back to the pool
+            await replies.aclose()
+
+    async def process_query(self, query, conversation_id, user=1, scheduled_at=None, warmup=False):
+        # Returns the query's Status (see src/failures.py). Failures are recorded
+        # as rows, never raised, so one bad query does not end the run.
+        # Corpus records carry metadata; plain strings are queries without any
+        meta = query if isinstance(query, Query) else Query(query)
+        query = meta.text
+        print(f" - [user {user}] {query}")
+        turn = self.conversation_turns[conversation_id] = self.conversation_turns.get(conversation_id, 0) + 1
+        self.loop_monitor.start()
+        first_send = time.perf_counter()
+        self.in_flight += 1
+        try:
+            retries = 0
+            while True:
+                status, error = 'ok', ''
+                # Auth stalls are reported as AuthWait and kept out of the agent latency
+                try:
+                    auth_wait = await self.wait_for_token()
+                except Exception as e:
+                    status, error, auth_wait = 'auth', str(e), 0.0
+                start_time = time.perf_counter()
+                # In open-loop runs latency is measured from the scheduled send time, so
+                # time spent waiting for a free slot counts against the agent; retries
+                # are measured from their own send
+                send_lag = 0.0
+                if scheduled_at is not None and retries == 0:
+                    send_lag = max(start_time - scheduled_at - auth_wait, 0.0)
+                    start_time = scheduled_at + auth_wait
+                # Seconds since send at which each phase was first seen
+                attempt = {'phases': {'FirstActivity': None, 'PlanReceived': None, 'FirstMessage': None, 'ToolTime': 0.0},
+                           'plans': [], 'spans': [], 'tools': set(), 'texts': [], 'overhead': 0.0, 'stamps': [],
+                           'sent_at': time.perf_counter(), 'in_flight': self.in_flight}
+                if status == 'ok':
+                    try:
+                        if self.query_timeout:
+                            await asyncio.wait_for(self.read_reply(query, conversation_id, start_time, attempt), self.query_timeout)
+                        else:
+                            await self.read_reply(query, conversation_id, start_time, attempt)
+                        if not attempt['texts']:
+                            status, error = 'no_message', 'Reply stream ended without a message'
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        status, error = classify(e), str(e) or type(e).__name__
+                attempt['phases']['StreamEnd'] = time.perf_counter() - start_time
+                if status == 'ok' or not self.retry_policy.should_retry(status, retries):
+                    break
+                delay = self.retry_policy.delay(retries)
+                print(f" - [user {user}] {status}: {error}. Retry {retries + 1} in {delay:.2f}s")
+                retries += 1
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+        with self.profiler.section('record sample'):
+            self.record_sample(meta, user, conversation_id, turn, warmup, status, error, retries, attempt,
+                               send_lag, start_time, auth_wait, start_time - first_send if retries else 0.0)
+        return status
+
+    def record_start_failure(self, query, user, status, error, retries, start_time, warmup=False):
+        # A query that was never sent because its conversation could not be
+        # started: one failed row without a conversation, with the start's Status
+        meta = query if isinstance(query, Query) else Query(query)
+        print(f" - [user {user}] {meta.text}: {status}, no conversation")
+        attempt = {'phases': {'FirstActivity': None, 'PlanReceived': None, 'FirstMessage': None, 'ToolTime': 0.0,
+                              'StreamEnd': time.perf_counter() - start_time},
+                   'plans': [], 'spans': [], 'tools': set(), 'texts': [], 'overhead': 0.0, 'stamps': [],
+                   'sent_at': start_time, 'in_flight': self.in_flight}
+        with self.profiler.section('record sample'):
+            self.record_sample(meta, user, None, 0, warmup, status, f"Conversation start failed: {error}", retries,
+                               attempt, 0.0, start_time, 0.0, 0.0)
+
+    def record_sample(self, meta, user, conversation_id, turn, warmup, status, error, retries, attempt,
+                      send_lag, start_time, auth_wait, retry_time):
+        phases, spans = attempt['phases'], attempt['spans']
+        response = "\n".join(attempt['texts'])
+        row = {'Serial': len(self.samples) + 1, 'Query': meta.text, 'Response': response,
+               'Time': phases['FirstMessage'].__round__(2) if phases['FirstMessage'] is not None else None,
+               'Char-Len': len(response), 'User': user, 'ConversationId': conversation_id,
+               'SendLag': round(send_lag, 4), 'Offset': round(start_time - self.run_started, 4),
+               'AuthWait': round(auth_wait, 4), 'Turn': turn, 'Scenario': meta.scenario, 'Warmup': warmup,
+               'QueryId': meta.id, 'Category': meta.category, 'ExpectedTool': meta.expected_tool,
+               'ToolMatch': self.tool_match(meta.expected_tool, attempt['tools']), 'Plan': plan_shape(attempt['plans']),
+               'Target': self.target, 'Status': status, 'Retries': retries, 'RetryTime': round(retry_time, 4),
+               'Error': error, 'Overhead': round(attempt['overhead'], 6),
+               'LoopLag': round(self.loop_monitor.max_lag(attempt['sent_at']), 4), 'InFlight': attempt['in_flight']}
+        row['Stalled'] = row['LoopLag'] > self.profiler.stall_threshold
+        # Failed and warm-up replies still bound the clock offset, they just stay out of the split statistics.
+        # Replayed activities carry the recorded server stamps, which say nothing about this run's clock.
+        if not isinstance(self.connection, ReplayClient):
+            row.update(self.time_split.add(attempt['sent_at'], attempt['stamps'], status == 'ok' and not warmup))
+        for column in self.PHASE_COLUMNS:
+            row[column] = round(phases[column], 4) if phases[column] is not None else None
+        self.samples.append(row)
+        if status == 'ok':
+            for tool, start, end in spans:
+                self.spans.append({'Sample': row['Serial'], 'Query': meta.text, 'Tool': tool, 'Start': round(start, 4),
+                                   'End': round(end, 4), 'Duration': round(end - start, 4)})
+            self.turn_histograms['Cold Turn' if turn == 1 else 'Warm Turn'].record(phases['FirstMessage'])
+        if warmup:
+            self.warmup_samples += 1
+            return
+        self.profiler.add_query(attempt['overhead'], row['Stalled'])
+        # Every outcome gets its own time-to-outcome histogram; only successes feed the headline numbers
+        self.outcome_histograms.setdefault(status, LatencyHistogram()).record(max(phases['StreamEnd'], 1e-4))
+        self.windows.add(time.perf_counter() - self.run_started, phases['FirstMessage'], status == 'ok')
+        self.outcome_retries[status] = self.outcome_retries.get(status, 0) + retries
+        if status != 'ok':
+            return
+        self.stats.add(phases['FirstMessage'], len(response))
+        self.lag_stats.add(send_lag)
+        self.auth_stats.add(auth_wait)
+        self.depth.add(turn, phases['FirstMessage'])
+        self.attribution.add_query(row['Plan'], phases['StreamEnd'], spans)
+        for column in self.PHASES.values():
+            self.phase_histograms[column].record(phases['FirstMessage'] if column == 'Time' else phases[column])
+
+    async def start_metrics(self, port):
+        # The endpoint outlives the run, so the final numbers stay scrapeable until the next run
+        from src.metrics_exporter import MetricsExporter
+
+        port = int(port or 0)
+        if self.exporter is not None and self.exporter.port != port:
+            await self.exporter.stop()
+            self.exporter = None
+        if port and self.exporter is None:
+            self.exporter = await MetricsExporter(self, port).start()
+
+    def outcomes(self):
+        # Queries, share, retries and time to outcome per Status, plus all failures together
+        total = sum(histogram.total for histogram in self.outcome_histograms.values())
+        failures = LatencyHistogram()
+        rows = []
+        for status in STATUSES:
+            histogram = self.outcome_histograms.get(status)
+            if histogram is None:
+                continue
+            if status != 'ok':
+                failures.merge(histogram)
+            rows.append([status, histogram.total, round(histogram.total / total * 100, 2),
+                         self.outcome_retries[status]] + [round(value, 3) for value in histogram.percentiles([50, 95])])
+        if failures.total:
+            rows.append(['all failures', failures.total, round(failures.total / total * 100, 2),
+                         sum(count for status, count in self.outcome_retries.items() if status != 'ok')]
+                        + [round(value, 3) for value in failures.percentiles([50, 95])])
+        return pd.DataFrame(rows, columns=['Status', 'Queries', 'Share %', 'Retries', 'p50', 'p95'])
+
+    def latency_drivers(self):
+        # Only the rows and columns the model needs are read, chunk by chunk for a
+        # spilled soak run, and at most MODEL_ROWS of them are kept: outliers are
+        # then those of the sample
+        columns = ['Serial', 'Query', 'Time', 'Char-Len', 'Turn', 'InFlight', 'Status', 'Warmup']
+        measured = (frame.loc[frame['Time'].notna() & ~frame['Warmup'].astype(bool) & (frame['Status'] == 'ok'), columns]
+                    for frame in self.samples.frames())
+        samples = sample_rows(measured, self.MODEL_ROWS, np.random.default_rng(0))
+        if samples.empty:
+            samples = pd.DataFrame(columns=columns)
+        serials = set(samples['Serial'])
+        spans = pd.concat([frame.loc[frame['Sample'].isin(serials), ['Sample', 'Tool']] for frame in self.spans.frames()],
+                          ignore_index=True)
+        return LatencyModel().fit(samples, spans)
+
+    def error_rate(self):
+        total = sum(histogram.total for histogram in self.outcome_histograms.values())
+        ok = self.outcome_histograms['ok'].total if 'ok' in self.outcome_histograms else 0
+        return (total - ok) / total if total else 0.0
+
+    async def ask_question_file(self, users=1, concurrency=1, mode="Closed loop", rate=None, refresh_interval=1.0,
+                                record=False, replay_path="", replay_speed=1.0, tag="", warmup=0, keep_alive=True,
+                                corpus_path='./data/input.txt', sampling="sequential", count=None, duration=None, seed=None,
+                                retries=0, timeout=None, backoff=1.0, metrics_port=None, soak=False, window=60.0,
+                                profile="off", conversation="new"):
+        linecount = 0
+        corpus = None
+        # The run may swap in a recording or replaying client; restored in finally
+        connection = self.connection
+        recorder = None
+        run_profiler = RunProfiler(profile)
         try:
-            linecount = 0
-            act = self.connection.start_conversation(True)
-            print("\nSuggested Actions: ")
-            async for action in act:
-                if action.text:
-                    print(action.text)
-            with (open('./data/input.txt', 'r', encoding='utf-8') as file):
-                for line in file:
-                    linecount = sum(1 for _ in file)
-                print(f"\nTotal lines in file: {linecount}\n")
-            resultsaidf.drop(index=resultsaidf.index, inplace=True)
-            resultsdf.drop(index=resultsdf.index, inplace=True)
-            yield (
-                gr.update(interactive=False),
-                gr.update(interactive=True),
-                "Processing " + str(linecount) + " records.",
-                0,
-                0,
-                0,
-                0,
-                0,
-                resultsaidf,
-                resultsdf,
-                resultsaidf,
-                0,
-                self.generate_boxplot(resultsdf['Time']) if not resultsdf.empty else plt.figure()
-            )
-                # Iterate through each line in the file
-            with (open('./data/input.txt', 'r', encoding='utf-8') as file):
-                for line in file:
-                    # Process each line (e.g., print it, manipulate it)
-                    query = line.strip() # .strip() removes leading/trailing whitespace, including the newline character
-                    print(f" - {query}")
-                    if query in ["exit", "quit", "EXIT"]:
-                        timestamp_str = time.strftime("%Y-%m-%d_%H-%M-%S")
-                        # Construct the filename with a desired extension
-                        filename = f"{action.conversation.id}_{timestamp_str}.csv"
-                        # index=False prevents writing the DataFrame index as a column in the CSV
-                        resultsdf.to_csv(f"./data/{filename}", index=False)
-                        print(f"CSV file '{filename}' created successfully.")
-                        yield (
-                            gr.update(interactive=True),
-                            gr.update(interactive=True),  
-                            "Processed " + str(linecount) + " of " + str(len(resultsdf)) + " records for conversation " + action.conversation.id,
-                            resultsdf['Time'].mean().round(2),
-                            resultsdf['Time'].median().round(2),
-                            resultsdf['Time'].max().round(2),
-                            resultsdf['Time'].min().round(2),
-                            resultsdf['Time'].std().round(2),
-                            resultsdf.sort_index(),
-                            resultsdf.sort_index(),
-                            self.merge_dataframes(resultsaidf.sort_index()),
-                            resultsdf['Char-Len'].corr(resultsdf['Time']),
-                            self.generate_boxplot(resultsdf['Time']) if not resultsdf.empty else plt.figure()
-                        )
-                        print("Exiting...")
-                        break
-                    if query not in ["exit", "quit", "EXIT"]:
-                        start_time = time.perf_counter()
-                        replies = self.connection.ask_question(query, action.conversation.id)
-                        async for reply in replies:
-                            if reply.type == ActivityTypes.event:  
-                                print(f" - {reply}")
-                                # ['Serial', 'Query', 'PlannerStep', 'Thought', 'Tool', 'Arguments']
-                                if reply.value_type == "DynamicPlanReceived":
-                                    resultsaidf.loc[len(resultsaidf)] = [len(resultsaidf) + 1, 
-                                                                         query, 
-                                                                         reply.value_type, 
-                                                                         self.extract_and_format_json_data(reply.value['toolDefinitions'], ['displayName', 'description']),
-                                                                         self.extract_and_format_json_data(reply.value['toolDefinitions'], ['schemaName']) +  self.extract_and_format_json_data_without_keys(reply.value['steps']),
-                                                                         '']
-                                if reply.value_type == "DynamicPlanStepTriggered":
-                                    resultsaidf.loc[len(resultsaidf)] = [len(resultsaidf) + 1, 
-                                                                         query, 
-                                                                         reply.value_type, 
-                                                                         reply.value['thought'], 
-                                                                         reply.value['taskDialogId'], 
-                                                                         '']
-                                elif reply.value_type == "DynamicPlanStepBindUpdate":
-                                    resultsaidf.loc[len(resultsaidf)] = [len(resultsaidf) + 1, 
-                                                                         query, 
-                                                                         reply.value_type, 
-                                                                         '', 
-                                                                         reply.value['taskDialogId'], 
-                                                                         str(reply.value['arguments'])]
-                                elif reply.value_type == "DynamicPlanStepFinished":
-                                    resultsaidf.loc[len(resultsaidf)] = [len(resultsaidf) + 1, 
-                                                                         query, 
-                                                                         reply.value_type, 
-                                                                         '', 
-                                                                         reply.value['taskDialogId'], 
-                                                                         '']    
-                            elif reply.type == ActivityTypes.message:
-                                print(f"\n{reply.text}")
-                                if reply.suggested_actions:
-                                    for action in reply.suggested_actions.actions:
-                                        print(f" - {action.title}")
-                                if reply.text is not None and reply.type == ActivityTypes.message:
-                                    print(f"\n{reply.text}" + "\n --- Final Response ---\n")        
-                                    end_time = time.perf_counter()
-                                    elapsed_time = end_time - start_time
-                                    print(f"Total time taken: {elapsed_time:.6f} seconds")
-                                    resultsdf.loc[len(resultsdf)] = [len(resultsdf) + 1, query, reply.text, elapsed_time.__round__(2), len(reply.text)]
-                                    yield (
-                                        gr.update(interactive=False),
-                                        gr.update(interactive=True),
-                                        "Processing " + str(len(resultsdf)) + " of " + str(linecount) + " records for conversation " + action.conversation.id,
-                                        resultsdf['Time'].mean().round(2),
-                                        resultsdf['Time'].median().round(2),
-                                        resultsdf['Time'].max().round(2),
-                                        resultsdf['Time'].min().round(2),
-                                        resultsdf['Time'].std().round(2),
-                                        resultsdf.sort_index(),
-                                        resultsdf.sort_index(),
-                                        self.merge_dataframes(resultsaidf.sort_index()),
-                                        resultsdf['Char-Len'].corr(resultsdf['Time']),
-                                        self.generate_boxplot(resultsdf['Time']) if not resultsdf.empty else plt.figure()
-                                    )
-                            elif reply.type == ActivityTypes.end_of_conversation:
-                                print("\nEnd of conversation.")
-                                break
-            yield (
-                gr.update(interactive=True),
-                gr.update(interactive=True),
-                "Processed " + str(linecount) + " of " + str(len(resultsdf)) + " records for conversation " + action.conversation.id,
-                resultsdf['Time'].mean().round(2),
-                resultsdf['Time'].median().round(2),
-                resultsdf['Time'].max().round(2),
-                resultsdf['Time'].min().round(2),
-                resultsdf['Time'].std().round(2),
-                resultsdf.sort_index(),
-                resultsdf.sort_index(),
-                self.merge_dataframes(resultsaidf.sort_index()),
-                resultsdf['Char-Len'].corr(resultsdf['Time']),
-                self.generate_boxplot(resultsdf['Time']) if not resultsdf.empty else plt.figure()
-            )   
+            if replay_path:
+                replay = ReplayClient(replay_path, replay_speed)
+                queries = replay.queries()
+                linecount = len(queries)
+                users = min(int(users or 1), max(1, replay.conversations()))
+                self.connection = replay
+            else:
+                # Streamed from disk; the total is only known up front when a count is set
+                corpus = open_corpus(corpus_path or './data/input.txt', sampling, int(seed) if seed not in (None, "") else None,
+                                     count, duration, conversation)
+                queries = corpus
+                # A scenario count is in scenarios; their turns are only known once sent
+                linecount = corpus.count if corpus.count and not isinstance(corpus, ScenarioCorpus) else "?"
+                if record:
+                    os.makedirs('./data/recordings', exist_ok=True)
+                    recorder = ActivityRecorder(f"./data/recordings/{time.strftime('%Y-%m-%d_%H-%M-%S')}.jsonl.gz")
+                    self.connection = RecordingClient(connection, recorder)
+            print(f"\nQueries to send: {linecount}\n")
+            self.reset_results(f"./data/soak/{time.strftime('%Y-%m-%d_%H-%M-%S')}" if soak else None, window)
+            await self.start_metrics(metrics_port)
+            self.loop_monitor.start()
+            run_profiler.start()
+            seed = int(seed) if seed not in (None, "") else None
+            self.retry_policy = RetryPolicy(retries, backoff or 1.0, seed=seed)
+            self.query_timeout = float(timeout) if timeout else None
+            engine = LoadEngine(self, users, concurrency, warmup, keep_alive)
+            arrival = self.ARRIVAL_MODES.get(mode)
+            if arrival and not rate:
+                raise ValueError("Open-loop mode needs a target rate (requests/second)")
+            yield self.build_outputs(True, "Processing " + str(linecount) + " records with " + str(engine.users) + " virtual users" + (f" at {rate} req/s ({arrival})." if arrival else "."))
+            async for _ in engine.run(queries, rate if arrival else None, arrival, seed):
+                # At most one UI update per refresh interval; the final update below always goes out
+                if time.perf_counter() - self.last_refresh < (refresh_interval or 0):
+                    continue
+                yield self.build_outputs(True, "Processing " + str(len(self.samples)) + " of " + str(linecount) + " records across " + str(len(engine.conversation_ids)) + " conversations")
+            if linecount == "?":
+                linecount = engine.sent
+            self.windows.finish()
+            self.model = self.latency_drivers()
+            profile_path = run_profiler.stop()
+            # As before, a corpus that ends with an exit/quit line also gets a CSV in ./data
+            if corpus is not None and corpus.exit_found:
+                timestamp_str = time.strftime("%Y-%m-%d_%H-%M-%S")
+                # Construct the filename with a desired extension
+                filename = f"{engine.conversation_ids[0] if engine.conversation_ids else 'no-conversation'}_{timestamp_str}.csv"
+                # index=False prevents writing the DataFrame index as a column in the CSV
+                self.samples.to_csv(f"./data/{filename}")
+                print(f"CSV file '{filename}' created successfully.")
+            self.connection = connection
+            run_id = self.save_run(tag, {'users': users, 'concurrency': concurrency, 'mode': mode, 'rate': rate,
+                                         'replay': replay_path or None, 'queries': linecount, 'warmup': engine.warmup,
+                                         'keep_alive': keep_alive, 'corpus': None if replay_path else corpus_path,
+                                         'sampling': sampling, 'count': count, 'duration': duration, 'seed': seed,
+                                         'retries': retries, 'timeout': timeout, 'backoff': backoff,
+                                         'soak': self.soak_dir, 'window': window, 'profile': run_profiler.kind,
+                                         'conversation': conversation if isinstance(corpus, ScenarioCorpus) else None})
+            status = "Run " + run_id + ": processed " + str(self.stats.count) + " of " + str(linecount) + " records across " + str(len(engine.conversation_ids)) + " conversations"
+            failed = sum(h.total for s, h in self.outcome_histograms.items() if s != 'ok')
+            if failed:
+                status += f". {failed} failed ({self.error_rate() * 100:.1f}%: " + ", ".join(
+                    f"{s} {h.total}" for s, h in self.outcome_histograms.items() if s != 'ok') + ")"
+            if self.outcome_retries and sum(self.outcome_retries.values()):
+                status += f", {sum(self.outcome_retries.values())} retries"
+            if arrival and self.lag_stats.count:
+                status += f". Send lag behind schedule: mean {self.lag_stats.mean:.4f}s, p95 {self.lag_stats.percentile(95):.4f}s, max {self.lag_stats.max:.4f}s"
+            if self.warmup_samples:
+                status += f" ({self.warmup_samples} warm-up samples excluded from the statistics)"
+            if self.start_stats.count:
+                status += f". Conversation start: mean {self.start_stats.mean:.3f}s, max {self.start_stats.max:.3f}s"
+            status += f". HTTP connections opened {self.connection_counts['opened']}, reused {self.connection_counts['reused']}"
+            if self.auth_stats.count and self.auth_stats.max:
+                status += f". Waited {self.auth_stats.mean * self.auth_stats.count:.2f}s for token refresh (max {self.auth_stats.max:.2f}s), not counted in latency"
+            split = self.time_split.summary()
+            if split:
+                uncertainty = split['Clock Offset +/-']
+                status += (f". To the first message: server p50 {split['ServerTime p50']:.3f}s, network and transport p50 "
+                           f"{split['NetworkTime p50']:.3f}s ({split['Network Share %'] or 0:.0f}% of the total), "
+                           f"clock offset {split['Clock Offset'] * 1000:+.1f}ms"
+                           + (f" +/- {uncertainty * 1000:.1f}ms" if uncertainty is not None else " (bounds inconsistent)"))
+            drivers = self.model.drivers()
+            drivers = drivers[(drivers['Driver'] != 'Intercept') & (drivers['CI Low'] > 0)]
+            if len(drivers):
+                top = drivers.iloc[0]
+                status += (f". Largest latency driver: {top['Driver']} ({top['Cost (s)']:+.3f}s {top['Unit']}, "
+                           f"{top['Avg Contribution (s)']:.3f}s per query on average)")
+            growth = self.depth.growth()
+            if growth:
+                status += f". Latency grows {growth['Turn Slope s/turn'] * 1000:+.1f}ms per turn of conversation depth (up to turn {growth['Turn Depth Max']})"
+            drift = self.windows.drift()
+            if drift:
+                status += f". p95 drift {drift['p95 Drift s/h']:+.3f}s per hour ({drift['p95 First Hour']:.2f}s first hour, {drift['p95 Last Hour']:.2f}s last hour)"
+            if self.profiler.overhead.total:
+                status += f". Harness overhead p95 {self.profiler.overhead.percentile(95) * 1000:.2f}ms per query"
+                if self.profiler.stalled:
+                    status += f", {self.profiler.stalled} samples stalled by event loop lag over {self.profiler.stall_threshold * 1000:g}ms"
+            if profile_path:
+                status += f". Profile written to {profile_path}"
+            if self.soak_dir:
+                status += f". Raw rows and {window:g}s windows spilled to {self.soak_dir}"
+            if recorder is not None:
+                status += f". Activities recorded to {recorder.path}"
+            elif replay_path:
+                status += f". Replayed {replay_path} at speed {replay_speed}"
+            yield self.build_outputs(False, status)
         except Exception as e:
+            import gradio as gr
+
             print(f"Error: {e}")
-            yield (
-                gr.update(interactive=True),
-                gr.update(interactive=False),     
-                f"Error: {e}" + " - Exiting..." + str(len(resultsdf)) + " of " + str(linecount) + " records." + "\n" + e.__traceback__.tb_frame.f_code.co_name + " - " + str(e.__traceback__.tb_lineno),
-                resultsdf['Time'].mean() if not resultsdf.empty else 0,
-                resultsdf['Time'].median() if not resultsdf.empty else 0,
-                resultsdf['Time'].max() if not resultsdf.empty else 0,
-                resultsdf['Time'].min() if not resultsdf.empty else 0,
-                resultsdf['Time'].std() if not resultsdf.empty else 0,
-                resultsdf.sort_index() if not resultsdf.empty else pd.DataFrame(),
-                resultsdf.sort_index() if not resultsdf.empty else pd.DataFrame(),
-                self.merge_dataframes(resultsaidf.sort_index()) if not resultsaidf.empty else pd.DataFrame(),
-                resultsdf['Char-Len'].corr(resultsdf['Time']) if len(resultsdf) > 1 else 0,
-                self.generate_boxplot(resultsdf['Time']) if not resultsdf.empty else plt.figure()
-            )
\ No newline at end of file
+            outputs = self.build_outputs(False, f"Error: {e}" + " - Exiting..." + str(len(self.samples)) + " of " + str(linecount) + " records." + "\n" + e.__traceback__.tb_frame.f_code.co_name + " - " + str(e.__traceback__.tb_lineno))
+            yield (outputs[0], gr.update(interactive=False)) + outputs[2:]
+        finally:
+            self.connection = connection
+            run_profiler.stop()
+            if recorder is not None:
+                recorder.close()
+                print(f"Activities recorded to {recorder.path}")
@@ -0,0 +1,147 @@
+# A/B comparison of two agent configurations (schema names, environments or
+# mock servers) on the same corpus.
+#
+#   python -m src.ab_test --a cr123_helpdesk --b cr123_helpdesk_v2 --users 4 --concurrency 4
+#
+# Every virtual user holds one conversation per target and sends each query
+# to both, alternating which target goes first (A B, B A, A B, ...), so
+# drift over the run (time of day, backend load) hits both sides equally.
+# Percentile differences get bootstrap confidence intervals: both samples
+# are resampled with replacement in batches of NumPy index arrays, and a
+# difference is significant when its interval does not contain zero.
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.failures import successes
+from src.load_engine import LoadEngine
+
+AB_PERCENTILES = [50, 90, 95, 99]
+AB_COLUMNS = ["Time", "StreamEnd"]
+
+
+def bootstrap_percentiles(values, qs, resamples, rng, batch=256):
+    # (len(qs), resamples) array of percentiles of resampled `values`; each
+    # batch is one (batch, n) index matrix, so memory stays at batch * n
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    batch = max(1, min(batch, resamples, 4_000_000 // max(n, 1)))
+    results = []
+    for start in range(0, resamples, batch):
+        size = min(batch, resamples - start)
+        resampled = values[rng.integers(0, n, size=(size, n))]
+        results.append(np.percentile(resampled, qs, axis=1))
+    return np.concatenate(results, axis=1)
+
+
+def bootstrap_diff(a, b, qs=AB_PERCENTILES, resamples=2000, confidence=0.95, seed=None):
+    # Rows of (q, A, B, B - A, CI low, CI high) for every percentile in qs
+    rng = np.random.default_rng(seed)
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    diffs = bootstrap_percentiles(b, qs, resamples, rng) - bootstrap_percentiles(a, qs, resamples, rng)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(diffs, [tail, 100 - tail], axis=1)
+    base, cand = np.percentile(a, qs), np.percentile(b, qs)
+    return [(q, base[i], cand[i], cand[i] - base[i], low[i], high[i]) for i, q in enumerate(qs)]
+
+
+def verdict(low, high):
+    if low > 0:
+        return "B slower"
+    if high < 0:
+        return "B faster"
+    return "no significant difference"
+
+
+def ab_report(samples_a, samples_b, resamples=2000, confidence=0.95, seed=None):
+    rows = []
+    for column in AB_COLUMNS:
+        a = samples_a[column].dropna().to_numpy(dtype=float) if column in samples_a else np.empty(0)
+        b = samples_b[column].dropna().to_numpy(dtype=float) if column in samples_b else np.empty(0)
+        if len(a) < 2 or len(b) < 2:
+            continue
+        for q, base, cand, delta, low, high in bootstrap_diff(a, b, AB_PERCENTILES, resamples, confidence, seed):
+            rows.append({"Metric": f"{column} p{q}", "A": round(base, 4), "B": round(cand, 4), "Delta": round(delta, 4),
+                         "CI Low": round(low, 4), "CI High": round(high, 4), "Verdict": verdict(low, high)})
+    return pd.DataFrame(rows, columns=["Metric", "A", "B", "Delta", "CI Low", "CI High", "Verdict"])
+
+
+class ABTest(LoadEngine):
+    # processors: {"A": AgentProcessor, "B": AgentProcessor}, each with its own
+    # connection; the LoadEngine asks both in alternating order
+    def __init__(self, processors, users=1, concurrency=1, warmup=0, keep_alive=True):
+        super().__init__(processors, users, concurrency, warmup, keep_alive, alternate=True)
+
+    def samples(self):
+        # Both result tables in one frame, told apart by the Target column
+        return pd.concat([processor.samples.to_frame() for processor in self.processors.values()], ignore_index=True)
+
+    def report(self, resamples=2000, confidence=0.95, seed=None):
+        measured = {label: processor.samples.to_frame() for label, processor in self.processors.items()}
+        measured = {label: successes(frame[~frame["Warmup"]]) for label, frame in measured.items()}
+        a, b = self.labels
+        return ab_report(measured[a], measured[b], resamples, confidence, seed)
+
+
+def create_ab_test(target_a, target_b, users=1, concurrency=1, warmup=0, keep_alive=True):
+    from src.AgentProcessor import AgentProcessor
+    from src.connection import create_target_client
+
+    processors = {"A": AgentProcessor(target_a or "A", create_target_client(target_a)),
+                  "B": AgentProcessor(target_b or "B", create_target_client(target_b))}
+    return ABTest(processors, users, concurrency, warmup, keep_alive)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="A/B latency comparison of two agent configurations")
+    parser.add_argument("--a", required=True, help="Target A: schema name, <environment id>/<schema name> or mock server URL")
+    parser.add_argument("--b", required=True, help="Target B, same forms as --a")
+    parser.add_argument("--input", default="./data/input.txt")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument("--resamples", type=int, default=2000)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--retries", type=int, default=0, help="Retries per query on both sides")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-query timeout in seconds on both sides")
+    parser.add_argument("--tag", default="", help="Stored with both runs in the run store")
+    parser.add_argument("--output", default=None, help="CSV for both result tables, with a Target column")
+    args = parser.parse_args(argv)
+
+    from src.corpus import Corpus
+    from src.failures import RetryPolicy
+
+    test = create_ab_test(args.a, args.b, args.users, args.concurrency, args.warmup)
+    for processor in test.processors.values():
+        processor.retry_policy = RetryPolicy(args.retries, seed=args.seed)
+        processor.query_timeout = args.timeout
+
+    async def drive():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            async for _ in test.run(Corpus(args.input)):
+                pass
+
+    asyncio.run(drive())
+    started = time.perf_counter()
+    report = test.report(args.resamples, args.confidence, args.seed)
+    print(report.to_string(index=False))
+    print(f"\nBootstrap of {args.resamples} resamples took {time.perf_counter() - started:.2f}s")
+    if args.output:
+        test.samples().to_csv(args.output, index=False)
+    for label, processor in test.processors.items():
+        processor.save_run(args.tag, {"ab": label, "a": args.a, "b": args.b, "users": args.users,
+                                      "concurrency": args.concurrency, "input": args.input})
+    # Non-zero exit when B is significantly slower at any percentile
+    return 1 if (report["Verdict"] == "B slower").any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
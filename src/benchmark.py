@@ -0,0 +1,120 @@
+# Harness benchmark against the local mock server (src/mock_server.py):
+#
+#   python -m src.benchmark --queries 500 --levels 1,8,32,128
+#
+# throughput  - the mock answers instantly, so queries/sec at each concurrency
+#               level is the most the harness itself can drive.
+# timing      - the mock answers after a fixed delay, so anything measured on
+#               top of that delay is timing error added by the harness and
+#               the local transport.
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def mock_server(*server_args):
+    # Separate process, so the server does not share the harness' event loop
+    port = free_port()
+    process = subprocess.Popen([sys.executable, "-m", "src.mock_server", "--port", str(port), *server_args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while True:
+            with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                break
+            if time.time() > deadline or process.poll() is not None:
+                raise RuntimeError("Mock server did not start")
+            time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}/"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def drive(url, queries, concurrency):
+    from src.AgentProcessor import AgentProcessor
+    from src.load_engine import LoadEngine
+    from src.mock_server import create_mock_client
+
+    processor = AgentProcessor("benchmark", create_mock_client(url))
+    engine = LoadEngine(processor, concurrency, concurrency)
+    # The processor prints every activity; keep the terminal out of the measurement
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        async for _ in engine.run(queries):
+            pass
+        elapsed = time.perf_counter() - start
+    return processor.samples.to_frame(), elapsed
+
+
+def throughput(queries, levels):
+    rows = []
+    with mock_server("--plan-latency", "fixed:0", "--step-latency", "fixed:0", "--answer-latency", "fixed:0",
+                     "--steps", "fixed:2", "--response-chars", "fixed:600") as url:
+        for level in levels:
+            samples, elapsed = asyncio.run(drive(url, queries, level))
+            rows.append({
+                "Scenario": "throughput",
+                "Concurrency": level,
+                "Queries": len(samples),
+                "Seconds": round(elapsed, 3),
+                "Queries/sec": round(len(samples) / elapsed, 1),
+                "p50": round(samples["StreamEnd"].quantile(0.5), 4),
+                "p99": round(samples["StreamEnd"].quantile(0.99), 4),
+            })
+    return rows
+
+
+def timing_error(queries, levels, delay):
+    rows = []
+    with mock_server("--plan-latency", "fixed:0", "--steps", "fixed:0", "--answer-latency", f"fixed:{delay}",
+                     "--response-chars", "fixed:600") as url:
+        for level in levels:
+            samples, elapsed = asyncio.run(drive(url, queries, level))
+            error = samples["StreamEnd"].to_numpy() - delay
+            rows.append({
+                "Scenario": f"timing (+{delay}s)",
+                "Concurrency": level,
+                "Queries": len(samples),
+                "Seconds": round(elapsed, 3),
+                "Queries/sec": round(len(samples) / elapsed, 1),
+                "p50": round(float(np.percentile(error, 50)), 4),
+                "p99": round(float(np.percentile(error, 99)), 4),
+                "Max Error": round(float(error.max()), 4),
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the harness against the local mock server")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--levels", default="1,8,32,128", help="Comma-separated concurrency levels")
+    parser.add_argument("--delay", type=float, default=0.5, help="Fixed mock latency for the timing scenario")
+    parser.add_argument("--output", default=None, help="Optional CSV file for the results")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.levels.split(",")]
+    queries = [f"Benchmark query {i}" for i in range(args.queries)]
+    results = pd.DataFrame(throughput(queries, levels) + timing_error(queries, levels, args.delay))
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
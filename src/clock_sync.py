@@ -0,0 +1,141 @@
+# Client vs server time. Every activity carries the server's timestamp, so a
+# reply can be split into the part the agent spent on it and the part spent
+# getting it to the client:
+#
+#   ServerTime   first server stamp to the stamp of the first text message
+#                (both on the server clock, so no clock offset is involved)
+#   NetworkTime  the rest of the client-measured time to that message: the
+#                request, connection and streaming delivery (offset-free too)
+#   Upstream     send to the first server stamp, on the client clock
+#   Delivery     the message's server stamp to its arrival at the client
+#
+# Upstream and Delivery need the offset between the two clocks. ClockOffset
+# bounds it NTP-style from every reply: an activity is stamped after the
+# query was sent and before it arrives, so
+#
+#   stamp - received  <=  offset  <=  stamp - sent
+#
+# and the tightest bounds over recent replies (the fastest round trips) give
+# the estimate, their midpoint, to within half their width.
+import collections
+import datetime
+import statistics
+import time
+
+import pandas as pd
+
+from src.streaming_stats import LatencyHistogram
+
+
+def server_time(activity):
+    # The activity's server timestamp in epoch seconds, or None
+    stamp = getattr(activity, "timestamp", None)
+    if stamp is None:
+        return None
+    if isinstance(stamp, str):
+        try:
+            stamp = datetime.datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=datetime.timezone.utc)
+    return stamp.timestamp()
+
+
+class ClockOffset:
+    # Server clock minus client clock, in seconds
+    def __init__(self, keep=1000):
+        self.bounds = collections.deque(maxlen=keep)
+        self.lower = None
+        self.upper = None
+        self.offset = None
+
+    def add(self, sent, stamps):
+        # sent: client epoch seconds of the send; stamps: (server stamp, client epoch seconds received)
+        if not stamps:
+            return self.offset
+        self.bounds.append((max(stamp - received for stamp, received in stamps),
+                            min(stamp for stamp, _ in stamps) - sent))
+        self.lower = max(lower for lower, _ in self.bounds)
+        self.upper = min(upper for _, upper in self.bounds)
+        if self.consistent():
+            self.offset = (self.lower + self.upper) / 2
+        else:
+            # Crossed bounds: clock drift over the kept replies, or stamps taken
+            # before the request was read; fall back to the median reply midpoint
+            self.offset = statistics.median((lower + upper) / 2 for lower, upper in self.bounds)
+        return self.offset
+
+    def consistent(self):
+        return self.lower is not None and self.lower <= self.upper
+
+    def uncertainty(self):
+        # Half the width of the bounds; None while there are none or they cross
+        return (self.upper - self.lower) / 2 if self.consistent() else None
+
+
+class TimeSplit:
+    PARTS = {"ServerTime": "Server processing", "NetworkTime": "Network and transport",
+             "Upstream": "Upstream (send to first server stamp)", "Delivery": "Delivery (message stamp to arrival)"}
+
+    def __init__(self):
+        # perf_counter() + anchor is the client's wall clock
+        self.anchor = time.time() - time.perf_counter()
+        self.clock = ClockOffset()
+        self.histograms = {column: LatencyHistogram() for column in self.PARTS}
+        # Activity kind -> delivery delay of every activity of that kind
+        self.activities = {}
+
+    def add(self, sent, stamps, record=True):
+        # sent: perf_counter() of the send; stamps: (server stamp, perf_counter()
+        # received, kind) per activity, kind 'message' for text messages. Returns
+        # the row values, empty when the reply carried no server timestamps
+        if not stamps:
+            return {}
+        offset = self.clock.add(self.anchor + sent, [(stamp, self.anchor + received) for stamp, received, _ in stamps])
+        first = stamps[0]
+        message = next((entry for entry in stamps if entry[2] == "message"), stamps[-1])
+        delays = [(kind, self.anchor + received - (stamp - offset)) for stamp, received, kind in stamps]
+        row = {"ServerTime": message[0] - first[0], "NetworkTime": message[1] - sent - (message[0] - first[0]),
+               "Upstream": first[0] - offset - (self.anchor + sent),
+               "Delivery": self.anchor + message[1] - (message[0] - offset),
+               "DeliveryMax": max(delay for _, delay in delays), "ClockOffset": offset}
+        if record:
+            for column in self.PARTS:
+                self.histograms[column].record(max(row[column], 0.0))
+            for kind, delay in delays:
+                histogram = self.activities.get(kind)
+                if histogram is None:
+                    histogram = self.activities[kind] = LatencyHistogram()
+                histogram.record(max(delay, 0.0))
+        return {column: round(value, 4) for column, value in row.items()}
+
+    def frame(self):
+        # p50/p95/p99 and mean of every part, then the delivery delay per activity kind
+        network, server = self.histograms["NetworkTime"].sum, self.histograms["ServerTime"].sum
+        rows = []
+        for column, label in self.PARTS.items():
+            histogram = self.histograms[column]
+            share = histogram.sum / (network + server) * 100 if column in ("ServerTime", "NetworkTime") and network + server else None
+            rows.append([label, histogram.total] + self.describe(histogram) + [round(share, 1) if share is not None else None])
+        for kind, histogram in sorted(self.activities.items()):
+            rows.append([f"Delivery: {kind}", histogram.total] + self.describe(histogram) + [None])
+        return pd.DataFrame(rows, columns=["Part", "Samples", "p50", "p95", "p99", "Mean", "Share %"])
+
+    @staticmethod
+    def describe(histogram):
+        if not histogram.total:
+            return [None, None, None, None]
+        return [round(value, 4) for value in histogram.percentiles([50, 95, 99])] + [round(histogram.sum / histogram.total, 4)]
+
+    def summary(self):
+        if not self.histograms["ServerTime"].total:
+            return {}
+        summary = {}
+        for column in self.PARTS:
+            summary[f"{column} p50"], summary[f"{column} p95"] = self.histograms[column].percentiles([50, 95])
+        network, server = self.histograms["NetworkTime"].sum, self.histograms["ServerTime"].sum
+        summary["Network Share %"] = network / (network + server) * 100 if network + server else None
+        summary["Clock Offset"] = self.clock.offset
+        summary["Clock Offset +/-"] = self.clock.uncertainty()
+        return summary
@@ -0,0 +1,73 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+# Client creation shared by the Gradio UI and the headless worker processes.
+# Kept free of UI imports so workers can start without building the dashboard.
+import logging
+from os import environ
+
+from dotenv import load_dotenv
+from msal import PublicClientApplication
+
+from microsoft_agents.copilotstudio.client import (
+    ConnectionSettings,
+    CopilotClient,
+)
+
+from .local_token_cache import LocalTokenCache
+from .token_provider import TokenProvider
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+TOKEN_CACHE = LocalTokenCache("./.local_token_cache.json")
+TOKEN_PROVIDER = None
+
+
+def token_provider(app_client_id, tenant_id):
+    # One provider per process; every client it creates shares its refreshed tokens
+    global TOKEN_PROVIDER
+    if TOKEN_PROVIDER is None:
+        pca = PublicClientApplication(
+            client_id=app_client_id,
+            authority=f"https://login.microsoftonline.com/{tenant_id}",
+            token_cache=TOKEN_CACHE,
+        )
+        TOKEN_PROVIDER = TokenProvider(pca, TOKEN_CACHE)
+    return TOKEN_PROVIDER
+
+
+def acquire_token(settings: ConnectionSettings, app_client_id, tenant_id):
+    return token_provider(app_client_id, tenant_id).token()
+
+def create_client(agent_identifier=None, environment_id=None):
+    # COPILOTSTUDIOAGENT__MOCKURL points the harness at a local mock server (src/mock_server.py)
+    mock_url = environ.get("COPILOTSTUDIOAGENT__MOCKURL")
+    if mock_url:
+        from .mock_server import create_mock_client
+        return create_mock_client(mock_url)
+
+    settings = ConnectionSettings(
+        environment_id=environment_id or environ.get("COPILOTSTUDIOAGENT__ENVIRONMENTID"),
+        agent_identifier=agent_identifier or environ.get("COPILOTSTUDIOAGENT__SCHEMANAME"),
+        cloud=None,
+        copilot_agent_type=None,
+        custom_power_platform_cloud=None,
+    )
+    
+    provider = token_provider(
+        app_client_id=environ.get("COPILOTSTUDIOAGENT__AGENTAPPID"),
+        tenant_id=environ.get("COPILOTSTUDIOAGENT__TENANTID"),
+    )
+    copilot_client = CopilotClient(settings, None)
+    return provider.attach(copilot_client)
+
+
+def create_target_client(target):
+    # A/B targets: "<schema name>", "<environment id>/<schema name>" or the URL
+    # of a mock server; an empty target means the configured agent
+    target = (target or "").strip()
+    if target.startswith(("http://", "https://")):
+        from .mock_server import create_mock_client
+        return create_mock_client(target)
+    environment_id, _, agent_identifier = target.rpartition("/")
+    return create_client(agent_identifier or None, environment_id or None)
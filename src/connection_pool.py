@@ -0,0 +1,50 @@
+# Keep-alive HTTP connections shared by every virtual user of a run.
+#
+# CopilotClient opens a new aiohttp.ClientSession per request, and by default
+# every session brings its own connector, so each turn pays DNS, TCP and TLS
+# again. ConnectionPool installs one TCPConnector (not owned by the sessions)
+# in the client's client_session_settings for the length of a run, so
+# connections are reused across turns and users the way a production client
+# would. A trace config counts opened and reused connections either way.
+import aiohttp
+
+
+class ConnectionPool:
+    def __init__(self, connection, counts, keep_alive=True, keepalive_timeout=60):
+        self.settings = getattr(connection, "settings", None)
+        self.counts = counts
+        self.keep_alive = keep_alive
+        self.keepalive_timeout = keepalive_timeout
+        self.connector = None
+        self.previous = None
+
+    async def on_create(self, session, context, params):
+        self.counts["opened"] += 1
+
+    async def on_reuse(self, session, context, params):
+        self.counts["reused"] += 1
+
+    async def open(self):
+        # Replayed runs have no HTTP client, so there is nothing to pool
+        if self.settings is None:
+            return self
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self.on_create)
+        trace.on_connection_reuseconn.append(self.on_reuse)
+        self.previous = self.settings.client_session_settings
+        session_settings = dict(self.previous or {})
+        session_settings["trace_configs"] = list(session_settings.get("trace_configs", [])) + [trace]
+        if self.keep_alive and "connector" not in session_settings:
+            # The semaphore already caps requests in flight; the connector must not queue them again
+            self.connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=self.keepalive_timeout)
+            session_settings["connector"] = self.connector
+            session_settings["connector_owner"] = False
+        self.settings.client_session_settings = session_settings
+        return self
+
+    async def close(self):
+        if self.settings is not None and self.previous is not None:
+            self.settings.client_session_settings = self.previous
+        if self.connector is not None:
+            await self.connector.close()
+            self.connector = None
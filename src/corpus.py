@@ -0,0 +1,192 @@
+# Streaming query corpus. Files are read lazily, one record at a time, so a
+# production query log with millions of lines never has to fit in memory.
+#
+#   .txt            one query per line; an exit/quit line ends the corpus
+#   .csv            header row; the query is in a "query" or "text" column
+#   .jsonl/.ndjson  one JSON object per line with the same keys
+#
+# Any of them may be gzip'd (.gz). CSV and JSONL records can carry metadata:
+# id, category, weight (sampling weight, default 1) and expected_tool (the
+# tool the planner should pick; ToolMatch in the results says whether it did).
+#
+# Corpus iterates a file in one of three modes:
+#
+#   sequential  file order
+#   shuffle     seeded buffered shuffle: a window of buffer_size records is
+#               kept and a random one emitted as each new record is read
+#               (an exact shuffle when the file fits in the buffer)
+#   weighted    weighted sampling with replacement in one pass per
+#               buffer_size draws: every slot is an independent weighted
+#               reservoir of size one, so a query with weight 10 is drawn ten
+#               times as often as one with weight 1
+#
+# and repeats the file until `count` queries or `duration` seconds are
+# reached (one pass when neither is set).
+import csv
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+
+EXIT_LINES = ["exit", "quit", "EXIT"]
+MODES = ["sequential", "shuffle", "weighted"]
+
+
+class Query:
+    __slots__ = ("text", "id", "category", "weight", "expected_tool", "scenario")
+
+    def __init__(self, text, id=None, category=None, weight=1.0, expected_tool=None, scenario=None):
+        self.text = text
+        self.id = id
+        self.category = category
+        self.weight = weight
+        self.expected_tool = expected_tool
+        # Id of the scenario (src/scenario.py) this query is a turn of
+        self.scenario = scenario
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Query({self.text!r}, id={self.id!r}, category={self.category!r})"
+
+    def to_dict(self):
+        return {"query": self.text, "id": self.id, "category": self.category, "weight": self.weight,
+                "expected_tool": self.expected_tool}
+
+    @classmethod
+    def from_record(cls, record):
+        text = record.get("query") or record.get("text")
+        if not text:
+            return None
+        weight = record.get("weight")
+        return cls(str(text).strip(), record.get("id") or None, record.get("category") or None,
+                   float(weight) if weight not in (None, "") else 1.0, record.get("expected_tool") or None)
+
+
+def corpus_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "txt"
+
+
+def open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def read_corpus(path, format=None, exit_found=None):
+    # Generator of Query records; exit_found (a list) gets True appended when
+    # a text corpus ended at an exit/quit line
+    format = format or corpus_format(path)
+    with open_text(path) as f:
+        if format == "txt":
+            for line in f:
+                text = line.strip()
+                if text in EXIT_LINES:
+                    if exit_found is not None:
+                        exit_found.append(True)
+                    return
+                if text:
+                    yield Query(text)
+        elif format == "csv":
+            for record in csv.DictReader(f):
+                query = Query.from_record(record)
+                if query is not None:
+                    yield query
+        elif format == "jsonl":
+            for line in f:
+                if line.strip():
+                    query = Query.from_record(json.loads(line))
+                    if query is not None:
+                        yield query
+        else:
+            raise ValueError(f"Unknown corpus format '{format}'")
+
+
+class Corpus:
+    def __init__(self, path, mode="sequential", seed=None, count=None, duration=None, buffer_size=10000, format=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown sampling mode '{mode}', expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.format = format
+        self.count = int(count) if count else None
+        self.duration = float(duration) if duration else None
+        self.buffer_size = max(1, int(buffer_size))
+        self.rng = np.random.default_rng(seed)
+        self.exit_found = []
+
+    def records(self):
+        return read_corpus(self.path, self.format, self.exit_found)
+
+    def shuffled(self):
+        buffer = []
+        for query in self.records():
+            if len(buffer) < self.buffer_size:
+                buffer.append(query)
+                continue
+            index = int(self.rng.integers(len(buffer)))
+            yield buffer[index]
+            buffer[index] = query
+        self.rng.shuffle(buffer)
+        yield from buffer
+
+    def weighted(self, draws):
+        # One pass over the file fills `draws` slots; each record takes over
+        # Binomial(draws, w / W_so_far) slots chosen at random
+        slots = [None] * draws
+        total = 0.0
+        for query in self.records():
+            if query.weight <= 0:
+                continue
+            total += query.weight
+            taken = self.rng.binomial(draws, query.weight / total)
+            if taken:
+                for slot in self.rng.choice(draws, taken, replace=False):
+                    slots[slot] = query
+        return [query for query in slots if query is not None]
+
+    def weighted_pass(self, draws):
+        # Drawn in batches of at most buffer_size, so a large corpus never holds a slot per line
+        while draws > 0:
+            batch = self.weighted(min(self.buffer_size, draws))
+            if not batch:
+                return
+            yield from batch
+            draws -= len(batch)
+
+    def passes(self, remaining):
+        if self.mode == "weighted":
+            if remaining is None and self.duration is None:
+                # A single pass: as many draws as the corpus has queries, like the other modes
+                return self.weighted_pass(sum(1 for query in self.records() if query.weight > 0))
+            return self.weighted(min(self.buffer_size, remaining) if remaining is not None else self.buffer_size)
+        if self.mode == "shuffle":
+            return self.shuffled()
+        return self.records()
+
+    def __iter__(self):
+        repeat = self.count is not None or self.duration is not None
+        deadline = time.monotonic() + self.duration if self.duration else None
+        produced = 0
+        while True:
+            empty = True
+            for query in self.passes(self.count - produced if self.count is not None else None):
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                yield query
+                empty = False
+                produced += 1
+                if self.count is not None and produced >= self.count:
+                    return
+            if empty or not repeat:
+                return
+
@@ -0,0 +1,257 @@
+# Coordinator/worker mode: split one query corpus over several worker
+# processes, on this host or on several hosts sharing a run directory.
+#
+#   python -m src.distributed coordinator --run-dir ./data/runs/nightly --workers 4 --users 40
+#   python -m src.distributed worker --run-dir ./data/runs/nightly --index 2
+#
+# The coordinator writes the corpus and a manifest with a common wall-clock
+# start time, then either spawns the workers locally or (with --remote) waits
+# for workers started elsewhere. Every worker waits for the start time, runs
+# its slice of the corpus and writes a gzip'd CSV shard per results table.
+# The coordinator merges the shards back into the resultsdf/resultsaidf schema.
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from src.corpus import Corpus, Query, read_corpus
+from src.failures import error_rate, successes
+from src.run_store import RunStore, new_run_id
+from src.streaming_stats import StreamingStats
+
+MANIFEST = "manifest.json"
+QUERIES = "queries.jsonl"
+
+
+def write_json_atomic(path, data):
+    # Shared directories (SMB/NFS) must never expose a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def load_manifest(run_dir):
+    with open(os.path.join(run_dir, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_run(run_dir, queries, workers, users, concurrency, rate=None, arrival="constant", start_delay=15.0, warmup=0,
+               seed=None):
+    os.makedirs(run_dir, exist_ok=True)
+    # Streamed to disk with their metadata; queries may be strings or corpus records
+    count = 0
+    with open(os.path.join(run_dir, QUERIES), "w", encoding="utf-8") as f:
+        for query in queries:
+            record = query if isinstance(query, Query) else Query(query)
+            f.write(json.dumps(record.to_dict()) + "\n")
+            count += 1
+    manifest = {
+        "workers": workers,
+        "users": users,
+        "concurrency": concurrency,
+        "rate": rate,
+        "arrival": arrival,
+        "warmup": warmup,
+        "seed": seed,
+        "queries": count,
+        "created_at": time.time(),
+        # Every worker starts measuring at this wall-clock time, so the Offset
+        # column of all shards shares one timeline
+        "start_at": time.time() + start_delay,
+    }
+    write_json_atomic(os.path.join(run_dir, MANIFEST), manifest)
+    return manifest
+
+
+def worker_share(total, workers, index):
+    # Spread a total (users, concurrency) as evenly as possible, at least 1 each
+    return max(1, total // workers + (1 if index < total % workers else 0))
+
+
+def shard_paths(run_dir, index):
+    return (
+        os.path.join(run_dir, f"worker-{index}.samples.csv.gz"),
+        os.path.join(run_dir, f"worker-{index}.planner.csv.gz"),
+        os.path.join(run_dir, f"worker-{index}.done.json"),
+    )
+
+
+async def run_worker(run_dir, index):
+    from src.AgentProcessor import AgentProcessor
+    from src.connection import create_client
+    from src.load_engine import LoadEngine
+
+    manifest = load_manifest(run_dir)
+    workers = manifest["workers"]
+    if not 0 <= index < workers:
+        raise ValueError(f"Worker index {index} outside 0..{workers - 1}")
+    # Every workers-th record, read lazily
+    queries = itertools.islice(read_corpus(os.path.join(run_dir, QUERIES)), index, None, workers)
+    share = len(range(index, manifest["queries"], workers))
+
+    processor = AgentProcessor(f"worker-{index}", create_client())
+    engine = LoadEngine(processor,
+                        worker_share(manifest["users"], workers, index),
+                        worker_share(manifest["concurrency"], workers, index),
+                        manifest.get("warmup", 0))
+    rate = manifest["rate"] / workers if manifest["rate"] else None
+    # One arrival stream per worker: the same seed everywhere would line their arrivals up
+    seed = manifest["seed"] + index if manifest.get("seed") is not None else None
+
+    wait = manifest["start_at"] - time.time()
+    if wait > 0:
+        print(f"Worker {index}: {share} queries, starting in {wait:.1f}s")
+        await asyncio.sleep(wait)
+    else:
+        print(f"Worker {index}: started {-wait:.1f}s after the shared start time")
+    processor.reset_results()
+    # A late worker keeps the shared timeline by shifting its run clock back
+    processor.run_started -= max(0.0, -wait)
+    async for _ in engine.run(queries, rate, manifest["arrival"], seed):
+        pass
+
+    samples_path, planner_path, done_path = shard_paths(run_dir, index)
+    processor.samples.to_frame().assign(Worker=index).to_csv(samples_path, index=False, compression="gzip")
+    processor.planner.to_frame().assign(Worker=index).to_csv(planner_path, index=False, compression="gzip")
+    write_json_atomic(done_path, {
+        "worker": index,
+        "samples": len(processor.samples),
+        "planner": len(processor.planner),
+        "finished_at": time.time(),
+    })
+    print(f"Worker {index}: wrote {len(processor.samples)} samples")
+
+
+def merge_shards(run_dir):
+    def concat(pattern):
+        frames = [pd.read_csv(path) for path in sorted(glob.glob(os.path.join(run_dir, pattern)))]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    resultsdf = concat("worker-*.samples.csv.gz")
+    resultsaidf = concat("worker-*.planner.csv.gz")
+    if not resultsdf.empty:
+        resultsdf = resultsdf.sort_values("Offset", kind="stable").reset_index(drop=True)
+        resultsdf["Serial"] = range(1, len(resultsdf) + 1)
+    if not resultsaidf.empty:
+        resultsaidf["Serial"] = range(1, len(resultsaidf) + 1)
+    return resultsdf, resultsaidf
+
+
+def summary_stats(resultsdf):
+    if "Warmup" in resultsdf:
+        resultsdf = resultsdf[~resultsdf["Warmup"].astype(bool)]
+    rate = error_rate(resultsdf)
+    resultsdf = successes(resultsdf)
+    stats = StreamingStats()
+    for value, length in zip(resultsdf["Time"], resultsdf["Char-Len"]):
+        stats.add(float(value), float(length))
+    # Same metric names as AgentProcessor.summary(), so stored runs compare alike;
+    # with no successful query there is nothing to summarize and they stay None
+    def rounded(value, digits):
+        return round(value, digits) if stats.count and value is not None else None
+
+    summary = {
+        "Samples": stats.count,
+        "Mean": rounded(stats.mean, 2),
+        "Max": rounded(stats.max, 2),
+        "Min": rounded(stats.min, 2),
+        "Deviation": rounded(stats.std, 2),
+        "Token Corr": rounded(stats.correlation, 4),
+        "Error Rate": rate,
+    }
+    for q, value in zip([50, 90, 95, 99, 99.9], stats.histogram.percentiles([50, 90, 95, 99, 99.9])):
+        summary[f"Time p{q}"] = rounded(value, 2)
+    return summary
+
+
+def wait_for_workers(run_dir, workers, timeout):
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        done = [i for i in range(workers) if os.path.exists(shard_paths(run_dir, i)[2])]
+        if len(done) == workers:
+            return
+        if deadline and time.time() > deadline:
+            raise TimeoutError(f"Only {len(done)} of {workers} workers finished")
+        time.sleep(1)
+
+
+def coordinate(args):
+    queries = Corpus(args.input, args.sampling, args.seed, args.count)
+    if not args.remote:
+        # Log in once here so the worker processes find a token in the shared cache
+        from src.connection import create_client
+        create_client()
+    manifest = create_run(args.run_dir, queries, args.workers, args.users, args.concurrency,
+                          args.rate, args.arrival, args.start_delay, args.warmup, args.seed)
+    print(f"Run {args.run_dir}: {manifest['queries']} queries over {args.workers} workers, "
+          f"start at {time.strftime('%H:%M:%S', time.localtime(manifest['start_at']))}")
+    if args.remote:
+        wait_for_workers(args.run_dir, args.workers, args.timeout)
+    else:
+        processes = [
+            subprocess.Popen([sys.executable, "-m", "src.distributed", "worker",
+                              "--run-dir", args.run_dir, "--index", str(i)])
+            for i in range(args.workers)
+        ]
+        failed = [i for i, process in enumerate(processes) if process.wait() != 0]
+        if failed:
+            print(f"Workers {failed} failed; merging the shards that exist")
+
+    resultsdf, resultsaidf = merge_shards(args.run_dir)
+    resultsdf.to_csv(os.path.join(args.run_dir, "merged.samples.csv"), index=False)
+    resultsaidf.to_csv(os.path.join(args.run_dir, "merged.planner.csv"), index=False)
+    if not resultsdf.empty:
+        stats = summary_stats(resultsdf)
+        for key, value in stats.items():
+            print(f"{key}: {value}")
+        run_id = RunStore().save_run(new_run_id(), args.agent, args.tag, manifest["start_at"], resultsdf, resultsaidf, stats,
+                                     {"workers": args.workers, "users": args.users, "concurrency": args.concurrency,
+                                      "rate": args.rate, "arrival": args.arrival, "warmup": args.warmup,
+                                      "input": args.input, "sampling": args.sampling, "count": args.count,
+                                      "seed": args.seed, "run_dir": args.run_dir})
+        print(f"Run {run_id} saved to the run store.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed Copilot Studio load test")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    coordinator = sub.add_parser("coordinator")
+    coordinator.add_argument("--run-dir", required=True)
+    coordinator.add_argument("--input", default="./data/input.txt", help="Query corpus: .txt, .csv or .jsonl, optionally .gz")
+    coordinator.add_argument("--sampling", choices=["sequential", "shuffle", "weighted"], default="sequential")
+    coordinator.add_argument("--count", type=int, default=None, help="Repeat/sample the corpus to this many queries")
+    coordinator.add_argument("--seed", type=int, default=None)
+    coordinator.add_argument("--workers", type=int, default=2)
+    coordinator.add_argument("--users", type=int, default=1)
+    coordinator.add_argument("--concurrency", type=int, default=1)
+    coordinator.add_argument("--rate", type=float, default=None, help="Total open-loop rate (req/s) over all workers")
+    coordinator.add_argument("--arrival", choices=["constant", "poisson"], default="constant")
+    coordinator.add_argument("--start-delay", type=float, default=15.0)
+    coordinator.add_argument("--warmup", type=int, default=0, help="Warm-up turns per virtual user, excluded from the statistics")
+    coordinator.add_argument("--remote", action="store_true", help="Do not spawn workers, wait for workers on other hosts")
+    coordinator.add_argument("--timeout", type=float, default=None)
+    coordinator.add_argument("--agent", default=os.environ.get("COPILOTSTUDIOAGENT__SCHEMANAME"))
+    coordinator.add_argument("--tag", default="", help="Commit/config tag stored with the run")
+
+    worker = sub.add_parser("worker")
+    worker.add_argument("--run-dir", required=True)
+    worker.add_argument("--index", type=int, required=True)
+
+    args = parser.parse_args(argv)
+    if args.role == "worker":
+        asyncio.run(run_worker(args.run_dir, args.index))
+    else:
+        coordinate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Per-query failure classification and retry policy.
+#
+# Every query ends with one Status:
+#
+#   ok            at least one message with text arrived
+#   no_message    the reply stream ended without any message text
+#   timeout       the query took longer than the per-query timeout
+#   throttled     HTTP 429
+#   server_error  HTTP 5xx
+#   auth          no token could be acquired, or HTTP 401/403
+#   connection    the connection failed or dropped
+#   error         anything else
+#
+# CopilotClient raises aiohttp.ClientError("Error sending request: <status>")
+# without the response, so the HTTP status is read from the message when the
+# exception has no status attribute.
+import asyncio
+import random
+import re
+
+import aiohttp
+
+STATUSES = ["ok", "no_message", "timeout", "throttled", "server_error", "auth", "connection", "error"]
+RETRYABLE = ("timeout", "throttled", "server_error", "connection")
+
+
+def http_status(error):
+    status = getattr(error, "status", None)
+    if status:
+        return int(status)
+    match = re.search(r"\b([45]\d\d)\b", str(error))
+    return int(match.group(1)) if match else None
+
+
+def classify(error):
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, aiohttp.ServerTimeoutError)):
+        return "timeout"
+    status = http_status(error)
+    if status == 429:
+        return "throttled"
+    if status in (401, 403):
+        return "auth"
+    if status is not None and status >= 500:
+        return "server_error"
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return "connection"
+    return "error"
+
+
+class RetryPolicy:
+    # Exponential backoff with full jitter: attempt n waits a uniform random
+    # time in [0, min(max_backoff, backoff * 2**n)], so throttled users do not
+    # come back in lockstep
+    def __init__(self, retries=0, backoff=1.0, max_backoff=30.0, retry_on=RETRYABLE, seed=None):
+        self.retries = max(0, int(retries or 0))
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.retry_on = tuple(retry_on)
+        self.random = random.Random(seed)
+
+    def should_retry(self, status, attempt):
+        return status in self.retry_on and attempt < self.retries
+
+    def delay(self, attempt):
+        return self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def successes(frame):
+    # Result rows of successful queries; tables from before the Status column are all successes
+    if "Status" not in frame:
+        return frame
+    return frame[frame["Status"].fillna("ok") == "ok"]
+
+
+def error_rate(frame):
+    if "Status" not in frame or frame.empty:
+        return 0.0
+    return float((frame["Status"].fillna("ok") != "ok").mean())
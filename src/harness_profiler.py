@@ -0,0 +1,167 @@
+# Harness self-instrumentation. Everything the harness does between two
+# reads of a reply stream (printing, building planner rows, appending results,
+# refreshing the UI) delays the next read and so ends up in the measured Time.
+# HarnessProfiler times those sections separately, and EventLoopMonitor
+# samples how late the event loop runs timers, so every sample can report:
+#
+#   Overhead  seconds of harness work inside the query's own measured window
+#   LoopLag   the worst event-loop lag seen while the query was in flight
+#   Stalled   LoopLag above the stall threshold: the sample's latency is
+#             suspect, the harness (not the agent) may have delayed it
+#
+# RunProfiler optionally wraps a whole run in cProfile or, when installed,
+# pyinstrument.
+import asyncio
+import collections
+import contextlib
+import os
+import time
+
+import pandas as pd
+
+from src.streaming_stats import LatencyHistogram
+
+PROFILERS = ["off", "cprofile", "pyinstrument"]
+
+
+class EventLoopMonitor:
+    # Sleeps `interval` seconds in a loop; anything beyond that is time the
+    # loop was busy with other callbacks, i.e. how late every timer fires.
+    # The recent checks are kept as (time, lag) for per-query lookups.
+    def __init__(self, interval=0.05, keep=20000):
+        self.interval = interval
+        self.recent = collections.deque(maxlen=keep)
+        self.task = None
+        self.reset()
+
+    def reset(self):
+        self.histogram = LatencyHistogram()
+        self.last = 0.0
+        self.recent.clear()
+
+    async def watch(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.last = max(now - started - self.interval, 0.0)
+            self.histogram.record(max(self.last, 1e-4))
+            self.recent.append((now, self.last))
+
+    def start(self):
+        # Idempotent; needs a running event loop
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.watch())
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def max_lag(self, since, until=None):
+        # Worst lag of the checks that woke up between since and until (or now);
+        # the check after `until` is included, it covers the end of the window
+        worst = 0.0
+        for woke, lag in reversed(self.recent):
+            if until is not None and woke - lag - self.interval > until:
+                continue
+            if woke < since:
+                break
+            worst = max(worst, lag)
+        return worst
+
+
+class HarnessProfiler:
+    def __init__(self, stall_threshold=0.05):
+        self.stall_threshold = stall_threshold
+        self.sections = {}
+        self.overhead = LatencyHistogram(lowest=1e-6, highest=60.0)
+        self.stalled = 0
+
+    def add(self, name, seconds):
+        entry = self.sections.get(name)
+        if entry is None:
+            entry = self.sections[name] = LatencyHistogram(lowest=1e-6, highest=60.0)
+        entry.record(max(seconds, 1e-6))
+
+    @contextlib.contextmanager
+    def section(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add_query(self, overhead, stalled):
+        self.overhead.record(max(overhead, 1e-6))
+        self.stalled += bool(stalled)
+
+    def frame(self, monitor=None):
+        # Calls, total and per-call milliseconds per section, then the per-query overhead and loop lag
+        rows = []
+        queries = self.overhead.total
+        for name, histogram in sorted(self.sections.items(), key=lambda item: -item[1].sum):
+            p50, p95 = histogram.percentiles([50, 95])
+            rows.append([name, histogram.total, round(histogram.sum, 4), round(histogram.sum / histogram.total * 1000, 4),
+                         round(p50 * 1000, 4), round(p95 * 1000, 4), round(histogram.max * 1000, 4),
+                         round(histogram.sum / queries * 1000, 4) if queries else None])
+        if queries:
+            p50, p95 = self.overhead.percentiles([50, 95])
+            rows.append(["overhead per query", queries, round(self.overhead.sum, 4),
+                         round(self.overhead.sum / queries * 1000, 4), round(p50 * 1000, 4), round(p95 * 1000, 4),
+                         round(self.overhead.max * 1000, 4), round(self.overhead.sum / queries * 1000, 4)])
+        if monitor is not None and monitor.histogram.total:
+            lag = monitor.histogram
+            p50, p95 = lag.percentiles([50, 95])
+            rows.append(["event loop lag", lag.total, round(lag.sum, 4), round(lag.sum / lag.total * 1000, 4),
+                         round(p50 * 1000, 4), round(p95 * 1000, 4), round(lag.max * 1000, 4), None])
+        return pd.DataFrame(rows, columns=["Section", "Calls", "Total (s)", "Mean (ms)", "p50 (ms)", "p95 (ms)",
+                                           "Max (ms)", "Per Query (ms)"])
+
+
+class RunProfiler:
+    # Whole-run capture: cProfile writes a .prof (open with snakeviz or pstats),
+    # pyinstrument an .html call tree. Both profile the event loop thread.
+    def __init__(self, kind="off", directory="./data/profiles"):
+        self.kind = kind if kind in PROFILERS else "off"
+        self.directory = directory
+        self.path = None
+        self.profiler = None
+
+    def start(self):
+        if self.kind == "off":
+            return self
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+        if self.kind == "cprofile":
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.path = os.path.join(self.directory, f"{stamp}.prof")
+            self.profiler.enable()
+        else:
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise RuntimeError("pyinstrument is not installed: pip install pyinstrument, or use cprofile")
+            self.profiler = Profiler(async_mode="disabled")
+            self.path = os.path.join(self.directory, f"{stamp}.html")
+            self.profiler.start()
+        return self
+
+    def stop(self):
+        # Returns the path of the written profile, or None
+        if self.profiler is None:
+            return None
+        if self.kind == "cprofile":
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path)
+        else:
+            self.profiler.stop()
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+        self.profiler = None
+        print(f"Profile written to {self.path}")
+        return self.path
@@ -0,0 +1,162 @@
+# What drives latency. One row per successful measured query, with the
+# query's time to first message as the response and these features:
+#
+#   Char-Len   response length, per 1,000 characters
+#   Steps      plan steps run (paired Triggered/Finished spans)
+#   tool: X    1 when the query called tool X (tools seen in min_tool_queries
+#              queries or more)
+#   Turn       depth in the conversation
+#   InFlight   queries in flight when it was sent (the concurrency it saw)
+#
+# A Huber M-estimator (iteratively reweighted least squares) fits Time as a
+# linear function of them, so a handful of pathological queries cannot drag
+# the coefficients. Each coefficient is that driver's marginal cost in
+# seconds, with a normal-approximation confidence interval from Huber's
+# asymptotic covariance. Queries whose standardized residual exceeds
+# outlier_threshold are the ones the drivers do not explain.
+#
+# A soak run spills far more rows than need fitting; sample_rows() keeps a
+# uniform sample of them while reading the chunks, so the fit's memory does
+# not grow with the run.
+import statistics
+
+import numpy as np
+import pandas as pd
+
+UNITS = {"Intercept": "per query", "Char-Len": "per 1,000 chars", "Steps": "per plan step", "Turn": "per turn",
+         "InFlight": "per query in flight"}
+
+
+def sample_rows(frames, size, rng):
+    # Uniform sample of at most `size` rows of a sequence of DataFrames, with
+    # one frame in memory at a time: every row gets a random key and the rows
+    # with the `size` smallest keys are kept (bottom-k reservoir sampling)
+    kept = None
+    for frame in frames:
+        frame = frame.assign(_key=rng.random(len(frame)))
+        kept = frame if kept is None else pd.concat([kept, frame], ignore_index=True)
+        if len(kept) > size:
+            # Back in reading order, which the next concat keeps
+            kept = kept.nsmallest(size, "_key").sort_index()
+    if kept is None:
+        return pd.DataFrame()
+    return kept.drop(columns="_key").reset_index(drop=True)
+
+
+class LatencyModel:
+    def __init__(self, min_tool_queries=5, k=1.345, outlier_threshold=3.0, confidence=0.95, max_iterations=50):
+        self.min_tool_queries = min_tool_queries
+        self.k = k
+        self.outlier_threshold = outlier_threshold
+        self.confidence = confidence
+        self.max_iterations = max_iterations
+        self.names = []
+        self.coefficients = None
+
+    def features(self, samples, spans):
+        # samples: results rows (Serial, Query, Time, Char-Len, Turn, InFlight,
+        # Status, Warmup); spans: tool spans (Sample, Tool). Returns the kept rows
+        # and the feature matrix, intercept first
+        rows = samples[samples["Time"].notna() & ~samples["Warmup"].astype(bool)]
+        if "Status" in rows:
+            rows = rows[rows["Status"].isna() | (rows["Status"] == "ok")]
+        rows = rows.reset_index(drop=True)
+        serials = rows["Serial"].to_numpy()
+        spans = spans[spans["Sample"].isin(serials)]
+        steps = spans.groupby("Sample").size()
+        columns = {"Intercept": np.ones(len(rows)),
+                   "Char-Len": rows["Char-Len"].to_numpy(dtype=float) / 1000,
+                   "Steps": steps.reindex(serials, fill_value=0).to_numpy(dtype=float)}
+        called = spans.drop_duplicates(["Sample", "Tool"])
+        for tool, count in called["Tool"].value_counts().items():
+            if count >= self.min_tool_queries:
+                columns[f"tool: {tool}"] = np.isin(serials, called.loc[called["Tool"] == tool, "Sample"]).astype(float)
+        columns["Turn"] = rows["Turn"].to_numpy(dtype=float)
+        columns["InFlight"] = rows["InFlight"].fillna(0).to_numpy(dtype=float) if "InFlight" in rows else np.zeros(len(rows))
+        # A feature that never varies (one user, no tools) cannot be told from the intercept
+        names = [name for name, values in columns.items() if name == "Intercept" or (len(values) and np.ptp(values) > 0)]
+        return rows, names, np.column_stack([columns[name] for name in names])
+
+    def fit(self, samples, spans):
+        # Returns self; coefficients stay None when there are too few rows to fit,
+        # e.g. when no measured query succeeded
+        self.coefficients = None
+        if samples.empty:
+            self.rows, self.names = samples, []
+            return self
+        rows, names, X = self.features(samples, spans)
+        self.rows, self.names = rows, names
+        n, p = X.shape
+        if n < p + 5:
+            return self
+        y = rows["Time"].to_numpy(dtype=float)
+        weights = np.ones(n)
+        beta = np.zeros(p)
+        for _ in range(self.max_iterations):
+            root = np.sqrt(weights)
+            updated = np.linalg.lstsq(X * root[:, None], y * root, rcond=None)[0]
+            residuals = y - X @ updated
+            # MAD scale, kept away from zero so identical latencies do not divide by it
+            scale = max(np.median(np.abs(residuals - np.median(residuals))) / 0.6745, 1e-6)
+            z = np.abs(residuals) / scale
+            weights = np.where(z <= self.k, 1.0, self.k / np.maximum(z, 1e-12))
+            converged = np.allclose(updated, beta, rtol=1e-6, atol=1e-8)
+            beta = updated
+            if converged:
+                break
+        # Huber's asymptotic covariance: scale^2 * E[psi^2] / E[psi']^2 * (X'X)^-1
+        u = residuals / scale
+        psi = np.clip(u, -self.k, self.k)
+        slope = max(np.mean(np.abs(u) <= self.k), 1.0 / n)
+        covariance = scale ** 2 * (np.sum(psi ** 2) / (n - p)) / slope ** 2 * np.linalg.pinv(X.T @ X)
+        self.coefficients = beta
+        self.stderr = np.sqrt(np.maximum(np.diag(covariance), 0.0))
+        self.scale = scale
+        self.residuals = residuals
+        self.weights = weights
+        self.predicted = X @ beta
+        self.X = X
+        self.y = y
+        return self
+
+    def drivers(self):
+        # One row per driver: marginal cost with its confidence interval, and
+        # the average seconds it adds per query (cost x mean value) as a share of the mean time
+        columns = ["Driver", "Unit", "Cost (s)", "CI Low", "CI High", "Mean Value", "Avg Contribution (s)", "Share %"]
+        if self.coefficients is None:
+            return pd.DataFrame([], columns=columns)
+        z = statistics.NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        mean_time = self.y.mean()
+        rows = []
+        for index, name in enumerate(self.names):
+            cost, error = self.coefficients[index], self.stderr[index]
+            mean_value = self.X[:, index].mean()
+            contribution = cost * mean_value
+            rows.append([name, UNITS.get(name, "when called"), round(cost, 4), round(cost - z * error, 4),
+                         round(cost + z * error, 4), round(mean_value, 3), round(contribution, 4),
+                         round(contribution / mean_time * 100, 1) if mean_time else None])
+        frame = pd.DataFrame(rows, columns=columns)
+        # Biggest average win first; the intercept (what no driver explains) last
+        return pd.concat([frame[frame["Driver"] != "Intercept"].sort_values("Avg Contribution (s)", ascending=False),
+                          frame[frame["Driver"] == "Intercept"]], ignore_index=True)
+
+    def outliers(self, top=20):
+        # Queries the drivers leave unexplained, by standardized residual; top=None lists all
+        columns = ["Serial", "Query", "Time", "Predicted", "Residual", "Std Residual"]
+        if self.coefficients is None:
+            return pd.DataFrame([], columns=columns)
+        standardized = self.residuals / self.scale
+        picked = np.flatnonzero(np.abs(standardized) > self.outlier_threshold)
+        picked = picked[np.argsort(-np.abs(standardized[picked]))][:top]
+        return pd.DataFrame({"Serial": self.rows["Serial"].to_numpy()[picked], "Query": self.rows["Query"].to_numpy()[picked],
+                             "Time": self.y[picked], "Predicted": np.round(self.predicted[picked], 3),
+                             "Residual": np.round(self.residuals[picked], 3),
+                             "Std Residual": np.round(standardized[picked], 2)}, columns=columns)
+
+    def explained(self):
+        # Share of the variance of Time the fit explains, with outliers down-weighted
+        if self.coefficients is None:
+            return None
+        mean = np.average(self.y, weights=self.weights)
+        total = np.sum(self.weights * (self.y - mean) ** 2)
+        return float(1 - np.sum(self.weights * self.residuals ** 2) / total) if total else None
@@ -0,0 +1,318 @@
+import asyncio
+import contextlib
+import itertools
+import time
+
+from src.connection_pool import ConnectionPool
+from src.failures import classify
+from src.scenario import Scenario
+from src.scheduler import ArrivalScheduler
+
+
+class Conversation:
+    # One virtual user's conversation on every target, by target label; None
+    # until it has been started. failures holds the last failed start per
+    # target as (status, error, retries)
+    __slots__ = ("user", "ids", "failures")
+
+    def __init__(self, user, labels):
+        self.user = user
+        self.ids = dict.fromkeys(labels)
+        self.failures = {}
+
+
+class LoadEngine:
+    # Runs a query corpus with N virtual users. Each virtual user owns its own
+    # conversation; a semaphore caps how many ask_question calls are in flight
+    # at once.
+    #
+    # Closed loop (rate=None): every user sends its next query as soon as the
+    # previous reply arrives.
+    # Open loop (rate set): queries are sent on an ArrivalScheduler schedule,
+    # whatever the agent's current latency, each in an idle conversation; when
+    # all are busy a new one is started, so no conversation ever has two turns
+    # in flight. Latency is then measured from the scheduled send time. At most
+    # max_conversations are started (default twice users or concurrency,
+    # whichever is larger); past that an arrival waits for a conversation to
+    # come free, and the wait counts as its SendLag.
+    #
+    # With warmup=N every user first sends N turns (tagged as warm-up and left
+    # out of the headline statistics) before the measured phase starts, so the
+    # measured turns see warm connections and conversations. keep_alive shares
+    # one pooled connector across all users (see ConnectionPool).
+    #
+    # A conversation that cannot be started (its retries used up) does not end
+    # the run: every query its user could not send becomes a failed row with
+    # the start's Status, and the next one tries to start it again.
+    #
+    # The corpus may hold Scenarios (src/scenario.py) instead of queries: a
+    # virtual user then plays each scenario's turns in order, with think time
+    # in between, in a new conversation or its current one. In open loop the
+    # schedule sets when scenarios (sessions) start, each in its own conversation.
+    #
+    # processor may also be {label: AgentProcessor} for several targets: every
+    # virtual user then keeps one conversation per target and every query is
+    # sent to all of them at the same moment, each target with its own results
+    # and its own in-flight cap, so a slow target cannot take slots from a fast one.
+    # With alternate the targets are asked one after the other instead, taking
+    # turns at going first (A B, B A, ...), so drift hits every side equally.
+    def __init__(self, processor, users=1, concurrency=1, warmup=0, keep_alive=True, alternate=False,
+                 max_conversations=None):
+        if isinstance(processor, dict):
+            if not processor:
+                raise ValueError("At least one target is needed")
+            self.processors = dict(processor)
+            for label, target in self.processors.items():
+                target.target = label
+        else:
+            self.processors = {processor.target: processor}
+        self.processor = next(iter(self.processors.values()))
+        self.labels = list(self.processors)
+        self.users = max(1, int(users or 1))
+        self.concurrency = max(1, int(concurrency or 1))
+        self.warmup = max(0, int(warmup or 0))
+        self.keep_alive = keep_alive
+        self.alternate = alternate
+        self.max_conversations = max_conversations
+        self.pairs = 0
+        # Conversation per virtual user, kept across runs of the engine
+        self.conversations = []
+        self.conversation_ids = []
+        self.semaphores = {}
+        self.deadline = None
+        self.pools = None
+        self.sent = 0
+
+    async def start_conversation(self, label, conversation):
+        # Retried under the processor's retry policy, like the queries themselves.
+        # Returns None once the retries are used up: the user tries again at its
+        # next query instead of ending the run
+        processor = self.processors[label]
+        user = conversation.user
+        policy = processor.retry_policy
+        attempt = 0
+        while True:
+            conversation_id = None
+            started = time.perf_counter()
+            try:
+                async for action in processor.connection.start_conversation(True):
+                    if action.conversation is not None and action.conversation.id:
+                        conversation_id = action.conversation.id
+                    if action.text:
+                        print(f" [user {user}] {action.text}")
+                break
+            except Exception as e:
+                status = classify(e)
+                if not policy.should_retry(status, attempt):
+                    print(f"Virtual user {user} could not start a conversation: {e}")
+                    conversation.failures[label] = (status, str(e) or type(e).__name__, attempt)
+                    return None
+                delay = policy.delay(attempt)
+                print(f"Virtual user {user} failed to start a conversation: {e}. Retry {attempt + 1} in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+        processor.record_conversation_start(time.perf_counter() - started)
+        print(f"Virtual user {user} started conversation {conversation_id}" + (f" on {label}" if len(self.labels) > 1 else ""))
+        self.conversation_ids.append(conversation_id)
+        return conversation_id
+
+    async def start_user(self, conversation):
+        # Starts the user's conversation on every target that has none yet
+        missing = [label for label, conversation_id in conversation.ids.items() if conversation_id is None]
+        started = await asyncio.gather(*[self.start_conversation(label, conversation) for label in missing])
+        conversation.ids.update(zip(missing, started))
+        return conversation
+
+    async def send_to(self, label, query, conversation, scheduled_at=None, warmup=False):
+        processor = self.processors[label]
+        if conversation.ids[label] is None:
+            started = scheduled_at or time.perf_counter()
+            conversation.ids[label] = await self.start_conversation(label, conversation)
+            if conversation.ids[label] is None:
+                # The query is never sent; its row carries the failed start's Status
+                status, error, retries = conversation.failures.pop(label)
+                processor.record_start_failure(query, conversation.user, status, error, retries, started, warmup)
+                return status
+        async with self.semaphores[label]:
+            return await processor.process_query(query, conversation.ids[label], conversation.user, scheduled_at, warmup)
+
+    async def fan_out(self, query, conversation, scheduled_at=None, warmup=False):
+        # Sends one query to every target; returns the Status per target
+        if not self.alternate:
+            statuses = await asyncio.gather(*[self.send_to(label, query, conversation, scheduled_at, warmup)
+                                              for label in self.labels])
+            return dict(zip(self.labels, statuses))
+        # Alternate the order per query and per user, so neither side is always second
+        order = self.labels if (self.pairs + conversation.user) % 2 == 0 else self.labels[::-1]
+        self.pairs += 1
+        return {label: await self.send_to(label, query, conversation, scheduled_at, warmup) for label in order}
+
+    async def send(self, query, conversation, completed, scheduled_at=None):
+        self.sent += 1
+        await self.fan_out(query, conversation, scheduled_at)
+        await completed.put(query)
+
+    async def run_scenario(self, scenario, conversation, completed, scheduled_at=None):
+        # A new conversation is started lazily by the first turn. In open loop the
+        # first turn is measured from the session's scheduled start, later turns
+        # from when their think time ended
+        if scenario.conversation == "new":
+            conversation.ids = dict.fromkeys(self.labels)
+        for index, query in enumerate(scenario.turns):
+            if index:
+                await asyncio.sleep(max(scenario.think[index](), 0.0))
+            await self.send(query, conversation, completed, None if index else scheduled_at)
+
+    async def warm_up(self, conversations, head):
+        # Warm-up turns cycle through the first queries; every user finishes before any measured turn
+        async def warm_user(index, conversation):
+            for turn in range(self.warmup):
+                query = head[(index + turn * len(conversations)) % len(head)]
+                await self.fan_out(query, conversation, warmup=True)
+
+        await asyncio.gather(*[warm_user(index, conversation) for index, conversation in enumerate(conversations)])
+
+    def conversations_for(self, users):
+        for user in range(len(self.conversations) + 1, users + 1):
+            self.conversations.append(Conversation(user, self.labels))
+        return self.conversations[:users]
+
+    def start_clock(self, duration):
+        # Measured phase starts: with a duration no query is sent after the deadline
+        self.deadline = time.perf_counter() + duration if duration else None
+
+    def expired(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    async def virtual_user(self, conversation, queries, completed):
+        # Users share one iterator; next() never yields to the event loop, so no two users get the same query
+        while not self.expired():
+            query = next(queries, None)
+            if query is None:
+                return
+            if isinstance(query, Scenario):
+                await self.run_scenario(query, conversation, completed)
+                continue
+            await self.send(query, conversation, completed)
+
+    async def closed_loop(self, queries, head, users, completed, duration=None):
+        conversations = self.conversations_for(users)
+        if self.warmup and head:
+            await asyncio.gather(*[self.start_user(conversation) for conversation in conversations])
+            await self.warm_up(conversations, head)
+        self.start_clock(duration)
+        await asyncio.gather(*[self.virtual_user(conversation, queries, completed) for conversation in conversations])
+
+    async def open_loop(self, queries, head, users, scheduler, completed, sessions=False, duration=None):
+        # Scenario sessions start their own conversations; users only need one for warm-up
+        conversations = self.conversations_for(users)
+        if not sessions or (self.warmup and head):
+            await asyncio.gather(*[self.start_user(conversation) for conversation in conversations])
+        if self.warmup and head:
+            await self.warm_up(conversations, head)
+        # Conversations of earlier runs of the engine are idle too
+        idle = asyncio.Queue()
+        for conversation in [] if sessions else self.conversations:
+            idle.put_nowait(conversation)
+        limit = self.max_conversations or 2 * max(self.users, self.concurrency)
+        # Sessions each start their own conversation, so they are capped by count
+        slots = asyncio.Semaphore(limit)
+
+        async def arrival(query, scheduled_at):
+            if idle.empty() and len(self.conversations) < limit:
+                conversation = self.conversations_for(len(self.conversations) + 1)[-1]
+            else:
+                conversation = await idle.get()
+            try:
+                await self.send(query, conversation, completed, scheduled_at)
+            finally:
+                idle.put_nowait(conversation)
+
+        async def session(scenario, conversation, scheduled_at):
+            async with slots:
+                await self.run_scenario(scenario, conversation, completed, scheduled_at)
+
+        # Only sends still in flight are kept, so long runs do not accumulate finished tasks
+        tasks = set()
+        self.start_clock(duration)
+        try:
+            start = time.perf_counter()
+            for index, offset in enumerate(scheduler.offsets()):
+                scheduled_at = start + offset
+                if self.deadline is not None and scheduled_at >= self.deadline:
+                    break
+                query = next(queries, None)
+                if query is None:
+                    break
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if isinstance(query, Scenario):
+                    task = asyncio.ensure_future(
+                        session(query, Conversation(index % users + 1, self.labels), scheduled_at))
+                else:
+                    task = asyncio.ensure_future(arrival(query, scheduled_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @contextlib.asynccontextmanager
+    async def connections(self):
+        # Keep-alive pools of every target for the length of a run; runs inside
+        # an outer connections() block share its pools instead of opening their own
+        if self.pools is not None:
+            yield self.pools
+            return
+        self.pools = [await ConnectionPool(processor.connection, processor.connection_counts, self.keep_alive).open()
+                      for processor in self.processors.values()]
+        try:
+            yield self.pools
+        finally:
+            for pool in self.pools:
+                await pool.close()
+            self.pools = None
+
+    async def run(self, queries, rate=None, arrival="constant", seed=None, duration=None):
+        # Async generator: yields every query as soon as its reply has been
+        # recorded (by every target), so the caller can refresh the UI while users
+        # keep running. queries may be a list or any iterable (e.g. a streaming
+        # Corpus); it is pulled lazily, only the first `users` queries are read ahead.
+        # With duration (seconds) no new query is sent once it has passed; the
+        # run ends when the queries in flight have been answered
+        iterator = iter(queries)
+        head = list(itertools.islice(iterator, self.users))
+        queries = itertools.chain(head, iterator)
+        users = max(1, len(head))
+        sessions = any(isinstance(query, Scenario) for query in head)
+        # Warm-up turns are taken from the scenarios' turns
+        if sessions:
+            head = [turn for query in head for turn in (query.turns if isinstance(query, Scenario) else [query])]
+        completed = asyncio.Queue()
+        self.semaphores = {label: asyncio.Semaphore(self.concurrency) for label in self.labels}
+        if rate:
+            main = self.open_loop(queries, head, users, ArrivalScheduler(rate, arrival, seed), completed, sessions,
+                                  duration)
+        else:
+            main = self.closed_loop(queries, head, users, completed, duration)
+        async with self.connections():
+            runner = asyncio.ensure_future(main)
+            try:
+                while True:
+                    getter = asyncio.ensure_future(completed.get())
+                    await asyncio.wait({getter, runner}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        yield getter.result()
+                        continue
+                    getter.cancel()
+                    break
+                while not completed.empty():
+                    yield completed.get_nowait()
+                # Re-raise the first failure of any virtual user
+                runner.result()
+            finally:
+                if not runner.done():
+                    runner.cancel()
+                    await asyncio.gather(runner, return_exceptions=True)
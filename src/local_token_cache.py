@@ -1,39 +1,125 @@
+import atexit
+import contextlib
 import os.path
 import json
+import tempfile
+import threading
 
 from msal import TokenCache
 
 
+@contextlib.contextmanager
+def file_lock(path):
+    # Interprocess lock on a side file, so parallel workers never write the cache at the same time
+    with open(path, "a+") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10 seconds; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
 class LocalTokenCache(TokenCache):
 
-    def __init__(self, cache_location: str):
+    def __init__(self, cache_location: str, debounce: float = 1.0):
         super().__init__()
         self.__cache_location = cache_location
         self.__has_state_changed = False
+        self.__debounce = debounce
+        self.__timer = None
+        self.__loaded_stat = None
+        self.lock_location = cache_location + ".lock"
 
-        if not os.path.exists(self.__cache_location):
-            with self._lock:
-                if not os.path.exists(self.__cache_location):
-                    with open(self.__cache_location, "w") as f:
-                        json.dump({}, f)
-        else:
-            with self._lock:
+        with self.file_lock():
+            if not os.path.exists(self.__cache_location):
+                self.__write({})
+            else:
+                self.reload()
+        atexit.register(self.flush)
+
+    def file_lock(self):
+        return file_lock(self.lock_location)
+
+    def __stat(self):
+        stat = os.stat(self.__cache_location)
+        return stat.st_mtime_ns, stat.st_size
+
+    def __write(self, data):
+        # Write to a temporary file next to the cache and rename it over, so readers
+        # never see a half-written file
+        directory = os.path.dirname(os.path.abspath(self.__cache_location))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.__cache_location)
+        self.__loaded_stat = self.__stat()
+
+    def reload(self):
+        # Pick up tokens another process wrote since we last read or wrote the file.
+        # Call with file_lock() held; unsaved local changes are never discarded.
+        with self._lock:
+            if self.__has_state_changed or not os.path.exists(self.__cache_location):
+                return
+            stat = self.__stat()
+            if stat != self.__loaded_stat:
                 with open(self.__cache_location, "r") as f:
                     self._cache = json.load(f)
+                self.__loaded_stat = stat
 
     def add(self, event, **kwargs):
         super().add(event, **kwargs)
         self.__has_state_changed = True  # cache correctness shouldn't be impacted if another thread modified __has_state_changed between this and the previous line
+        self.__schedule_flush()
 
     def modify(self, credential_type, old_entry, new_key_value_pairs=None):
         super().modify(credential_type, old_entry, new_key_value_pairs)
         self.__has_state_changed = True
+        self.__schedule_flush()
 
-    def serialize(self):
+    def __schedule_flush(self):
+        # One token acquisition adds several entries; they go to disk in a single write
+        with self._lock:
+            if self.__timer is None:
+                self.__timer = threading.Timer(self.__debounce, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def persist(self):
+        # Write pending changes now; the caller holds file_lock()
+        with self._lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            if self.__has_state_changed:
+                self.__write(self._cache)
+                self.__has_state_changed = False
+
+    def flush(self):
         if self.__has_state_changed:
+            with self.file_lock():
+                self.persist()
+        else:
             with self._lock:
-                if self.__has_state_changed:
-                    with open(self.__cache_location, "w") as f:
-                        json.dump(self._cache, f)
-                        self.__has_state_changed = False
-                        return json.dumps(self._cache)
+                self.__timer = None
+
+    def serialize(self):
+        self.flush()
+        with self._lock:
+            return json.dumps(self._cache)
@@ -19,8 +19,6 @@ import gradio as gr
 import pandas as pd
 import numpy as np
 from src.AgentProcessor import AgentProcessor
-from dotenv import load_dotenv
-from msal import PublicClientApplication
 
 from microsoft_agents.activity import ActivityTypes, load_configuration_from_env
 from microsoft_agents.copilotstudio.client import (
@@ -28,11 +26,16 @@ from microsoft_agents.copilotstudio.client import (
     CopilotClient,
 )
 
-from .local_token_cache import LocalTokenCache
+from .ab_test import create_ab_test
+from .connection import create_client
+from .corpus import Corpus
+from .harness_profiler import PROFILERS
+from .multi_target import TARGETS_ENV, create_multi_target_run, parse_targets
+from .ramp import RAMP_MODES, Ramp
+from .scenario import CONVERSATION_MODES
+from .run_store import RunStore, regressions
 
 logger = logging.getLogger(__name__)
-load_dotenv()
-TOKEN_CACHE = LocalTokenCache("./.local_token_cache.json")
 resultsdf = pd.DataFrame(columns=['Serial', 'Query', 'Response', 'Time', 'ConversationId', 'Char-Len'])
 resultsaidf = pd.DataFrame(columns=['Serial', 'Query', 'PlannerStep', 'Thought', 'Tool', 'Arguments'])
 statsdf = pd.DataFrame(columns=['Serial', 'Mean', 'Median', 'Max', 'Min', 'Deviation'])
@@ -42,63 +45,80 @@ async def open_browser(url: str):
     await asyncio.get_event_loop().run_in_executor(None, lambda: webbrowser.open(url))
 
 
-def acquire_token(settings: ConnectionSettings, app_client_id, tenant_id):
-    pca = PublicClientApplication(
-        client_id=app_client_id,
-        authority=f"https://login.microsoftonline.com/{tenant_id}",
-        token_cache=TOKEN_CACHE,
+async def ainput(string: str) -> str:
+    await asyncio.get_event_loop().run_in_executor(
+        None, lambda s=string: sys.stdout.write(s + " ")
     )
+    return await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
 
-    token_request = {
-        "scopes": ["https://api.powerplatform.com/.default"],
-    }
-    accounts = pca.get_accounts()
-    retry_interactive = False
-    token = None
-    try:
-        if accounts:
-            response = pca.acquire_token_silent(
-                token_request["scopes"], account=accounts[0]
-            )
-            token = response.get("access_token")
-        else:
-            retry_interactive = True
-    except Exception as e:
-        retry_interactive = True
-        logger.error(
-            f"Error acquiring token silently: {e}. Going to attempt interactive login."
-        )
 
-    if retry_interactive:
-        logger.debug("Attempting interactive login...")
-        response = pca.acquire_token_interactive(**token_request)
-        token = response.get("access_token")
+def list_runs():
+    runs = RunStore().list_runs()
+    choices = list(runs['run_id'])
+    return runs, gr.update(choices=choices), gr.update(choices=choices)
 
-    return token
 
-def create_client():
-    settings = ConnectionSettings(
-        environment_id=environ.get("COPILOTSTUDIOAGENT__ENVIRONMENTID"),
-        agent_identifier=environ.get("COPILOTSTUDIOAGENT__SCHEMANAME"),
-        cloud=None,
-        copilot_agent_type=None,
-        custom_power_platform_cloud=None,
-    )
-    
-    token = acquire_token(
-        settings,
-        app_client_id=environ.get("COPILOTSTUDIOAGENT__AGENTAPPID"),
-        tenant_id=environ.get("COPILOTSTUDIOAGENT__TENANTID"),
-    )
-    copilot_client = CopilotClient(settings, token)
-    return copilot_client
+async def run_ab_test(target_a, target_b, corpus_path, users, concurrency, warmup, resamples, confidence, tag):
+    # A/B tab: interleaved run against both targets, then the bootstrap report
+    test = create_ab_test(target_a, target_b, users, concurrency, warmup)
+    sent = 0
+    last_refresh = time.perf_counter()
+    yield "Starting conversations on both targets...", pd.DataFrame(), pd.DataFrame()
+    async for _ in test.run(Corpus(corpus_path or "./data/input.txt")):
+        sent += 1
+        if time.perf_counter() - last_refresh >= 1.0:
+            last_refresh = time.perf_counter()
+            yield f"{sent} queries answered by both targets", gr.update(), gr.update()
+    yield f"{sent} queries answered by both targets. Bootstrapping {int(resamples)} resamples...", gr.update(), test.samples()
+    report = test.report(int(resamples), confidence)
+    for label, processor in test.processors.items():
+        processor.save_run(tag, {"ab": label, "a": target_a, "b": target_b, "users": users, "concurrency": concurrency})
+    slower = list(report.loc[report["Verdict"] == "B slower", "Metric"])
+    faster = list(report.loc[report["Verdict"] == "B faster", "Metric"])
+    status = f"{sent} query pairs. B significantly slower: {', '.join(slower) or 'none'}. B significantly faster: {', '.join(faster) or 'none'}."
+    yield status, report, test.samples()
 
 
-async def ainput(string: str) -> str:
-    await asyncio.get_event_loop().run_in_executor(
-        None, lambda s=string: sys.stdout.write(s + " ")
-    )
-    return await asyncio.get_event_loop().run_in_executor(None, sys.stdin.readline)
+async def run_targets(targets_text, corpus_path, count, users, concurrency, rate, warmup, tag):
+    # Targets tab: the same corpus against every target at once, compared per target
+    run = create_multi_target_run(parse_targets(targets_text or ""), users, concurrency, warmup)
+    sent = 0
+    last_refresh = time.perf_counter()
+    yield f"Starting conversations on {len(run.labels)} targets...", pd.DataFrame(), pd.DataFrame(), None, pd.DataFrame()
+    async for _ in run.run(Corpus(corpus_path or "./data/input.txt", count=int(count) if count else None), rate or None):
+        sent += 1
+        if time.perf_counter() - last_refresh >= 1.0:
+            last_refresh = time.perf_counter()
+            yield f"{sent} queries answered by all targets", run.comparison(), run.tool_usage(), run.plot(), gr.update()
+    run_ids = run.save_runs(tag, {"users": users, "concurrency": concurrency, "rate": rate, "input": corpus_path})
+    status = f"{sent} queries sent to {', '.join(run.labels)}. Runs " + ", ".join(f"{label}: {run_id}" for label, run_id in run_ids.items())
+    yield status, run.comparison(), run.tool_usage(), run.plot(), run.samples()
+
+
+async def run_ramp(mode, start, step, max_level, hold, slo_p95, max_error_pct, users, corpus_path, tag):
+    # Capacity tab: one ramp, the step table and curve refreshed after every step
+    processor = AgentProcessor("ramp", create_client())
+    ramp = Ramp(processor, mode, start, step, max_level, hold, slo_p95 or None, (max_error_pct or 0) / 100, users)
+    yield f"Ramping {mode} from {start} to {max_level}, {hold}s per step...", pd.DataFrame(), None
+    async for steps in ramp.run(Corpus(corpus_path or "./data/input.txt")):
+        last = steps.iloc[-1]
+        yield f"Step {last['Step']} ({mode} {last['Level']}): {last['Throughput (q/s)']} q/s, p95 {last['p95']}s", steps, ramp.plot()
+    run_id = processor.save_run(tag, {"ramp": mode, "start": start, "step": step, "max": max_level, "hold": hold,
+                                      "slo_p95": slo_p95, "input": corpus_path})
+    yield f"Run {run_id}: " + ramp.summary(), ramp.steps(), ramp.plot()
+
+
+def compare_runs(baseline, candidate, threshold):
+    if not baseline or not candidate:
+        return pd.DataFrame(), "Select a baseline and a candidate run."
+    comparison = RunStore().compare(baseline, candidate)
+    flagged = regressions(comparison, threshold or 0)
+    if flagged.empty:
+        verdict = f"No metric regressed by more than {threshold}%."
+    else:
+        verdict = f"Regression above {threshold}%: " + ", ".join(flagged['Metric'])
+    return comparison, verdict
+
       
 with gr.Blocks(theme='shivi/calm_seafoam') as demo:
     with gr.Row():
@@ -107,6 +127,36 @@ with gr.Blocks(theme='shivi/calm_seafoam') as demo:
     with gr.Tab("Statistics"):
         with gr.Row():
             btn = gr.Button("Start Test Run", variant="primary")
+            users_input = gr.Number(label="Virtual Users", value=1, precision=0, minimum=1)
+            concurrency_input = gr.Number(label="Max In-Flight Requests", value=1, precision=0, minimum=1)
+            mode_input = gr.Dropdown(list(AgentProcessor.ARRIVAL_MODES), value="Closed loop", label="Load Mode")
+            rate_input = gr.Number(label="Target Rate (req/s)", value=1, minimum=0)
+            refresh_input = gr.Number(label="UI Refresh Interval (s)", value=1.0, minimum=0)
+            tag_input = gr.Textbox(label="Run Tag (commit / config)")
+
+        with gr.Row():
+            record_input = gr.Checkbox(label="Record activities to data/recordings", value=False)
+            replay_input = gr.Textbox(label="Replay recording (path to .jsonl.gz, empty for a live run)")
+            replay_speed_input = gr.Number(label="Replay Speed (0 = as fast as possible)", value=1.0, minimum=0)
+            warmup_input = gr.Number(label="Warm-up Turns per User (excluded)", value=0, precision=0, minimum=0)
+            keep_alive_input = gr.Checkbox(label="Reuse HTTP connections (keep-alive)", value=True)
+
+        with gr.Row():
+            corpus_input = gr.Textbox(label="Query Corpus (.txt, .csv, .jsonl, optionally .gz) or Scenarios (.jsonl, .yaml)", value="./data/input.txt")
+            sampling_input = gr.Dropdown(["sequential", "shuffle", "weighted"], value="sequential", label="Sampling")
+            count_input = gr.Number(label="Query Count (0 = one pass)", value=0, precision=0, minimum=0)
+            duration_input = gr.Number(label="Duration (s, 0 = no limit)", value=0, minimum=0)
+            seed_input = gr.Textbox(label="Seed (empty = random)")
+            conversation_input = gr.Dropdown(CONVERSATION_MODES, value="new", label="Scenario Conversation")
+
+        with gr.Row():
+            retries_input = gr.Number(label="Retries per Query", value=0, precision=0, minimum=0)
+            timeout_input = gr.Number(label="Query Timeout (s, 0 = none)", value=0, minimum=0)
+            backoff_input = gr.Number(label="Retry Backoff Base (s)", value=1.0, minimum=0)
+            metrics_port_input = gr.Number(label="Prometheus Metrics Port (0 = off)", value=0, precision=0, minimum=0)
+            soak_input = gr.Checkbox(label="Soak mode (spill rows to data/soak, keep only windows)", value=False)
+            window_input = gr.Number(label="Trend Window (s)", value=60, minimum=1)
+            profile_input = gr.Dropdown(PROFILERS, value="off", label="Profile Run (data/profiles)")
         
         with gr.Row():    
             process_status = gr.Textbox(label="Process Status", interactive=False)
@@ -119,12 +169,38 @@ with gr.Blocks(theme='shivi/calm_seafoam') as demo:
             min_output = gr.Number(label="Min")
             dev_output = gr.Number(label="Deviation")
             dev_corr = gr.Number(label="Token Corr")
+
+        with gr.Row():
+            p90_output = gr.Number(label="p90")
+            p95_output = gr.Number(label="p95")
+            p99_output = gr.Number(label="p99")
+            p999_output = gr.Number(label="p99.9")
+            lag_mean_output = gr.Number(label="Mean Send Lag")
+            lag_max_output = gr.Number(label="Max Send Lag")
             
+        with gr.Row():
+            phase_output = gr.DataFrame(label="Phase Latency Percentiles (seconds since send)", interactive=False)
+
+        with gr.Row():
+            outcome_output = gr.DataFrame(label="Outcomes (error rate, retries, time to success vs failure)", interactive=False)
+
+        with gr.Row():
+            harness_output = gr.DataFrame(label="Harness Overhead (time spent inside the measured window, event loop lag)", interactive=False)
+
+        with gr.Row():
+            split_output = gr.DataFrame(label="Client vs Server Time (seconds, from activity timestamps)", interactive=False)
+
         with gr.Row():
             gr.Markdown("## Response Time Analysis")  
         with gr.Row(): 
             lineplot_output = gr.LinePlot(resultsdf, x="Serial", y="Time", title="Response Time per Query", x_label="Query Serial", y_label="Response Time (seconds)", width=800, height=400)
             output_plot_whisker = gr.Plot()
+        with gr.Row():
+            trend_output = gr.LinePlot(x="Minute", y="Seconds", color="Series", title="Response Time per Window",
+                                       x_label="Minutes since start", y_label="Response Time (seconds)", width=800, height=300)
+        with gr.Row():
+            depth_output = gr.LinePlot(x="Turn", y="Seconds", color="Series", title="Response Time by Conversation Depth",
+                                       x_label="Turn in conversation", y_label="Response Time (seconds)", width=800, height=300)
 
     with gr.Tab("Data", interactive=False) as tb:
         # Applying style to highlight the maximum value in each row
@@ -139,11 +215,128 @@ with gr.Blocks(theme='shivi/calm_seafoam') as demo:
             frameai_output = gr.DataFrame(wrap=True,  # Enable text wrapping within cells
                                         label="LLM Planner Steps Data")
 
+    with gr.Tab("Tools"):
+        with gr.Row():
+            gr.Markdown("## Time per Tool")
+        with gr.Row():
+            tool_output = gr.DataFrame(label="Tool spans (seconds)")
+        with gr.Row():
+            gr.Markdown("## Time per Plan Shape")
+        with gr.Row():
+            plan_output = gr.DataFrame(label="Plan shapes (seconds)", wrap=True)
+        with gr.Row():
+            gr.Markdown("## Latency Drivers")
+        with gr.Row():
+            drivers_output = gr.DataFrame(label="Marginal cost per driver (robust regression of Time, fitted when the run ends)")
+        with gr.Row():
+            outliers_output = gr.DataFrame(label="Queries the drivers do not explain", wrap=True)
+        with gr.Row():
+            gr.Markdown("## Query Waterfall")
+        with gr.Row():
+            serial_input = gr.Number(label="Query Serial", value=1, precision=0, minimum=1)
+            waterfall_btn = gr.Button("Show Waterfall")
+        with gr.Row():
+            waterfall_output = gr.Plot()
+
+    with gr.Tab("A/B"):
+        with gr.Row():
+            gr.Markdown("## A/B Comparison")
+        with gr.Row():
+            ab_a_input = gr.Textbox(label="Target A (schema name, environment/schema or mock URL)")
+            ab_b_input = gr.Textbox(label="Target B")
+            ab_corpus_input = gr.Textbox(label="Query Corpus", value="./data/input.txt")
+        with gr.Row():
+            ab_users_input = gr.Number(label="Virtual Users", value=1, precision=0, minimum=1)
+            ab_concurrency_input = gr.Number(label="Max In-Flight Requests", value=2, precision=0, minimum=1)
+            ab_warmup_input = gr.Number(label="Warm-up Turns per User", value=0, precision=0, minimum=0)
+            ab_resamples_input = gr.Number(label="Bootstrap Resamples", value=2000, precision=0, minimum=100)
+            ab_confidence_input = gr.Slider(0.8, 0.99, value=0.95, step=0.01, label="Confidence")
+            ab_tag_input = gr.Textbox(label="Run Tag")
+            ab_btn = gr.Button("Run A/B", variant="primary")
+        with gr.Row():
+            ab_status = gr.Textbox(label="Verdict", interactive=False)
+        with gr.Row():
+            ab_report_output = gr.DataFrame(label="B - A percentile differences with bootstrap confidence intervals (seconds)")
+        with gr.Row():
+            ab_samples_output = gr.DataFrame(label="Samples of both targets", wrap=True)
+
+    with gr.Tab("Targets"):
+        with gr.Row():
+            gr.Markdown("## Multi-Agent Comparison")
+        with gr.Row():
+            targets_input = gr.Textbox(label="Targets, one name=target per line (schema name, environment/schema or mock URL)",
+                                       value=environ.get(TARGETS_ENV, "").replace(";", "\n"), lines=4)
+            targets_corpus_input = gr.Textbox(label="Query Corpus", value="./data/input.txt")
+            targets_count_input = gr.Number(label="Query Count (0 = one pass)", value=0, precision=0, minimum=0)
+        with gr.Row():
+            targets_users_input = gr.Number(label="Virtual Users", value=1, precision=0, minimum=1)
+            targets_concurrency_input = gr.Number(label="Max In-Flight per Target", value=1, precision=0, minimum=1)
+            targets_rate_input = gr.Number(label="Open-Loop Rate (req/s, 0 = closed loop)", value=0, minimum=0)
+            targets_warmup_input = gr.Number(label="Warm-up Turns per User", value=0, precision=0, minimum=0)
+            targets_tag_input = gr.Textbox(label="Run Tag")
+            targets_btn = gr.Button("Run Targets", variant="primary")
+        with gr.Row():
+            targets_status = gr.Textbox(label="Status", interactive=False)
+        with gr.Row():
+            targets_output = gr.DataFrame(label="Per-target latency (seconds), planner steps and tools")
+        with gr.Row():
+            targets_tools_output = gr.DataFrame(label="Tool usage per target")
+            targets_plot_output = gr.Plot()
+        with gr.Row():
+            targets_samples_output = gr.DataFrame(label="Samples of all targets", wrap=True)
+
+    with gr.Tab("Capacity"):
+        with gr.Row():
+            gr.Markdown("## Capacity Ramp")
+        with gr.Row():
+            ramp_mode_input = gr.Dropdown(RAMP_MODES, value="concurrency", label="Ramp")
+            ramp_start_input = gr.Number(label="Start Level", value=1, minimum=0)
+            ramp_step_input = gr.Number(label="Step", value=1, minimum=0)
+            ramp_max_input = gr.Number(label="Max Level", value=10, minimum=0)
+            ramp_hold_input = gr.Number(label="Hold per Step (s)", value=60, minimum=1)
+        with gr.Row():
+            ramp_slo_input = gr.Number(label="p95 SLO (s, 0 = none)", value=0, minimum=0)
+            ramp_error_input = gr.Number(label="Max Error Rate (%)", value=5, minimum=0)
+            ramp_users_input = gr.Number(label="Conversations (rate ramp)", value=10, precision=0, minimum=1)
+            ramp_corpus_input = gr.Textbox(label="Query Corpus", value="./data/input.txt")
+            ramp_tag_input = gr.Textbox(label="Run Tag")
+            ramp_btn = gr.Button("Start Ramp", variant="primary")
+        with gr.Row():
+            ramp_status = gr.Textbox(label="Ramp Status", interactive=False)
+        with gr.Row():
+            ramp_steps_output = gr.DataFrame(label="Ramp Steps")
+        with gr.Row():
+            ramp_plot_output = gr.Plot()
+
+    with gr.Tab("History"):
+        with gr.Row():
+            gr.Markdown("## Run History")
+        with gr.Row():
+            runs_btn = gr.Button("Refresh Runs")
+            baseline_input = gr.Dropdown(label="Baseline Run", choices=[])
+            candidate_input = gr.Dropdown(label="Candidate Run", choices=[])
+            threshold_input = gr.Number(label="Regression Threshold (%)", value=10)
+            compare_btn = gr.Button("Compare", variant="primary")
+        with gr.Row():
+            verdict_output = gr.Textbox(label="Verdict", interactive=False)
+        with gr.Row():
+            compare_output = gr.DataFrame(label="Baseline vs Candidate Percentiles (seconds)")
+        with gr.Row():
+            runs_output = gr.DataFrame(label="Runs")
+
+    runs_btn.click(fn=list_runs, inputs=[], outputs=[runs_output, baseline_input, candidate_input])
+    compare_btn.click(fn=compare_runs, inputs=[baseline_input, candidate_input, threshold_input],
+                      outputs=[compare_output, verdict_output])
+
     proc = AgentProcessor("AgentProcessor", create_client())
 
     btn.click(
         fn=proc.ask_question_file,
-        inputs=[],
+        inputs=[users_input, concurrency_input, mode_input, rate_input, refresh_input,
+                record_input, replay_input, replay_speed_input, tag_input, warmup_input, keep_alive_input,
+                corpus_input, sampling_input, count_input, duration_input, seed_input,
+                retries_input, timeout_input, backoff_input, metrics_port_input,
+                soak_input, window_input, profile_input, conversation_input],
         outputs=[btn, 
                  tb,
                  process_status, 
@@ -156,8 +349,38 @@ with gr.Blocks(theme='shivi/calm_seafoam') as demo:
                  frame_output, 
                  frameai_output, 
                  dev_corr,
-                 output_plot_whisker]
+                 output_plot_whisker,
+                 lag_mean_output,
+                 lag_max_output,
+                 phase_output,
+                 p90_output,
+                 p95_output,
+                 p99_output,
+                 p999_output,
+                 tool_output,
+                 plan_output,
+                 outcome_output,
+                 trend_output,
+                 harness_output,
+                 depth_output,
+                 split_output,
+                 drivers_output,
+                 outliers_output]
         )
+    ab_btn.click(fn=run_ab_test,
+                 inputs=[ab_a_input, ab_b_input, ab_corpus_input, ab_users_input, ab_concurrency_input, ab_warmup_input,
+                         ab_resamples_input, ab_confidence_input, ab_tag_input],
+                 outputs=[ab_status, ab_report_output, ab_samples_output])
+    targets_btn.click(fn=run_targets,
+                      inputs=[targets_input, targets_corpus_input, targets_count_input, targets_users_input,
+                              targets_concurrency_input, targets_rate_input, targets_warmup_input, targets_tag_input],
+                      outputs=[targets_status, targets_output, targets_tools_output, targets_plot_output,
+                               targets_samples_output])
+    ramp_btn.click(fn=run_ramp,
+                   inputs=[ramp_mode_input, ramp_start_input, ramp_step_input, ramp_max_input, ramp_hold_input,
+                           ramp_slo_input, ramp_error_input, ramp_users_input, ramp_corpus_input, ramp_tag_input],
+                   outputs=[ramp_status, ramp_steps_output, ramp_plot_output])
+    waterfall_btn.click(fn=proc.waterfall, inputs=[serial_input], outputs=[waterfall_output])
     
     
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+# Live metrics endpoint for Prometheus/Grafana. Runs inside the harness'
+# event loop and renders the processor's streaming statistics on every
+# scrape, so it adds nothing to the per-query path:
+#
+#   python -m src.run --users 20 --duration 600 --metrics-port 9464
+#   curl http://127.0.0.1:9464/metrics
+#
+# Exposed families (all prefixed copilot_harness_):
+#
+#   requests_total{status}            measured queries by Status (src/failures.py)
+#   retries_total{status}             retries spent on them
+#   phase_seconds{phase}              histogram per phase (Time, FirstActivity, ...)
+#   tool_seconds{tool}                histogram of plan step durations per tool
+#   time_split_seconds{part}          server vs network time of successful queries (src/clock_sync.py)
+#   clock_offset_seconds              estimated server minus client clock
+#   send_lag_seconds                  histogram of open-loop scheduler delay
+#   in_flight_requests                gauge
+#   virtual_users                     conversations started
+#   connections_total{state}          HTTP connections opened / reused
+#   event_loop_lag_seconds            histogram of event loop lag (src/harness_profiler.py)
+#   harness_overhead_seconds          histogram of harness work inside each query's window
+#   stalled_requests_total            queries that saw event loop lag above the stall threshold
+#
+# The text format is Prometheus 0.0.4, or OpenMetrics 1.0 when the scraper
+# asks for application/openmetrics-text. Histogram buckets are read from the
+# log-bucket LatencyHistograms at BUCKETS, to their 1% precision.
+from aiohttp import web
+
+from src.failures import STATUSES
+
+PREFIX = "copilot_harness_"
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 20.0,
+           30.0, 60.0, 120.0]
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsText:
+    # Builds one exposition; families are written whole, in order of first use
+    def __init__(self, openmetrics=False):
+        self.openmetrics = openmetrics
+        self.lines = []
+
+    def family(self, name, kind, help):
+        # OpenMetrics names a counter family without its _total suffix
+        family = name[:-len("_total")] if self.openmetrics and kind == "counter" else name
+        self.lines.append(f"# HELP {PREFIX}{family} {help}")
+        self.lines.append(f"# TYPE {PREFIX}{family} {kind}")
+
+    def sample(self, name, value, labels=None):
+        self.lines.append(f"{PREFIX}{name}{label_text(labels)} {float(value):.9g}")
+
+    def histogram(self, name, histogram, labels=None, total=None):
+        labels = labels or {}
+        for bound, count in zip(BUCKETS, histogram.cumulative(BUCKETS)):
+            self.sample(f"{name}_bucket", count, {**labels, "le": f"{bound:g}"})
+        self.sample(f"{name}_bucket", histogram.total, {**labels, "le": "+Inf"})
+        self.sample(f"{name}_count", histogram.total, labels)
+        self.sample(f"{name}_sum", histogram.sum if total is None else total, labels)
+
+    def render(self):
+        if self.openmetrics:
+            self.lines.append("# EOF")
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsExporter:
+    def __init__(self, processor, port=9464, host="127.0.0.1"):
+        self.processor = processor
+        self.host = host
+        self.port = int(port)
+        self.runner = None
+
+    def render(self, openmetrics=False):
+        processor = self.processor
+        labels = {"agent": processor.agent_name()}
+        if processor.target:
+            labels["target"] = processor.target
+        text = MetricsText(openmetrics)
+        outcomes = getattr(processor, "outcome_histograms", {})
+
+        text.family("requests_total", "counter", "Measured queries by outcome status")
+        for status in STATUSES:
+            text.sample("requests_total", outcomes[status].total if status in outcomes else 0, {**labels, "status": status})
+        text.family("retries_total", "counter", "Retries spent on measured queries by final status")
+        for status, retries in processor.outcome_retries.items():
+            text.sample("retries_total", retries, {**labels, "status": status})
+        text.family("warmup_requests_total", "counter", "Warm-up queries, left out of the statistics")
+        text.sample("warmup_requests_total", processor.warmup_samples, labels)
+
+        text.family("phase_seconds", "histogram", "Seconds from send to each phase of successful queries")
+        for phase, histogram in processor.phase_histograms.items():
+            text.histogram("phase_seconds", histogram, {**labels, "phase": phase})
+        text.family("tool_seconds", "histogram", "Plan step duration per tool")
+        for tool, entry in processor.attribution.tools.items():
+            text.histogram("tool_seconds", entry["histogram"], {**labels, "tool": tool}, entry["total"])
+
+        text.family("time_split_seconds", "histogram", "Time to the first message split by server timestamps")
+        for part, histogram in processor.time_split.histograms.items():
+            text.histogram("time_split_seconds", histogram, {**labels, "part": part})
+        if processor.time_split.clock.offset is not None:
+            text.family("clock_offset_seconds", "gauge", "Estimated server clock minus client clock")
+            text.sample("clock_offset_seconds", processor.time_split.clock.offset, labels)
+
+        text.family("in_flight_requests", "gauge", "Queries currently being sent or retried")
+        text.sample("in_flight_requests", processor.in_flight, labels)
+        text.family("virtual_users", "gauge", "Conversations started by virtual users in this run")
+        text.sample("virtual_users", processor.start_stats.count, labels)
+        text.family("connections_total", "counter", "HTTP connections opened and reused")
+        for state, count in processor.connection_counts.items():
+            text.sample("connections_total", count, {**labels, "state": state})
+        text.family("auth_wait_seconds_total", "counter", "Seconds queries waited for a token refresh")
+        text.sample("auth_wait_seconds_total", processor.auth_stats.mean * processor.auth_stats.count, labels)
+
+        # Harness health: how late the scheduler sends and how busy the event loop is
+        text.family("send_lag_seconds", "histogram", "Open-loop delay between the scheduled and actual send")
+        text.histogram("send_lag_seconds", processor.lag_stats.histogram, labels)
+        text.family("event_loop_lag_seconds", "histogram", "How late the harness event loop runs timers")
+        text.histogram("event_loop_lag_seconds", processor.loop_monitor.histogram, labels)
+        text.family("event_loop_lag_last_seconds", "gauge", "Event loop lag of the last check")
+        text.sample("event_loop_lag_last_seconds", processor.loop_monitor.last, labels)
+        text.family("harness_overhead_seconds", "histogram", "Harness work inside each query's measured window")
+        text.histogram("harness_overhead_seconds", processor.profiler.overhead, labels)
+        text.family("stalled_requests_total", "counter", "Queries that saw event loop lag above the stall threshold")
+        text.sample("stalled_requests_total", processor.profiler.stalled, labels)
+        return text.render()
+
+    async def metrics(self, request):
+        openmetrics = "application/openmetrics-text" in request.headers.get("Accept", "")
+        return web.Response(body=self.render(openmetrics).encode("utf-8"),
+                            headers={"Content-Type": OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE})
+
+    async def start(self):
+        if self.runner is not None:
+            return self
+        app = web.Application()
+        app.router.add_get("/metrics", self.metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.processor.loop_monitor.start()
+        print(f"Metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,173 @@
+# Local stand-in for the Copilot Studio conversation endpoint, for offline and
+# deterministic harness benchmarking. It speaks the same server-sent-events
+# protocol as the DirectConnect endpoint, so an unmodified CopilotClient can
+# talk to it:
+#
+#   python -m src.mock_server --port 8765 --answer-latency lognormal:0.8,0.4
+#   COPILOTSTUDIOAGENT__MOCKURL=http://127.0.0.1:8765/ python -m src.main
+#
+# Every turn streams typing, DynamicPlanReceived, a Triggered/BindUpdate/
+# Finished triple per plan step, the final message and endOfConversation.
+# Latencies, plan size, response size and error rates are configurable
+# distributions (see parse_distribution in src/scheduler.py).
+import argparse
+import asyncio
+import json
+import random
+import uuid
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+from src.scheduler import parse_distribution
+
+TOOLS = ["cr123_knowledge.search", "cr123_servicenow.getIncident", "cr123_calendar.findSlots", "cr123_hr.lookupPolicy"]
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class MockCopilotServer:
+    def __init__(self, plan_latency="fixed:0.2", step_latency="lognormal:0.3,0.5", answer_latency="lognormal:0.8,0.4",
+                 steps="uniform:0,3", response_chars="lognormal:600,0.6", error_rate=0.0, throttle_rate=0.0, seed=None,
+                 history_latency=0.0):
+        self.rng = random.Random(seed)
+        self.plan_latency = parse_distribution(plan_latency, self.rng)
+        self.step_latency = parse_distribution(step_latency, self.rng)
+        self.answer_latency = parse_distribution(answer_latency, self.rng)
+        self.steps = parse_distribution(steps, self.rng)
+        self.response_chars = parse_distribution(response_chars, self.rng)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.turns = 0
+        # Extra answer delay per earlier turn of the same conversation, to mimic a growing context
+        self.history_latency = history_latency
+        self.conversation_turns = {}
+
+    def activity(self, conversation_id, activity_type, **fields):
+        activity = {
+            "type": activity_type,
+            "id": str(uuid.uuid4()),
+            "timestamp": now_iso(),
+            "channelId": "pva-studio",
+            "from": {"id": "mock-agent", "role": "bot"},
+            "conversation": {"id": conversation_id},
+        }
+        activity.update(fields)
+        return activity
+
+    async def open_stream(self, request, conversation_id):
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "x-ms-conversationid": conversation_id,
+        })
+        await response.prepare(request)
+        return response
+
+    async def send(self, response, activity):
+        await response.write(f"event: activity\ndata: {json.dumps(activity)}\n\n".encode("utf-8"))
+
+    def injected_error(self):
+        draw = self.rng.random()
+        if draw < self.throttle_rate:
+            return web.json_response({"error": "Too many requests"}, status=429, headers={"Retry-After": "1"})
+        if draw < self.throttle_rate + self.error_rate:
+            return web.json_response({"error": "Mock server error"}, status=500)
+        return None
+
+    async def start_conversation(self, request):
+        error = self.injected_error()
+        if error is not None:
+            return error
+        conversation_id = str(uuid.uuid4())
+        response = await self.open_stream(request, conversation_id)
+        await self.send(response, self.activity(conversation_id, "message", text="Hello, I'm the mock agent. How can I help?"))
+        await response.write_eof()
+        return response
+
+    async def execute_turn(self, request):
+        error = self.injected_error()
+        if error is not None:
+            return error
+        conversation_id = request.match_info["conversation_id"]
+        body = await request.json()
+        question = (body.get("activity") or {}).get("text", "")
+        self.turns += 1
+        history = self.conversation_turns.get(conversation_id, 0)
+        self.conversation_turns[conversation_id] = history + 1
+        response = await self.open_stream(request, conversation_id)
+        await self.send(response, self.activity(conversation_id, "typing"))
+
+        steps = [self.rng.choice(TOOLS) for _ in range(int(round(self.steps())))]
+        await asyncio.sleep(self.plan_latency())
+        if steps:
+            plan_id = str(uuid.uuid4())
+            await self.send(response, self.activity(conversation_id, "event", name="DynamicPlanReceived", valueType="DynamicPlanReceived", value={
+                "planIdentifier": plan_id,
+                "steps": steps,
+                "toolDefinitions": [{"schemaName": tool, "displayName": tool.split(".")[-1], "description": f"Mock tool {tool}"}
+                                    for tool in dict.fromkeys(steps)],
+            }))
+            for tool in steps:
+                step_id = str(uuid.uuid4())
+                step = {"planIdentifier": plan_id, "stepId": step_id, "taskDialogId": tool}
+                await self.send(response, self.activity(conversation_id, "event", name="DynamicPlanStepTriggered", valueType="DynamicPlanStepTriggered",
+                                                        value=dict(step, thought=f"Use {tool} to answer: {question}")))
+                await self.send(response, self.activity(conversation_id, "event", name="DynamicPlanStepBindUpdate", valueType="DynamicPlanStepBindUpdate",
+                                                        value=dict(step, arguments={"query": question})))
+                await asyncio.sleep(self.step_latency())
+                await self.send(response, self.activity(conversation_id, "event", name="DynamicPlanStepFinished", valueType="DynamicPlanStepFinished",
+                                                        value=dict(step, state="completed")))
+
+        await asyncio.sleep(self.answer_latency() + history * self.history_latency)
+        chars = max(1, int(self.response_chars()))
+        text = ("Mock answer. " * (chars // 13 + 1))[:chars]
+        await self.send(response, self.activity(conversation_id, "message", text=text))
+        await self.send(response, self.activity(conversation_id, "endOfConversation"))
+        await response.write_eof()
+        return response
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/conversations", self.start_conversation)
+        app.router.add_post("/conversations/{conversation_id}", self.execute_turn)
+        return app
+
+
+def create_mock_client(url):
+    # CopilotClient talking to a mock server through the DirectConnect URL; no MSAL login needed
+    from microsoft_agents.copilotstudio.client import ConnectionSettings, CopilotClient
+
+    settings = ConnectionSettings(environment_id=None, agent_identifier=None, direct_connect_url=url)
+    return CopilotClient(settings, "mock-token")
+
+
+def add_arguments(parser):
+    parser.add_argument("--plan-latency", default="fixed:0.2", help="Delay before DynamicPlanReceived")
+    parser.add_argument("--step-latency", default="lognormal:0.3,0.5", help="Duration of each plan step")
+    parser.add_argument("--answer-latency", default="lognormal:0.8,0.4", help="Delay between the last step and the message")
+    parser.add_argument("--steps", default="uniform:0,3", help="Number of plan steps per turn")
+    parser.add_argument("--response-chars", default="lognormal:600,0.6", help="Length of the final message")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--history-latency", type=float, default=0.0, help="Seconds added to the answer per earlier turn of the conversation")
+
+
+def server_from_args(args):
+    return MockCopilotServer(args.plan_latency, args.step_latency, args.answer_latency, args.steps,
+                             args.response_chars, args.error_rate, args.throttle_rate, args.seed, args.history_latency)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Copilot Studio endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    web.run_app(server_from_args(args).app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# Side-by-side benchmark of several agent targets (dev/test/prod
+# environments, alternative agent designs) from one harness:
+#
+#   python -m src.multi_target --target dev=<env id>/cr123_helpdesk --target prod=<env id>/cr123_helpdesk \
+#       --users 5 --concurrency 5 --output ./data/targets.csv
+#
+# Targets can also come from COPILOTSTUDIOAGENT__TARGETS in .env, as
+# "dev=<env>/<schema>;prod=<env>/<schema>". A target is a schema name,
+# <environment id>/<schema name> or a mock server URL (see
+# create_target_client); every target gets its own processor and client, and
+# all clients share the process' token provider.
+#
+# Every virtual user keeps one conversation per target, and every query (or
+# open-loop arrival) is sent to all targets at the same moment (see
+# LoadEngine), so they see the same corpus, the same schedule and the same
+# time of day. Each target has its own in-flight cap, so a slow target cannot
+# take slots from a fast one.
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+
+import pandas as pd
+
+from src.load_engine import LoadEngine
+from src.scheduler import ArrivalScheduler
+
+TARGETS_ENV = "COPILOTSTUDIOAGENT__TARGETS"
+COMPARE_COLUMNS = ["Target", "Agent", "Samples", "Error %", "Mean", "p50", "p90", "p95", "p99", "vs First p95 %",
+                   "PlanReceived p50", "StreamEnd p95", "Steps/Query", "Tools Used", "Top Tool"]
+
+
+def parse_targets(specs):
+    # "name=target" entries, as a list or one string separated by newlines or
+    # semicolons; a bare target is named after itself
+    if isinstance(specs, str):
+        specs = specs.replace(";", "\n").splitlines()
+    targets = {}
+    for spec in specs:
+        spec = spec.strip()
+        if not spec or spec.startswith("#"):
+            continue
+        name, separator, target = spec.partition("=")
+        if not separator or name.strip().startswith(("http://", "https://")):
+            name, target = spec, spec
+        name = name.strip()
+        if name in targets:
+            raise ValueError(f"Target '{name}' is defined twice")
+        targets[name] = target.strip()
+    return targets
+
+
+class MultiTargetRun(LoadEngine):
+    # A LoadEngine over {name: AgentProcessor}, each with its own connection,
+    # plus the per-target comparison
+    def samples(self):
+        # All result tables in one frame, told apart by the Target column
+        return pd.concat([processor.samples.to_frame() for processor in self.processors.values()], ignore_index=True)
+
+    def comparison(self):
+        # One row per target from the streaming statistics of its processor
+        rows = []
+        first_p95 = None
+        for label, processor in self.processors.items():
+            stats = processor.stats
+            p50, p90, p95, p99 = stats.histogram.percentiles([50, 90, 95, 99])
+            if first_p95 is None:
+                first_p95 = p95
+            tools = processor.attribution.tools
+            calls = sum(entry["histogram"].total for entry in tools.values())
+            top = max(tools, key=lambda tool: tools[tool]["histogram"].total) if tools else None
+            rows.append({
+                "Target": label, "Agent": processor.agent_name(), "Samples": stats.count,
+                "Error %": round(processor.error_rate() * 100, 2),
+                "Mean": round(stats.mean, 3) if stats.count else None,
+                "p50": p50, "p90": p90, "p95": p95, "p99": p99,
+                "vs First p95 %": round((p95 - first_p95) / first_p95 * 100, 1) if p95 and first_p95 else None,
+                "PlanReceived p50": processor.phase_histograms["PlanReceived"].percentile(50),
+                "StreamEnd p95": processor.phase_histograms["StreamEnd"].percentile(95),
+                "Steps/Query": round(calls / stats.count, 2) if stats.count else None,
+                "Tools Used": len(tools), "Top Tool": top,
+            })
+        frame = pd.DataFrame(rows, columns=COMPARE_COLUMNS)
+        return frame.round({column: 3 for column in ["p50", "p90", "p95", "p99", "PlanReceived p50", "StreamEnd p95"]})
+
+    def tool_usage(self):
+        # Tool x target: calls per query and p95 step duration
+        rows = {}
+        for label, processor in self.processors.items():
+            queries = processor.stats.count
+            for tool, entry in processor.attribution.tools.items():
+                histogram = entry["histogram"]
+                row = rows.setdefault(tool, {"Tool": tool})
+                row[f"{label} Calls/Query"] = round(histogram.total / queries, 2) if queries else None
+                row[f"{label} p95"] = round(histogram.percentile(95), 3)
+        columns = ["Tool"] + [f"{label} {metric}" for label in self.labels for metric in ("Calls/Query", "p95")]
+        return pd.DataFrame(list(rows.values()), columns=columns).sort_values("Tool", ignore_index=True)
+
+    def plot(self, fig=None):
+        # One box per target, drawn from the streaming histograms like the Statistics tab box plot
+        if fig is None:
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=(9, 4))
+        stats = {label: processor.stats for label, processor in self.processors.items()}
+        return self.processor.generate_boxplot(stats, fig, "Response Time by Target", "Target")
+
+    def save_runs(self, tag, config):
+        return {label: processor.save_run(tag, {**config, "target": label, "targets": self.labels})
+                for label, processor in self.processors.items()}
+
+
+def create_multi_target_run(targets, users=1, concurrency=1, warmup=0, keep_alive=True):
+    # targets: {name: target}; empty means the ones configured in COPILOTSTUDIOAGENT__TARGETS
+    from src.AgentProcessor import AgentProcessor
+    from src.connection import create_target_client
+
+    targets = targets or parse_targets(os.environ.get(TARGETS_ENV, ""))
+    if not targets:
+        raise ValueError(f"No targets given and {TARGETS_ENV} is not set")
+    processors = {name: AgentProcessor(name, create_target_client(target)) for name, target in targets.items()}
+    return MultiTargetRun(processors, users, concurrency, warmup, keep_alive)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one corpus against several agent targets side by side")
+    parser.add_argument("--target", action="append", default=[],
+                        help=f"name=target, repeatable; defaults to {TARGETS_ENV}")
+    parser.add_argument("--input", default="./data/input.txt")
+    parser.add_argument("--count", type=int, default=None)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1, help="In-flight cap per target")
+    parser.add_argument("--rate", type=float, default=None, help="Open-loop arrivals per second, each sent to every target")
+    parser.add_argument("--arrival", choices=ArrivalScheduler.MODES, default="constant")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for Poisson arrivals")
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--tag", default="")
+    parser.add_argument("--output", default=None,
+                        help="CSV for all samples; the comparison and tool tables go to <output>.targets.csv and .tools.csv")
+    args = parser.parse_args(argv)
+
+    from src.corpus import Corpus
+    from src.failures import RetryPolicy
+
+    run = create_multi_target_run(parse_targets(args.target), args.users, args.concurrency, args.warmup)
+    for processor in run.processors.values():
+        processor.retry_policy = RetryPolicy(args.retries)
+        processor.query_timeout = args.timeout
+
+    async def drive():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            async for _ in run.run(Corpus(args.input, count=args.count), args.rate, args.arrival, args.seed):
+                pass
+
+    asyncio.run(drive())
+    comparison = run.comparison()
+    print(comparison.to_string(index=False))
+    print()
+    print(run.tool_usage().to_string(index=False))
+    if args.output:
+        base = os.path.splitext(args.output)[0]
+        run.samples().to_csv(args.output, index=False)
+        comparison.to_csv(base + ".targets.csv", index=False)
+        run.tool_usage().to_csv(base + ".tools.csv", index=False)
+    run.save_runs(args.tag, {"users": args.users, "concurrency": args.concurrency, "rate": args.rate,
+                             "input": args.input, "count": args.count})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
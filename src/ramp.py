@@ -0,0 +1,237 @@
+# Capacity-finding ramp. Raises the load in steps, holds every step for a
+# fixed time and measures it on its own:
+#
+#   concurrency  N virtual users in closed loop, N = start, start + step, ...
+#   rate         open-loop arrivals at R req/s, R = start, start + step, ...
+#
+#   python -m src.ramp --mode rate --start 1 --step 1 --max 20 --hold 60 --slo-p95 4 --plot ./data/ramp.png
+#
+# Every step reports throughput, p50/p95/p99 and error/throttle rates. The
+# ramp stops at the first step whose p95 is above the SLO or whose error rate
+# is above the threshold. The knee of the throughput/latency curve is the
+# step with the highest power (throughput / p95, Kleinrock): past it, extra
+# load buys less throughput than it costs in latency.
+import argparse
+import asyncio
+import contextlib
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.load_engine import LoadEngine
+from src.scheduler import ArrivalScheduler
+
+RAMP_MODES = ["concurrency", "rate"]
+STEP_COLUMNS = ["Step", "Level", "Sent", "Completed", "Errors", "Throttled", "Error %", "Throttle %",
+                "Throughput (q/s)", "p50", "p95", "p99", "Mean", "Status"]
+
+
+def endless(queries):
+    # Cycle a list or a re-iterable corpus for as long as the ramp needs queries
+    while True:
+        empty = True
+        for query in queries:
+            empty = False
+            yield query
+        if empty:
+            return
+
+
+def find_knee(steps):
+    # Index of the step with the highest throughput / p95, or None; steps
+    # that broke the SLO or error limit only count when no step stayed within them
+    usable = steps[(steps["p95"] > 0) & (steps["Throughput (q/s)"] > 0)]
+    if (usable["Status"] == "ok").any():
+        usable = usable[usable["Status"] == "ok"]
+    if usable.empty:
+        return None
+    return int((usable["Throughput (q/s)"] / usable["p95"]).idxmax())
+
+
+class Ramp:
+    def __init__(self, processor, mode="concurrency", start=1, step=1, max_level=10, hold=60.0, slo_p95=None,
+                 max_error_rate=0.05, users=10, arrival="constant", keep_alive=True):
+        if mode not in RAMP_MODES:
+            raise ValueError(f"Unknown ramp mode '{mode}', expected one of {RAMP_MODES}")
+        self.processor = processor
+        self.mode = mode
+        self.start = float(start)
+        self.step = float(step)
+        self.max_level = float(max_level)
+        self.hold = float(hold)
+        self.slo_p95 = float(slo_p95) if slo_p95 else None
+        self.max_error_rate = float(max_error_rate) if max_error_rate is not None else None
+        self.users = max(1, int(users or 1))
+        self.arrival = arrival
+        self.keep_alive = keep_alive
+        self.engine = LoadEngine(processor, self.users, keep_alive=keep_alive)
+        self.rows = []
+        self.stop_reason = None
+
+    def levels(self):
+        level = self.start
+        while level <= self.max_level + 1e-9:
+            yield int(level) if self.mode == "concurrency" else level
+            level += self.step
+
+    def step_row(self, index, level, first_sample, elapsed):
+        # Only successful queries count as completed and feed the percentiles
+        frame = self.processor.samples.to_frame(first_sample)
+        ok = frame["Status"] == "ok"
+        times = frame.loc[ok, "Time"].dropna().to_numpy(dtype=float)
+        p50, p95, p99 = np.percentile(times, [50, 95, 99]) if len(times) else (None, None, None)
+        sent, errors, throttled = len(frame), int((~ok).sum()), int((frame["Status"] == "throttled").sum())
+        row = {"Step": index, "Level": level, "Sent": sent, "Completed": len(times),
+               "Errors": errors, "Throttled": throttled,
+               "Error %": round(errors / sent * 100, 2) if sent else 0.0,
+               "Throttle %": round(throttled / sent * 100, 2) if sent else 0.0,
+               "Throughput (q/s)": round(len(times) / elapsed, 3) if elapsed else 0.0,
+               "p50": round(p50, 3) if p50 is not None else None,
+               "p95": round(p95, 3) if p95 is not None else None,
+               "p99": round(p99, 3) if p99 is not None else None,
+               "Mean": round(float(times.mean()), 3) if len(times) else None,
+               "Status": "ok"}
+        if self.slo_p95 is not None and (p95 is None or p95 > self.slo_p95):
+            row["Status"] = f"p95 above SLO {self.slo_p95}s"
+        elif self.max_error_rate is not None and sent and errors / sent > self.max_error_rate:
+            row["Status"] = f"error rate above {self.max_error_rate * 100:g}%"
+        return row
+
+    async def run(self, queries):
+        # Async generator: yields the table of finished steps after every step.
+        # Every step is one LoadEngine run of `hold` seconds; conversations and
+        # pooled connections carry over from step to step
+        queries = endless(queries)
+        async with self.engine.connections():
+            for index, level in enumerate(self.levels(), start=1):
+                print(f"Ramp step {index}: {self.mode} {level} for {self.hold}s")
+                first_sample = len(self.processor.samples)
+                started = time.perf_counter()
+                if self.mode == "concurrency":
+                    self.engine.users = self.engine.concurrency = level
+                    rate = None
+                else:
+                    # Open-loop steps are not capped: the cap is above the arrivals a step can have
+                    self.engine.users = self.users
+                    self.engine.concurrency = max(self.users, math.ceil(level * self.hold) + 1)
+                    rate = level
+                async for _ in self.engine.run(queries, rate, self.arrival, duration=self.hold):
+                    pass
+                row = self.step_row(index, level, first_sample, time.perf_counter() - started)
+                self.rows.append(row)
+                yield self.steps()
+                if row["Status"] != "ok":
+                    self.stop_reason = f"Stopped at step {index} ({self.mode} {level}): {row['Status']}"
+                    return
+                if row["Sent"] == 0:
+                    self.stop_reason = "Stopped: the corpus is empty"
+                    return
+            self.stop_reason = f"Reached the maximum {self.mode} {self.max_level:g} within the limits"
+
+    def steps(self):
+        return pd.DataFrame(self.rows, columns=STEP_COLUMNS)
+
+    def summary(self):
+        steps = self.steps()
+        knee = find_knee(steps)
+        ok = steps[steps["Status"] == "ok"]
+        text = self.stop_reason or ""
+        if knee is not None:
+            row = steps.loc[knee]
+            text += f". Knee at step {row['Step']} ({self.mode} {row['Level']}): {row['Throughput (q/s)']} q/s at p95 {row['p95']}s"
+        if not ok.empty:
+            best = ok.loc[ok["Throughput (q/s)"].idxmax()]
+            text += f". Highest throughput within limits: {best['Throughput (q/s)']} q/s ({self.mode} {best['Level']})"
+        return text
+
+    def plot(self, fig=None):
+        # Throughput vs latency, knee and SLO marked
+        if fig is None:
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=(9, 5))
+        fig.clear()
+        ax = fig.add_subplot()
+        steps = self.steps().dropna(subset=["p95"])
+        if steps.empty:
+            ax.set_title("No completed ramp steps")
+            return fig
+        x = steps["Throughput (q/s)"]
+        for column, style in (("p50", "o-"), ("p95", "s-"), ("p99", "^-")):
+            ax.plot(x, steps[column], style, label=column)
+        for _, row in steps.iterrows():
+            ax.annotate(f"{row['Level']:g}", (row["Throughput (q/s)"], row["p95"]), textcoords="offset points",
+                        xytext=(4, 4), fontsize="x-small")
+        knee = find_knee(steps)
+        if knee is not None:
+            ax.plot([steps.loc[knee, "Throughput (q/s)"]], [steps.loc[knee, "p95"]], "r*", markersize=16, label="knee")
+        if self.slo_p95 is not None:
+            ax.axhline(self.slo_p95, color="red", linestyle="--", linewidth=1, label=f"p95 SLO {self.slo_p95}s")
+        ax.set_xlabel("Throughput (queries/second)")
+        ax.set_ylabel("Response time (seconds)")
+        ax.set_title(f"Throughput vs latency ({self.mode} ramp, step labels = {self.mode})")
+        ax.grid(True)
+        ax.legend()
+        fig.tight_layout()
+        return fig
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capacity-finding ramp against the configured agent")
+    parser.add_argument("--input", default="./data/input.txt", help="Query corpus, cycled for as long as the ramp runs")
+    parser.add_argument("--mode", choices=RAMP_MODES, default="concurrency")
+    parser.add_argument("--start", type=float, default=1)
+    parser.add_argument("--step", type=float, default=1)
+    parser.add_argument("--max", type=float, default=10)
+    parser.add_argument("--hold", type=float, default=60, help="Seconds per step")
+    parser.add_argument("--slo-p95", type=float, default=None, help="Stop when a step's p95 Time exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=0.05, help="Stop when a step's error share exceeds this")
+    parser.add_argument("--users", type=int, default=10, help="Conversations the rate mode spreads arrivals over")
+    parser.add_argument("--arrival", choices=ArrivalScheduler.MODES, default="constant")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-query timeout in seconds, counted as an error")
+    parser.add_argument("--retries", type=int, default=0, help="Retries per query; a query only counts as an error once they are used up")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve live Prometheus metrics on this port")
+    parser.add_argument("--output", default=None, help="CSV for the per-step table")
+    parser.add_argument("--plot", default=None, help="PNG for the throughput/latency curve")
+    parser.add_argument("--tag", default="")
+    args = parser.parse_args(argv)
+
+    from src.AgentProcessor import AgentProcessor
+    from src.connection import create_client
+    from src.corpus import Corpus
+    from src.failures import RetryPolicy
+    from src.metrics_exporter import MetricsExporter
+
+    processor = AgentProcessor("ramp", create_client())
+    processor.query_timeout = args.timeout
+    processor.retry_policy = RetryPolicy(args.retries)
+    ramp = Ramp(processor, args.mode, args.start, args.step, args.max, args.hold, args.slo_p95,
+                args.max_error_rate, args.users, args.arrival)
+
+    async def drive():
+        exporter = await MetricsExporter(processor, args.metrics_port).start() if args.metrics_port else None
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                async for _ in ramp.run(Corpus(args.input)):
+                    pass
+        finally:
+            if exporter is not None:
+                await exporter.stop()
+
+    asyncio.run(drive())
+    print(ramp.steps().to_string(index=False))
+    print(ramp.summary())
+    if args.output:
+        ramp.steps().to_csv(args.output, index=False)
+    if args.plot:
+        ramp.plot().savefig(args.plot)
+    processor.save_run(args.tag, {"ramp": args.mode, "start": args.start, "step": args.step, "max": args.max,
+                                  "hold": args.hold, "slo_p95": args.slo_p95, "input": args.input})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# Record-and-replay of raw activity streams.
+#
+# RecordingClient wraps a CopilotClient and writes every activity it yields,
+# with a monotonic arrival time, to a gzip'd JSONL file:
+#
+#   {"kind": "header", "started_at": <epoch seconds>}
+#   {"kind": "turn", "turn": 3, "type": "ask", "query": "...", "conversation": "...", "t": 12.5, "retry": false}
+#   {"kind": "activity", "turn": 3, "t": 12.9, "activity": {...}}
+#   {"kind": "error", "turn": 3, "t": 13.1, "type": "ClientError", "status": 429, "message": "..."}
+#
+# A turn that failed gets an error record; a turn that asks the same question
+# in the same conversation after an attempt without a message is a retry.
+#
+# ReplayClient reads such a file and offers the same start_conversation /
+# ask_question interface, yielding the recorded activities at their original
+# pace (or scaled by `speed`) and raising the recorded errors again, so a
+# recording can go back through AgentProcessor and the dashboard without
+# calling the agent.
+import asyncio
+import builtins
+import collections
+import gzip
+import json
+import time
+
+import aiohttp
+from microsoft_agents.activity import Activity
+
+from src.failures import http_status
+
+
+class ActivityRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.started = time.perf_counter()
+        self.turns = 0
+        self.write({"kind": "header", "started_at": time.time()})
+
+    def write(self, record):
+        self.file.write(json.dumps(record, default=str) + "\n")
+
+    def begin_turn(self, turn_type, query=None, conversation_id=None, retry=False):
+        self.turns += 1
+        self.write({"kind": "turn", "turn": self.turns, "type": turn_type, "query": query,
+                    "conversation": conversation_id, "t": time.perf_counter() - self.started, "retry": retry})
+        return self.turns
+
+    def fail(self, turn, error):
+        self.write({"kind": "error", "turn": turn, "t": time.perf_counter() - self.started,
+                    "type": type(error).__name__, "status": http_status(error), "message": str(error)})
+
+    def record(self, turn, activity):
+        self.write({"kind": "activity", "turn": turn, "t": time.perf_counter() - self.started,
+                    "activity": activity.model_dump(mode="json", by_alias=True, exclude_none=True)})
+
+    def close(self):
+        self.file.close()
+
+
+class RecordingClient:
+    # Pass-through wrapper: same interface as CopilotClient, every activity is recorded
+    def __init__(self, connection, recorder):
+        self.connection = connection
+        self.recorder = recorder
+        # conversation id -> [last question asked, whether it got a message]
+        self.last = {}
+
+    async def stream(self, turn, activities, answered=None):
+        try:
+            async for activity in activities:
+                self.recorder.record(turn, activity)
+                if answered is not None and activity.type == "message" and activity.text:
+                    answered[1] = True
+                yield activity
+        except asyncio.CancelledError:
+            # A per-query timeout cancels the read; it replays as the timeout it was
+            self.recorder.fail(turn, asyncio.TimeoutError("Cancelled while waiting for the reply"))
+            raise
+        except Exception as e:
+            self.recorder.fail(turn, e)
+            raise
+
+    async def start_conversation(self, emit_start_conversation_event=True):
+        turn = self.recorder.begin_turn("start")
+        async for activity in self.stream(turn, self.connection.start_conversation(emit_start_conversation_event)):
+            yield activity
+
+    async def ask_question(self, question, conversation_id=None):
+        previous = self.last.get(conversation_id)
+        retry = previous is not None and previous[0] == question and not previous[1]
+        answered = self.last[conversation_id] = [question, False]
+        turn = self.recorder.begin_turn("ask", question, conversation_id, retry)
+        async for activity in self.stream(turn, self.connection.ask_question(question, conversation_id), answered):
+            yield activity
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class ReplayClient:
+    # speed 1.0 replays at the recorded pace, 2.0 twice as fast, 0 as fast as possible
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.starts = collections.deque()
+        # query -> attempt groups, one per logical query, each holding its retries in order
+        self.asks = collections.defaultdict(collections.deque)
+        self.recorded_queries = []
+        # conversation id -> (question, attempts left of the query being replayed)
+        self.attempts = {}
+        turns = {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["kind"] == "turn":
+                    turn = {"t": record["t"], "activities": [], "error": None}
+                    turns[record["turn"]] = turn
+                    if record["type"] == "start":
+                        self.starts.append(turn)
+                    elif record.get("retry") and self.asks[record["query"]]:
+                        self.asks[record["query"]][-1].append(turn)
+                    else:
+                        self.asks[record["query"]].append(collections.deque([turn]))
+                        self.recorded_queries.append(record["query"])
+                elif record["kind"] == "activity":
+                    turn = turns[record["turn"]]
+                    turn["activities"].append((record["t"] - turn["t"], record["activity"]))
+                elif record["kind"] == "error":
+                    turn = turns[record["turn"]]
+                    turn["error"] = dict(record, t=record["t"] - turn["t"])
+
+    def conversations(self):
+        # Number of conversations the recording started successfully, i.e. virtual users it can serve
+        return sum(1 for turn in self.starts if turn["error"] is None)
+
+    def queries(self):
+        # The corpus of the recorded run, in the order the questions were sent
+        return list(self.recorded_queries)
+
+    async def play(self, turn):
+        started = time.perf_counter()
+        for offset, activity in turn["activities"]:
+            delay = offset / self.speed - (time.perf_counter() - started) if self.speed else 0.0
+            # Awaited even at speed 0 or when behind, so replayed users still take turns on the event loop
+            await asyncio.sleep(max(delay, 0.0))
+            yield Activity.model_validate(activity)
+        if turn["error"] is not None:
+            delay = turn["error"]["t"] / self.speed - (time.perf_counter() - started) if self.speed else 0.0
+            await asyncio.sleep(max(delay, 0.0))
+            raise replayed_error(turn["error"])
+
+    async def start_conversation(self, emit_start_conversation_event=True):
+        if not self.starts:
+            raise ValueError(f"No more recorded conversation starts in {self.path}")
+        async for activity in self.play(self.starts.popleft()):
+            yield activity
+
+    async def ask_question(self, question, conversation_id=None):
+        # Recorded conversation ids are replayed as they were; the one passed in only
+        # tells a retry of the same question apart from a new ask
+        previous = self.attempts.get(conversation_id)
+        if previous is not None and previous[0] == question and previous[1]:
+            attempts = previous[1]
+        elif self.asks[question]:
+            attempts = self.asks[question].popleft()
+            self.attempts[conversation_id] = (question, attempts)
+        else:
+            raise ValueError(f"No recorded reply for '{question}' in {self.path}")
+        async for activity in self.play(attempts.popleft()):
+            yield activity
+
+
+def replayed_error(record):
+    # Rebuild the recorded exception by class name so failures.classify sees what the live run saw
+    cls = getattr(aiohttp, record["type"], None) or getattr(asyncio, record["type"], None) \
+        or getattr(builtins, record["type"], None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        cls = Exception
+    for base in cls.__mro__:
+        try:
+            error = base(record["message"])
+            break
+        except TypeError:
+            continue
+    else:
+        error = Exception(record["message"])
+    if record.get("status") is not None:
+        error.status = record["status"]
+    return error
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+
+class ResultStore:
+    # Append-only columnar table for one run. Numeric columns live in
+    # preallocated NumPy arrays that double in size when full, text columns in
+    # plain lists, so an append is amortised O(1) instead of reallocating a
+    # DataFrame. A DataFrame is only built when the UI or an export asks for it.
+    #
+    # columns maps column name -> dtype; use object for text/mixed columns.
+    # Float columns store None as NaN, so use a float dtype for anything optional.
+    #
+    # With spill set (a path prefix), every chunk_rows rows are written to
+    # <spill>-00001.csv.gz, <spill>-00002.csv.gz, ... and dropped from memory,
+    # so a soak run keeps at most one chunk. len() and row indexes still count
+    # the spilled rows; frames() and to_csv() read them back one chunk at a time.
+    def __init__(self, columns: dict, capacity: int = 1024, spill: str = None, chunk_rows: int = 10000):
+        self.columns = dict(columns)
+        self.spill = spill
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.chunks = []
+        # Rows already spilled; the in-memory rows start at this index
+        self.offset = 0
+        self._capacity = max(1, min(capacity, self.chunk_rows) if spill else capacity)
+        self._size = 0
+        self._data = {
+            name: [] if dtype is object else np.empty(self._capacity, dtype=dtype)
+            for name, dtype in self.columns.items()
+        }
+        self._frame = None
+
+    def __len__(self):
+        return self.offset + self._size
+
+    def _grow(self):
+        self._capacity *= 2
+        for name, dtype in self.columns.items():
+            if dtype is not object:
+                grown = np.empty(self._capacity, dtype=dtype)
+                grown[:self._size] = self._data[name][:self._size]
+                self._data[name] = grown
+
+    def append(self, row: dict):
+        if self._size == self._capacity:
+            self._grow()
+        for name, dtype in self.columns.items():
+            value = row.get(name)
+            if dtype is object:
+                self._data[name].append(value)
+            else:
+                self._data[name][self._size] = np.nan if value is None else value
+        self._size += 1
+        self._frame = None
+        if self.spill and self._size >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        # Writes the in-memory rows as the next chunk; numeric arrays are reused
+        if not self.spill or not self._size:
+            return
+        path = f"{self.spill}-{len(self.chunks) + 1:05d}.csv.gz"
+        self.memory_frame().to_csv(path, index=False, compression="gzip")
+        self.chunks.append(path)
+        self.offset += self._size
+        self._size = 0
+        for name, dtype in self.columns.items():
+            if dtype is object:
+                self._data[name] = []
+        self._frame = None
+
+    def column(self, name):
+        # Read-only view of the in-memory part of a column (all of it unless spilling)
+        return self._data[name][:self._size]
+
+    def memory_frame(self, start: int = 0):
+        # In-memory rows from absolute index start onwards
+        start = max(start, self.offset) - self.offset
+        return pd.DataFrame(
+            {name: self._data[name][start:self._size] for name in self.columns},
+            index=pd.RangeIndex(self.offset + start, self.offset + max(start, self._size)),
+        )
+
+    def frames(self, start: int = 0):
+        # The table from start onwards as a sequence of chunk-sized DataFrames;
+        # chunks that end before start are not read
+        for index, path in enumerate(self.chunks):
+            if (index + 1) * self.chunk_rows <= start:
+                continue
+            frame = pd.read_csv(path)
+            frame.index = pd.RangeIndex(index * self.chunk_rows, index * self.chunk_rows + len(frame))
+            yield frame
+        yield self.memory_frame()
+
+    def tail(self, rows: int):
+        # The newest rows still in memory, at most `rows` of them
+        return self.memory_frame(max(0, len(self) - rows))
+
+    def to_csv(self, path, **kwargs):
+        for index, frame in enumerate(self.frames()):
+            frame.to_csv(path, index=False, mode="w" if index == 0 else "a", header=index == 0, **kwargs)
+
+    def to_frame(self, start: int = 0):
+        # Rows from start onwards; the full table is cached until the next append
+        if start == 0 and self._frame is not None:
+            return self._frame
+        if start >= self.offset:
+            frame = self.memory_frame(start)
+        else:
+            frame = pd.concat(list(self.frames(start)))
+            frame = frame[frame.index >= start]
+        # Spilled tables are not cached: the point of spilling is not to hold them
+        if start == 0 and not self.chunks:
+            self._frame = frame
+        return frame
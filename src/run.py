@@ -0,0 +1,185 @@
+# Headless runner for scheduled latency checks. Imports only the measurement
+# core: no Gradio, no matplotlib, no browser.
+#
+#   python -m src.run --input ./data/input.txt --users 10 --concurrency 10 \
+#       --output ./data/nightly.csv --slo p95=3 --slo StreamEnd:p99=8 --tag "$GIT_SHA"
+#
+# Exit codes: 0 all SLOs met, 1 an SLO (or --baseline regression) was breached,
+# 2 the run itself failed.
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+ARRIVALS = {"closed": None, "constant": "constant", "poisson": "poisson"}
+
+
+def parse_slo(spec):
+    # "p95=2.5", "mean=1.2", "max=10", "error_rate=0.01" or "<Column>:p99=6" for a phase column
+    metric, _, threshold = spec.partition("=")
+    if not threshold:
+        raise argparse.ArgumentTypeError(f"SLO '{spec}' must look like p95=2.5")
+    column, _, statistic = metric.rpartition(":")
+    statistic = statistic.strip().lower()
+    if statistic in ("mean", "max", "min"):
+        key = statistic.capitalize()
+    elif statistic == "error_rate":
+        key = "Error Rate"
+    elif statistic.startswith("p"):
+        key = f"{column or 'Time'} {statistic}"
+    else:
+        raise argparse.ArgumentTypeError(f"Unknown SLO statistic '{statistic}'")
+    return key, float(threshold)
+
+
+def check_slos(summary, slos):
+    # Returns the breached SLOs as (metric, measured, threshold)
+    breaches = []
+    for key, threshold in slos:
+        measured = summary.get(key)
+        if measured is None or measured > threshold:
+            breaches.append((key, measured, threshold))
+    return breaches
+
+
+async def run(args):
+    from src.AgentProcessor import AgentProcessor
+    from src.connection import create_client
+    from src.failures import RetryPolicy
+    from src.harness_profiler import RunProfiler
+    from src.load_engine import LoadEngine
+    from src.scenario import open_corpus
+
+    queries = open_corpus(args.input, args.sampling, args.seed, args.count, args.duration, args.conversation)
+    processor = AgentProcessor("headless", create_client())
+    engine = LoadEngine(processor, args.users, args.concurrency, args.warmup, not args.no_keep_alive)
+    processor.reset_results(args.soak, args.window)
+    processor.retry_policy = RetryPolicy(args.retries, args.backoff, seed=args.seed)
+    processor.query_timeout = args.timeout
+    processor.profiler.stall_threshold = args.stall_threshold
+    processor.loop_monitor.start()
+    exporter = None
+    if args.metrics_port:
+        from src.metrics_exporter import MetricsExporter
+
+        exporter = await MetricsExporter(processor, args.metrics_port, args.metrics_host).start()
+    output = open(os.devnull, "w") if args.quiet else None
+    run_profiler = RunProfiler(args.profile).start()
+    try:
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            async for _ in engine.run(queries, args.rate if ARRIVALS[args.mode] else None, ARRIVALS[args.mode] or "constant",
+                                      args.seed):
+                pass
+        processor.windows.finish()
+    finally:
+        run_profiler.stop()
+        await processor.loop_monitor.stop()
+        if output:
+            output.close()
+        if exporter is not None:
+            await exporter.stop()
+    return processor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Copilot Studio latency run")
+    parser.add_argument("--input", default="./data/input.txt", help="Query corpus: .txt, .csv or .jsonl, optionally .gz; or a .jsonl/.yaml scenario file")
+    parser.add_argument("--sampling", choices=["sequential", "shuffle", "weighted"], default="sequential")
+    parser.add_argument("--count", type=int, default=None, help="Repeat the corpus until this many queries (or scenarios) were sent")
+    parser.add_argument("--duration", type=float, default=None, help="Repeat the corpus for this many seconds")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for shuffle/weighted sampling")
+    parser.add_argument("--conversation", choices=["new", "reuse"], default="new", help="Scenarios that do not set it: new conversation per scenario, or continue the user's conversation")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--mode", choices=list(ARRIVALS), default="closed")
+    parser.add_argument("--rate", type=float, default=None, help="Open-loop arrival rate (req/s)")
+    parser.add_argument("--warmup", type=int, default=0, help="Warm-up turns per virtual user, excluded from the statistics")
+    parser.add_argument("--retries", type=int, default=0, help="Retries per query for timeouts, 429, 5xx and dropped connections")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base of the jittered exponential retry backoff (seconds)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-query timeout in seconds")
+    parser.add_argument("--no-keep-alive", action="store_true", help="New HTTP connection per request (cold path)")
+    parser.add_argument("--output", default=None, help="CSV for the results table; planner rows, tool spans, trend windows, harness sections, latency by turn depth, the client/server split and the latency drivers go to <output>.planner.csv, .spans.csv, .windows.csv, .harness.csv, .depth.csv, .split.csv, .drivers.csv and .outliers.csv")
+    parser.add_argument("--slo", type=parse_slo, action="append", default=[], help="e.g. p95=2.5, mean=1.5, StreamEnd:p99=6, error_rate=0.01")
+    parser.add_argument("--tag", default="", help="Commit/config tag stored with the run")
+    parser.add_argument("--no-store", action="store_true", help="Do not save the run in the run store")
+    parser.add_argument("--baseline", default=None, help="Run id to compare against; a regression fails the run")
+    parser.add_argument("--regression-threshold", type=float, default=10.0, help="Percent, used with --baseline")
+    parser.add_argument("--error-threshold", type=float, default=1.0,
+                        help="Error rate rise in percentage points that counts as a regression, used with --baseline")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve live Prometheus metrics on this port during the run")
+    parser.add_argument("--metrics-host", default="127.0.0.1")
+    parser.add_argument("--soak", default=None, metavar="DIR", help="Soak mode: spill raw rows to DIR in chunks, keep only rolling windows in memory")
+    parser.add_argument("--window", type=float, default=60.0, help="Seconds per trend window")
+    parser.add_argument("--profile", choices=["off", "cprofile", "pyinstrument"], default="off", help="Profile the harness itself; written to ./data/profiles")
+    parser.add_argument("--stall-threshold", type=float, default=0.05, help="Event loop lag (seconds) above which a sample is marked Stalled")
+    parser.add_argument("--quiet", action="store_true", help="Suppress per-activity output")
+    args = parser.parse_args(argv)
+    if ARRIVALS[args.mode] and not args.rate:
+        parser.error("--rate is required for open-loop modes")
+    if args.baseline and args.no_store:
+        parser.error("--baseline compares against the stored run, so it cannot be used with --no-store")
+
+    started = time.perf_counter()
+    try:
+        processor = asyncio.run(run(args))
+    except Exception as e:
+        print(f"Run failed: {e}", file=sys.stderr)
+        return 2
+
+    summary = processor.summary()
+    print(f"\n{summary['Samples']} samples in {time.perf_counter() - started:.1f}s")
+    for key, value in summary.items():
+        if value is not None:
+            print(f"  {key}: {value:.4f}" if isinstance(value, float) else f"  {key}: {value}")
+    model = processor.latency_drivers()
+    drivers = model.drivers()
+    if len(drivers):
+        print(f"\nLatency drivers (robust fit over {len(model.y)} queries, R2 {model.explained() or 0:.2f}):")
+        for _, driver in drivers.iterrows():
+            print(f"  {driver['Driver']}: {driver['Cost (s)']:+.4f}s {driver['Unit']} "
+                  f"[{driver['CI Low']:+.4f}, {driver['CI High']:+.4f}], {driver['Avg Contribution (s)']:.4f}s per query on average")
+        print(f"  {len(model.outliers(top=None))} queries not explained by the drivers")
+    else:
+        print("\nLatency drivers: too few successful queries to fit")
+    if args.output:
+        processor.samples.to_csv(args.output)
+        processor.planner.to_csv(os.path.splitext(args.output)[0] + ".planner.csv")
+        processor.spans.to_csv(os.path.splitext(args.output)[0] + ".spans.csv")
+        processor.windows.frame().to_csv(os.path.splitext(args.output)[0] + ".windows.csv", index=False)
+        processor.profiler.frame(processor.loop_monitor).to_csv(os.path.splitext(args.output)[0] + ".harness.csv", index=False)
+        processor.depth.frame().to_csv(os.path.splitext(args.output)[0] + ".depth.csv", index=False)
+        processor.time_split.frame().to_csv(os.path.splitext(args.output)[0] + ".split.csv", index=False)
+        drivers.to_csv(os.path.splitext(args.output)[0] + ".drivers.csv", index=False)
+        model.outliers(top=None).to_csv(os.path.splitext(args.output)[0] + ".outliers.csv", index=False)
+
+    failed = False
+    run_id = None
+    if not args.no_store:
+        run_id = processor.save_run(args.tag, {"users": args.users, "concurrency": args.concurrency, "mode": args.mode,
+                                               "rate": args.rate, "input": args.input, "sampling": args.sampling,
+                                               "count": args.count, "duration": args.duration, "seed": args.seed, "warmup": args.warmup,
+                                               "keep_alive": not args.no_keep_alive, "retries": args.retries,
+                                               "timeout": args.timeout, "backoff": args.backoff, "soak": args.soak,
+                                               "window": args.window, "profile": args.profile, "conversation": args.conversation,
+                                               "headless": True})
+    for key, measured, threshold in check_slos(summary, args.slo):
+        print(f"SLO breached: {key} = {measured} > {threshold}")
+        failed = True
+    if args.baseline and run_id:
+        import pandas as pd
+
+        from src.run_store import RunStore, regressions
+
+        flagged = regressions(RunStore().compare(args.baseline, run_id), args.regression_threshold,
+                              args.error_threshold)
+        for _, row in flagged.iterrows():
+            change = f"{row['Delta %']}%" if pd.notna(row['Delta %']) else f"+{row['Delta']}"
+            print(f"Regression vs {args.baseline}: {row['Metric']} {row['Baseline']} -> {row['Candidate']} ({change})")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
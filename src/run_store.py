@@ -0,0 +1,207 @@
+# Persistent run history in an embedded SQLite database, so runs can be
+# compared across agent versions:
+#
+#   runs       one row per run, indexed by run id, agent, tag and start time
+#   samples    resultsdf rows of every run
+#   planner    resultsaidf rows of every run
+#   run_stats  summary statistics per run (metric -> value)
+#
+#   python -m src.run_store list --agent cr123_helpdesk
+#   python -m src.run_store compare <baseline run id> <candidate run id> --threshold 10
+import argparse
+import json
+import sqlite3
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from src.failures import error_rate, successes
+
+DEFAULT_PATH = "./data/runs.sqlite"
+# Columns compared between runs and the percentiles reported for each
+COMPARE_COLUMNS = ["Time", "FirstActivity", "PlanReceived", "ToolTime", "StreamEnd"]
+COMPARE_PERCENTILES = [50, 90, 95, 99]
+TOOL_PERCENTILES = [50, 95]
+
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+class RunStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        with self.connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    agent TEXT,
+                    tag TEXT,
+                    started_at REAL,
+                    finished_at REAL,
+                    samples INTEGER,
+                    config TEXT
+                );
+                CREATE INDEX IF NOT EXISTS runs_agent ON runs (agent, started_at);
+                CREATE INDEX IF NOT EXISTS runs_tag ON runs (tag, started_at);
+                CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+                CREATE TABLE IF NOT EXISTS run_stats (
+                    run_id TEXT,
+                    metric TEXT,
+                    value REAL,
+                    PRIMARY KEY (run_id, metric)
+                );
+            """)
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    def append_frame(self, db, table, frame):
+        # Result tables gain columns over time; add missing ones instead of failing
+        existing = [row[1] for row in db.execute(f'PRAGMA table_info("{table}")')]
+        if existing:
+            for column in frame.columns:
+                if column not in existing:
+                    db.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+        frame.to_sql(table, db, if_exists="append", index=False)
+        if not existing:
+            db.execute(f'CREATE INDEX IF NOT EXISTS "{table}_run" ON "{table}" (run_id)')
+
+    def save_run(self, run_id, agent, tag, started_at, samples, planner, stats, config=None):
+        # samples and planner are DataFrames or sequences of DataFrame chunks (spilled soak runs)
+        with self.connect() as db:
+            count = 0
+            for table, frames in (("samples", samples), ("planner", planner)):
+                for frame in [frames] if isinstance(frames, pd.DataFrame) else frames:
+                    if table == "samples":
+                        count += len(frame)
+                    if not frame.empty:
+                        self.append_frame(db, table, frame.assign(run_id=run_id))
+            db.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (run_id, agent, tag, started_at, time.time(), count, json.dumps(config or {}, default=str)))
+            db.executemany("INSERT OR REPLACE INTO run_stats VALUES (?, ?, ?)",
+                           [(run_id, metric, float(value)) for metric, value in stats.items()
+                            if value is not None and not pd.isna(value)])
+        return run_id
+
+    def list_runs(self, agent=None, tag=None, limit=200):
+        query = "SELECT run_id, agent, tag, datetime(started_at, 'unixepoch', 'localtime') AS started, samples FROM runs"
+        clauses, params = [], []
+        if agent:
+            clauses.append("agent = ?")
+            params.append(agent)
+        if tag:
+            clauses.append("tag = ?")
+            params.append(tag)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY started_at DESC LIMIT ?"
+        with self.connect() as db:
+            return pd.read_sql_query(query, db, params=params + [limit])
+
+    def load_table(self, table, run_id):
+        with self.connect() as db:
+            exists = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if not exists:
+                return pd.DataFrame()
+            return pd.read_sql_query(f'SELECT * FROM "{table}" WHERE run_id = ?', db, params=[run_id])
+
+    def load_run(self, run_id):
+        return self.load_table("samples", run_id), self.load_table("planner", run_id)
+
+    def load_stats(self, run_id):
+        with self.connect() as db:
+            return dict(db.execute("SELECT metric, value FROM run_stats WHERE run_id = ?", (run_id,)).fetchall())
+
+    def compare(self, baseline, candidate):
+        # Percentile differences computed from the stored samples of both runs
+        base, base_planner = self.load_run(baseline)
+        cand, cand_planner = self.load_run(candidate)
+        # Warm-up samples are not part of either run's headline numbers
+        if "Warmup" in base:
+            base = base[base["Warmup"].fillna(0) == 0]
+        if "Warmup" in cand:
+            cand = cand[cand["Warmup"].fillna(0) == 0]
+        rows = []
+        # Failed queries are compared by their share, not by their time to failure
+        if "Status" in base or "Status" in cand:
+            b, c = error_rate(base) * 100, error_rate(cand) * 100
+            rows.append({"Metric": "Error Rate %", "Baseline": round(b, 2), "Candidate": round(c, 2),
+                         "Delta": round(c - b, 2), "Delta %": round((c - b) / b * 100, 1) if b else None})
+        base, cand = successes(base), successes(cand)
+        for column in COMPARE_COLUMNS:
+            if column not in base or column not in cand:
+                continue
+            base_values = base[column].dropna().to_numpy(dtype=float)
+            cand_values = cand[column].dropna().to_numpy(dtype=float)
+            if not len(base_values) or not len(cand_values):
+                continue
+            for q, b, c in zip(COMPARE_PERCENTILES,
+                               np.percentile(base_values, COMPARE_PERCENTILES),
+                               np.percentile(cand_values, COMPARE_PERCENTILES)):
+                rows.append({"Metric": f"{column} p{q}", "Baseline": round(b, 4), "Candidate": round(c, 4),
+                             "Delta": round(c - b, 4), "Delta %": round((c - b) / b * 100, 1) if b else None})
+        # Step durations per tool, from the paired DynamicPlanStepFinished rows,
+        # so a regression can be traced to one connector or topic
+        base_tools, cand_tools = tool_durations(base_planner), tool_durations(cand_planner)
+        for tool in sorted(set(base_tools) & set(cand_tools)):
+            for q, b, c in zip(TOOL_PERCENTILES,
+                               np.percentile(base_tools[tool], TOOL_PERCENTILES),
+                               np.percentile(cand_tools[tool], TOOL_PERCENTILES)):
+                rows.append({"Metric": f"Tool {tool} p{q}", "Baseline": round(b, 4), "Candidate": round(c, 4),
+                             "Delta": round(c - b, 4), "Delta %": round((c - b) / b * 100, 1) if b else None})
+        return pd.DataFrame(rows, columns=["Metric", "Baseline", "Candidate", "Delta", "Delta %"])
+
+
+def tool_durations(planner):
+    # tool -> array of step durations of one run
+    if planner.empty or "Duration" not in planner:
+        return {}
+    steps = planner[(planner["PlannerStep"] == "DynamicPlanStepFinished") & planner["Duration"].notna()]
+    return {tool: group.to_numpy(dtype=float) for tool, group in steps.groupby("Tool")["Duration"]}
+
+
+def regressions(comparison, threshold_pct, error_points=1.0):
+    # Rows of compare() where the candidate is slower by more than threshold_pct,
+    # or worse at all where the baseline was 0 (no Delta %). The error rate is
+    # judged on its rise in percentage points instead
+    errors = comparison["Metric"] == "Error Rate %"
+    delta_pct = pd.to_numeric(comparison["Delta %"])
+    relative = delta_pct.fillna(-np.inf) > threshold_pct
+    from_zero = delta_pct.isna() & (comparison["Baseline"] == 0) & (comparison["Delta"] > 0)
+    return comparison[(errors & (comparison["Delta"] > error_points)) | (~errors & (relative | from_zero))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copilot Studio load test run history")
+    parser.add_argument("--db", default=DEFAULT_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    listing = sub.add_parser("list")
+    listing.add_argument("--agent")
+    listing.add_argument("--tag")
+    compare = sub.add_parser("compare")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    compare.add_argument("--error-threshold", type=float, default=1.0,
+                         help="Error rate regression threshold in percentage points")
+    args = parser.parse_args(argv)
+
+    store = RunStore(args.db)
+    if args.command == "list":
+        print(store.list_runs(args.agent, args.tag).to_string(index=False))
+        return 0
+    comparison = store.compare(args.baseline, args.candidate)
+    print(comparison.to_string(index=False))
+    flagged = regressions(comparison, args.threshold, args.error_threshold)
+    if not flagged.empty:
+        print(f"\nRegressions above {args.threshold}%: {', '.join(flagged['Metric'])}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
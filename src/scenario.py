@@ -0,0 +1,163 @@
+# Multi-turn conversation scenarios. A scenario is one scripted session: its
+# turns are sent in order in one conversation, with a think time drawn
+# between a reply and the next turn, the way a person reads and types.
+#
+# JSONL, one scenario per line:
+#
+#   {"id": "refund", "turns": ["Hi", "I want a refund", {"query": "Order 1234", "expected_tool": "getOrder"}],
+#    "think_time": "lognormal:4,0.5", "conversation": "new", "weight": 2, "category": "billing"}
+#
+# YAML (needs PyYAML) holds the same mappings as a list, or under a
+# "scenarios" key next to run-wide defaults for think_time and conversation.
+#
+# think_time is any distribution of parse_distribution (src/scheduler.py);
+# a turn may set its own. conversation "new" starts a conversation per
+# scenario; "reuse" continues the virtual user's current conversation, so the
+# history keeps growing across scenarios. The Turn column of every sample is
+# its depth in the conversation; TurnDepth builds the latency-vs-depth curve.
+import json
+import random
+
+import numpy as np
+import pandas as pd
+
+from src.corpus import Corpus, Query, corpus_format, open_text
+from src.scheduler import parse_distribution
+from src.streaming_stats import LatencyHistogram
+
+CONVERSATION_MODES = ["new", "reuse"]
+
+
+class Scenario:
+    __slots__ = ("id", "turns", "think", "conversation", "weight", "category")
+
+    def __init__(self, id, turns, think, conversation="new", weight=1.0, category=None):
+        self.id = id
+        self.turns = turns
+        # One think-time sampler per turn; the first turn's is not used
+        self.think = think
+        self.conversation = conversation
+        self.weight = weight
+        self.category = category
+
+    def __repr__(self):
+        return f"Scenario({self.id!r}, {len(self.turns)} turns, conversation={self.conversation!r})"
+
+    @classmethod
+    def from_record(cls, record, rng, think_time=0.0, conversation="new", index=0):
+        scenario_id = str(record.get("id") or f"scenario-{index}")
+        category = record.get("category") or None
+        think_time = record.get("think_time", think_time)
+        conversation = record.get("conversation") or conversation
+        if conversation not in CONVERSATION_MODES:
+            raise ValueError(f"Scenario '{scenario_id}': unknown conversation mode '{conversation}', expected one of {CONVERSATION_MODES}")
+        turns, think = [], []
+        for turn in record.get("turns") or []:
+            turn = {"query": turn} if isinstance(turn, str) else dict(turn)
+            turn.setdefault("category", category)
+            query = Query.from_record(turn)
+            if query is None:
+                continue
+            query.scenario = scenario_id
+            turns.append(query)
+            think.append(parse_distribution(turn.get("think_time", think_time), rng))
+        if not turns:
+            raise ValueError(f"Scenario '{scenario_id}' has no turns")
+        weight = record.get("weight")
+        return cls(scenario_id, turns, think, conversation, float(weight) if weight not in (None, "") else 1.0, category)
+
+
+def is_scenario_file(path):
+    # YAML files, and JSONL files whose first record has turns
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.lower().endswith((".yaml", ".yml")):
+        return True
+    if corpus_format(path) != "jsonl":
+        return False
+    with open_text(path) as f:
+        for line in f:
+            if line.strip():
+                return "turns" in json.loads(line)
+    return False
+
+
+def read_scenarios(path, rng, think_time=0.0, conversation="new"):
+    with open_text(path) as f:
+        if corpus_format(path) == "jsonl":
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("YAML scenarios need PyYAML: pip install pyyaml, or use JSONL")
+            document = yaml.safe_load(f) or []
+            if isinstance(document, dict):
+                think_time = document.get("think_time", think_time)
+                conversation = document.get("conversation") or conversation
+                document = document.get("scenarios") or []
+            records = document
+        for index, record in enumerate(records, start=1):
+            yield Scenario.from_record(record, rng, think_time, conversation, index)
+
+
+class ScenarioCorpus(Corpus):
+    # A Corpus of scenarios: sampling, count and duration apply to whole
+    # scenarios; weights pick scenarios, not turns
+    def __init__(self, path, mode="sequential", seed=None, count=None, duration=None, conversation="new",
+                 think_time=0.0, buffer_size=10000):
+        super().__init__(path, mode, seed, count, duration, buffer_size)
+        self.conversation = conversation if conversation in CONVERSATION_MODES else "new"
+        self.think_time = think_time
+        self.random = random.Random(seed)
+
+    def records(self):
+        return read_scenarios(self.path, self.random, self.think_time, self.conversation)
+
+
+def open_corpus(path, mode="sequential", seed=None, count=None, duration=None, conversation="new"):
+    # A ScenarioCorpus for scenario files, a plain Corpus of queries otherwise
+    if is_scenario_file(path):
+        return ScenarioCorpus(path, mode, seed, count, duration, conversation)
+    return Corpus(path, mode, seed, count, duration)
+
+
+class TurnDepth:
+    # One histogram per conversation depth (Turn), deeper turns share the
+    # last one, so memory stays fixed however long a conversation runs
+    def __init__(self, max_depth=100):
+        self.max_depth = max_depth
+        self.histograms = {}
+
+    def add(self, turn, seconds):
+        depth = min(int(turn), self.max_depth)
+        histogram = self.histograms.get(depth)
+        if histogram is None:
+            histogram = self.histograms[depth] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def frame(self):
+        rows = []
+        for depth in sorted(self.histograms):
+            histogram = self.histograms[depth]
+            p50, p95 = histogram.percentiles([50, 95])
+            rows.append([depth, histogram.total, histogram.sum / histogram.total, p50, p95])
+        return pd.DataFrame(rows, columns=["Turn", "Queries", "Mean", "p50", "p95"])
+
+    def trend(self):
+        # Long format for a line plot: one series per statistic
+        return self.frame().melt(id_vars=["Turn"], value_vars=["Mean", "p50", "p95"], var_name="Series",
+                                 value_name="Seconds")
+
+    def growth(self):
+        # Slope of the mean latency per turn of depth (a fit weighted by the
+        # queries at each depth), and the fitted change from turn 1 to the
+        # deepest turn; None until three depths have data
+        frame = self.frame()
+        if len(frame) < 3:
+            return None
+        turns = frame["Turn"].to_numpy(dtype=float)
+        slope, intercept = np.polyfit(turns, frame["Mean"].to_numpy(dtype=float), 1,
+                                      w=np.sqrt(frame["Queries"].to_numpy(dtype=float)))
+        first, last = intercept + slope * turns[0], intercept + slope * turns[-1]
+        return {"Turn Slope s/turn": float(slope), "Turn Depth Max": int(turns[-1]),
+                "Turn Growth %": float((last - first) / first * 100) if first > 0 else None}
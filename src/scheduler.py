@@ -0,0 +1,52 @@
+import random
+
+
+def parse_distribution(spec, rng):
+    # "fixed:0.5", "uniform:0.2,1.0", "lognormal:0.8,0.4" (median, sigma) or
+    # "exp:0.5" (mean); a plain number is fixed. Returns a function drawing one
+    # non-negative sample from rng (a random.Random).
+    try:
+        value = float(spec)
+        return lambda: value
+    except (TypeError, ValueError):
+        pass
+    name, _, params = str(spec).partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if name == "fixed":
+        return lambda: values[0]
+    if name == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if name == "lognormal":
+        median, sigma = values
+        return lambda: rng.lognormvariate(0, sigma) * median
+    if name == "exp":
+        return lambda: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown distribution '{spec}'")
+
+
+class ArrivalScheduler:
+    # Open-loop arrival schedule: yields the offset in seconds from the start of
+    # the run at which each request should be sent, independent of how long
+    # earlier requests take to answer.
+    MODES = ["constant", "poisson"]
+
+    def __init__(self, rate: float, mode: str = "constant", seed=None):
+        if rate is None or rate <= 0:
+            raise ValueError("Arrival rate must be greater than zero")
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown arrival mode '{mode}', expected one of {self.MODES}")
+        self.rate = float(rate)
+        self.mode = mode
+        self.random = random.Random(seed)
+
+    def offsets(self):
+        offset = 0.0
+        index = 0
+        while True:
+            if self.mode == "constant":
+                yield index / self.rate
+                index += 1
+            else:
+                yield offset
+                # Exponential inter-arrival gaps give a Poisson arrival process
+                offset += self.random.expovariate(self.rate)
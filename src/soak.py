@@ -0,0 +1,96 @@
+# Rolling-window statistics for long (soak) runs. Every measured query
+# lands in the window of its completion time; when a window closes it is
+# reduced to one summary row (queries, errors, mean, p50/p95/p99, max) and its
+# histogram is dropped, so a 24-hour run at one-minute windows holds 1,440
+# small rows instead of every sample. Closed rows are also appended to a CSV
+# next to the spilled samples when a path is given.
+#
+# drift() fits a straight line through the per-window p95 (and compares the
+# first and the last hour), to tell latency that creeps up over hours from
+# noise.
+import collections
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.streaming_stats import LatencyHistogram
+
+WINDOW_COLUMNS = ["Window", "Start", "Minute", "Queries", "Errors", "Mean", "p50", "p95", "p99", "Max"]
+
+
+class RollingWindows:
+    def __init__(self, window=60.0, keep=10080, path=None):
+        self.window = float(window)
+        self.rows = collections.deque(maxlen=keep)
+        self.path = path
+        self.index = 0
+        self.histogram = LatencyHistogram()
+        self.queries = 0
+        self.errors = 0
+
+    def roll(self, offset):
+        # Closes every window that ended before `offset` (seconds since the run started)
+        while offset >= (self.index + 1) * self.window:
+            self.close_window()
+
+    def add(self, offset, value, ok=True):
+        self.roll(offset)
+        self.queries += 1
+        if ok:
+            self.histogram.record(value)
+        else:
+            self.errors += 1
+
+    def current_row(self):
+        histogram = self.histogram
+        p50, p95, p99 = histogram.percentiles([50, 95, 99])
+        start = self.index * self.window
+        return {"Window": self.index + 1, "Start": start, "Minute": round(start / 60, 2), "Queries": self.queries,
+                "Errors": self.errors, "Mean": histogram.sum / histogram.total if histogram.total else None,
+                "p50": p50, "p95": p95, "p99": p99, "Max": histogram.max if histogram.total else None}
+
+    def close_window(self):
+        row = self.current_row()
+        self.rows.append(row)
+        if self.path:
+            new = not os.path.exists(self.path)
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=WINDOW_COLUMNS)
+                if new:
+                    writer.writeheader()
+                writer.writerow(row)
+        self.index += 1
+        self.histogram = LatencyHistogram()
+        self.queries = 0
+        self.errors = 0
+
+    def finish(self):
+        # Closes the last, partial window at the end of a run
+        if self.queries:
+            self.close_window()
+
+    def frame(self, current=False):
+        # Closed windows, plus the one still filling when current is set
+        rows = list(self.rows) + ([self.current_row()] if current and self.queries else [])
+        return pd.DataFrame(rows, columns=WINDOW_COLUMNS)
+
+    def trend(self):
+        # Long format for a line plot: one series per percentile
+        frame = self.frame(current=True).dropna(subset=["p50"])
+        return frame.melt(id_vars=["Minute"], value_vars=["p50", "p95", "p99"], var_name="Series", value_name="Seconds")
+
+    def drift(self):
+        # p95 slope in seconds per hour over the closed windows, and the change
+        # from the first hour to the last hour; None until three windows have data
+        frame = self.frame().dropna(subset=["p95"])
+        if len(frame) < 3:
+            return None
+        hours = frame["Start"].to_numpy(dtype=float) / 3600
+        p95 = frame["p95"].to_numpy(dtype=float)
+        slope = np.polyfit(hours, p95, 1)[0]
+        span = max(1, int(round(3600 / self.window)))
+        first, last = float(np.median(p95[:span])), float(np.median(p95[-span:]))
+        return {"p95 Drift s/h": float(slope), "p95 First Hour": first, "p95 Last Hour": last,
+                "p95 Change %": (last - first) / first * 100 if first else None}
@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+
+
+class LatencyHistogram:
+    # HDR-style histogram with log-spaced buckets: every recorded value is kept
+    # to within `precision` relative error, memory is fixed by the value range
+    # and two histograms with the same layout merge by adding their counts.
+    # Recording is O(1) and a percentile query costs O(buckets), independent of
+    # how many samples were recorded.
+    def __init__(self, lowest=1e-4, highest=3600.0, precision=0.01):
+        self.lowest = lowest
+        self.highest = highest
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.counts = np.zeros(self._index(highest) + 2, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value):
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self._log_base) + 1
+
+    def record(self, value, count=1):
+        if value is None or math.isnan(value):
+            return
+        self.counts[min(self._index(value), len(self.counts) - 1)] += count
+        self.total += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if len(other.counts) != len(self.counts) or other.lowest != self.lowest or other.precision != self.precision:
+            raise ValueError("Histograms need the same range and precision to merge")
+        self.counts += other.counts
+        self.total += other.total
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        return self.percentiles([q])[0]
+
+    def cumulative(self, bounds):
+        # Counts of values <= each bound (to the bucket precision), for fixed-bucket exports
+        cumulative = np.cumsum(self.counts)
+        return [int(cumulative[min(self._index(bound), len(cumulative) - 1)]) for bound in bounds]
+
+    def percentiles(self, qs):
+        # qs in 0..100; each result is the midpoint of the bucket holding that rank
+        if self.total == 0:
+            return [None for _ in qs]
+        cumulative = np.cumsum(self.counts)
+        values = []
+        for q in qs:
+            index = int(np.searchsorted(cumulative, max(1, math.ceil(q / 100.0 * self.total))))
+            value = self.lowest if index == 0 else self.lowest * math.exp((index - 0.5) * self._log_base)
+            values.append(min(max(value, self.min), self.max))
+        return values
+
+
+class StreamingStats:
+    # Incremental summary of one latency series: Welford mean/variance, exact
+    # min/max, a LatencyHistogram for percentiles and the running covariance
+    # with a second series (response length) for the correlation coefficient.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.histogram = LatencyHistogram()
+        self._x_mean = 0.0
+        self._x_m2 = 0.0
+        self._co_moment = 0.0
+
+    def add(self, value, x=None):
+        if value is None or math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.histogram.record(value)
+        if x is not None:
+            x_delta = x - self._x_mean
+            self._x_mean += x_delta / self.count
+            self._x_m2 += x_delta * (x - self._x_mean)
+            self._co_moment += x_delta * (value - self.mean)
+
+    def merge(self, other):
+        # Chan et al. parallel combination, so per-worker stats can be merged
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update({k: v for k, v in other.__dict__.items() if k != "histogram"})
+            self.histogram = LatencyHistogram().merge(other.histogram)
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        x_delta = other._x_mean - self._x_mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self._x_m2 += other._x_m2 + x_delta * x_delta * self.count * other.count / count
+        self._co_moment += other._co_moment + delta * x_delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self._x_mean += x_delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram.merge(other.histogram)
+        return self
+
+    @property
+    def std(self):
+        # Sample standard deviation, like pandas' Series.std()
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def correlation(self):
+        if self.count < 2 or self._m2 == 0 or self._x_m2 == 0:
+            return 0.0
+        return self._co_moment / math.sqrt(self._m2 * self._x_m2)
+
+    def percentile(self, q):
+        return self.histogram.percentile(q)
@@ -0,0 +1,98 @@
+# Access tokens for long runs. A single TokenProvider per process keeps the
+# token fresh from a background thread and pushes every new token into the
+# CopilotClients attached to it, so soak runs outlive the token lifetime.
+#
+# Worker processes each have their own provider but share the token cache
+# file: a refresh takes the cache's interprocess lock and reloads the file
+# first, so when one process has already refreshed the others pick up its
+# token instead of calling Entra ID again.
+import logging
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ["https://api.powerplatform.com/.default"]
+
+
+class TokenProvider:
+    # refresh_margin stays below MSAL's own 5 minute expiry window, so a silent
+    # acquisition at refresh time returns a new token rather than the cached one
+    def __init__(self, app, cache, scopes=SCOPES, refresh_margin=240, retry_interval=30):
+        self.app = app
+        self.cache = cache
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.access_token = None
+        self.expires_at = 0.0
+        self.refreshes = 0
+        self.clients = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def valid(self, skew=30):
+        return self.access_token is not None and self.expires_at - time.time() > skew
+
+    def acquire(self, interactive=True):
+        with self.cache.file_lock():
+            self.cache.reload()
+            result = None
+            accounts = self.app.get_accounts()
+            if accounts:
+                try:
+                    result = self.app.acquire_token_silent_with_error(self.scopes, account=accounts[0])
+                except Exception as e:
+                    logger.error(f"Error acquiring token silently: {e}")
+            if not result or "access_token" not in result:
+                if not interactive:
+                    raise RuntimeError(f"Silent token refresh failed: {(result or {}).get('error_description', 'no account')}")
+                logger.debug("Attempting interactive login...")
+                result = self.app.acquire_token_interactive(scopes=self.scopes)
+            self.cache.persist()
+        if "access_token" not in result:
+            raise RuntimeError(f"Token acquisition failed: {result.get('error_description', result.get('error'))}")
+        self.access_token = result["access_token"]
+        self.expires_at = time.time() + int(result.get("expires_in", 3600))
+        self.refreshes += 1
+        for client in list(self.clients):
+            client._token = self.access_token
+        return self.access_token
+
+    def token(self):
+        # Current token, refreshing in the calling thread if it has expired
+        # (e.g. the background refresh kept failing)
+        with self.lock:
+            if not self.valid():
+                self.acquire()
+            return self.access_token
+
+    def attach(self, client):
+        # The client receives every refreshed token from now on
+        client._token = self.token()
+        client.token_provider = self
+        self.clients.add(client)
+        self.start()
+        return client
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.refresh_loop, name="token-refresh", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def refresh_loop(self):
+        delay = max(self.expires_at - time.time() - self.refresh_margin, 0)
+        while not self.stopped.wait(delay):
+            try:
+                with self.lock:
+                    self.acquire(interactive=False)
+                logger.debug(f"Token refreshed, valid for {self.expires_at - time.time():.0f}s")
+                delay = max(self.expires_at - time.time() - self.refresh_margin, self.retry_interval)
+            except Exception as e:
+                logger.error(f"Background token refresh failed: {e}. Retrying in {self.retry_interval}s.")
+                delay = self.retry_interval
@@ -0,0 +1,84 @@
+# Per-tool latency attribution. Every DynamicPlanStepTriggered event is paired
+# with its DynamicPlanStepFinished event into a span (tool, start, end, all in
+# seconds since the query was sent). ToolAttribution aggregates the spans of
+# a run per tool and per plan shape (the planned sequence of tools), so a
+# regression can be pinned on one connector or topic:
+#
+#   per tool        calls, p50/p95/p99 span duration, total time and its
+#                   share of the total query time (StreamEnd) of the run
+#   per plan shape  queries, p50/p95 StreamEnd and the share of their time
+#                   spent inside tools
+import pandas as pd
+
+from src.streaming_stats import LatencyHistogram
+
+NO_PLAN = "(no plan)"
+
+
+def plan_shape(plans):
+    # plans: the step lists of every DynamicPlanReceived of one query
+    return " | ".join(" > ".join(steps) for steps in plans) if plans else NO_PLAN
+
+
+class ToolAttribution:
+    def __init__(self):
+        self.tools = {}
+        self.plans = {}
+        self.query_time = 0.0
+
+    def add_query(self, plan, stream_end, spans):
+        self.query_time += stream_end
+        tool_time = 0.0
+        for tool, start, end in spans:
+            entry = self.tools.setdefault(tool, {'histogram': LatencyHistogram(), 'total': 0.0})
+            entry['histogram'].record(end - start)
+            entry['total'] += end - start
+            tool_time += end - start
+        entry = self.plans.setdefault(plan, {'histogram': LatencyHistogram(), 'tool_time': 0.0, 'query_time': 0.0})
+        entry['histogram'].record(stream_end)
+        entry['tool_time'] += tool_time
+        entry['query_time'] += stream_end
+
+    def tool_frame(self):
+        rows = []
+        for tool, entry in self.tools.items():
+            histogram = entry['histogram']
+            p50, p95, p99 = histogram.percentiles([50, 95, 99])
+            rows.append([tool, histogram.total, round(p50, 3), round(p95, 3), round(p99, 3), round(entry['total'], 3),
+                         round(entry['total'] / self.query_time * 100, 1) if self.query_time else None])
+        frame = pd.DataFrame(rows, columns=['Tool', 'Calls', 'p50', 'p95', 'p99', 'Total (s)', 'Share of Query Time %'])
+        return frame.sort_values('Total (s)', ascending=False, ignore_index=True)
+
+    def plan_frame(self):
+        rows = []
+        for plan, entry in self.plans.items():
+            histogram = entry['histogram']
+            p50, p95 = histogram.percentiles([50, 95])
+            rows.append([plan, histogram.total, round(p50, 3), round(p95, 3),
+                         round(entry['tool_time'] / entry['query_time'] * 100, 1) if entry['query_time'] else None])
+        frame = pd.DataFrame(rows, columns=['Plan', 'Queries', 'p50', 'p95', 'Tool Share %'])
+        return frame.sort_values('Queries', ascending=False, ignore_index=True)
+
+
+def draw_waterfall(fig, sample, spans):
+    # One query as a waterfall: the whole reply stream on top, one bar per
+    # tool span below it, and markers for the phase timestamps
+    ax = fig.add_subplot()
+    stream_end = sample['StreamEnd']
+    labels = ['Query']
+    ax.broken_barh([(0, stream_end)], (0.6, 0.8), color='lightgray')
+    for index, span in enumerate(spans.itertuples(), start=1):
+        ax.broken_barh([(span.Start, span.Duration)], (index + 0.6, 0.8), color='tab:blue')
+        labels.append(span.Tool)
+    # Time is rounded to 10 ms in resultsdf, so the first message marker can sit just past StreamEnd
+    for column, color in (('FirstActivity', 'tab:gray'), ('PlanReceived', 'tab:orange'), ('Time', 'tab:green')):
+        if not pd.isna(sample[column]):
+            ax.axvline(sample[column], color=color, linestyle='--', linewidth=1, label=column)
+    ax.set_yticks([i + 1 for i in range(len(labels))], labels)
+    ax.invert_yaxis()
+    ax.set_xlabel("Seconds since send")
+    ax.set_title(f"Query {sample['Serial']}: {str(sample['Query'])[:60]}")
+    ax.legend(loc='lower right', fontsize='small')
+    ax.xaxis.grid(True)
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,21 @@
+import numpy as np
+
+from src.ab_test import bootstrap_diff, verdict
+
+
+def test_bootstrap_diff_finds_a_real_shift():
+    rng = np.random.default_rng(4)
+    a, b = rng.normal(1.0, 0.1, 500), rng.normal(1.3, 0.1, 500)
+    for q, base, cand, delta, low, high in bootstrap_diff(a, b, [50, 95], resamples=500, seed=1):
+        assert np.isclose(base, np.percentile(a, q)) and np.isclose(cand, np.percentile(b, q))
+        assert np.isclose(delta, cand - base)
+        assert 0 < low <= delta <= high
+        assert verdict(low, high) == "B slower"
+
+
+def test_bootstrap_diff_of_one_distribution_is_not_significant():
+    rng = np.random.default_rng(5)
+    a, b = rng.normal(1.0, 0.1, 500), rng.normal(1.0, 0.1, 500)
+    _, _, _, _, low, high = bootstrap_diff(a, b, [50], resamples=500, seed=1)[0]
+    assert low < 0 < high
+    assert bootstrap_diff(a, b, [50], resamples=200, seed=7) == bootstrap_diff(a, b, [50], resamples=200, seed=7)
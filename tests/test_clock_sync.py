@@ -0,0 +1,28 @@
+from src.clock_sync import ClockOffset
+
+
+def test_offset_is_bounded_by_the_fastest_round_trips():
+    clock = ClockOffset()
+    # Server clock 2s ahead; each reply bounds the offset by its send and receive times
+    clock.add(100.0, [(102.3, 100.5)])
+    clock.add(200.0, [(202.05, 200.1), (202.08, 200.12)])
+    assert clock.consistent()
+    assert clock.lower <= 2.0 <= clock.upper
+    assert abs(clock.offset - 2.0) <= clock.uncertainty()
+    assert round(clock.lower, 6) == 1.96 and round(clock.upper, 6) == 2.05
+
+
+def test_crossed_bounds_fall_back_to_the_median_midpoint():
+    clock = ClockOffset()
+    clock.add(100.0, [(101.0, 100.2)])
+    clock.add(200.0, [(203.0, 200.2)])
+    assert not clock.consistent()
+    assert clock.uncertainty() is None
+    assert clock.offset is not None
+
+
+def test_reply_without_stamps_keeps_the_estimate():
+    clock = ClockOffset()
+    assert clock.add(100.0, []) is None
+    clock.add(100.0, [(102.1, 100.2)])
+    assert clock.add(101.0, []) == clock.offset
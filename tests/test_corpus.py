@@ -0,0 +1,34 @@
+from src.corpus import Corpus
+
+
+def write_corpus(tmp_path, lines):
+    path = tmp_path / "queries.txt"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_weighted_without_count_draws_one_corpus_length(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b", "c"])
+    assert len(list(Corpus(path, "weighted", seed=1))) == 3
+
+
+def test_weighted_with_count_draws_count(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b", "c"])
+    queries = list(Corpus(path, "weighted", seed=1, count=7))
+    assert len(queries) == 7
+    assert {query.text for query in queries} <= {"a", "b", "c"}
+
+
+def test_sequential_reads_the_corpus_once(tmp_path):
+    path = write_corpus(tmp_path, ["a", "b", "c"])
+    assert [query.text for query in Corpus(path)] == ["a", "b", "c"]
+
+
+def test_weighted_single_pass_draws_in_buffer_sized_batches(tmp_path):
+    path = write_corpus(tmp_path, [f"q{i}" for i in range(10)])
+    corpus = Corpus(path, "weighted", seed=1, buffer_size=3)
+    sizes = []
+    draw = corpus.weighted
+    corpus.weighted = lambda draws: sizes.append(draws) or draw(draws)
+    assert len(list(corpus)) == 10
+    assert max(sizes) <= 3
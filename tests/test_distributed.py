@@ -0,0 +1,22 @@
+import pandas as pd
+
+from src.distributed import summary_stats
+
+
+def test_summary_stats_when_every_query_failed():
+    results = pd.DataFrame({"Time": [None, None], "Char-Len": [0, 0], "Status": ["throttled", "server_error"],
+                            "Warmup": [False, False]})
+    summary = summary_stats(results)
+    assert summary["Samples"] == 0
+    assert summary["Error Rate"] == 1.0
+    for key in ["Mean", "Max", "Min", "Deviation", "Time p50", "Time p95", "Time p99.9"]:
+        assert summary[key] is None
+
+
+def test_summary_stats_leaves_out_warmup_and_failures():
+    results = pd.DataFrame({"Time": [5.0, 1.0, 2.0, None], "Char-Len": [10, 10, 20, 0],
+                            "Status": ["ok", "ok", "ok", "timeout"], "Warmup": [True, False, False, False]})
+    summary = summary_stats(results)
+    assert summary["Samples"] == 2
+    assert summary["Max"] == 2.0
+    assert round(summary["Error Rate"], 4) == round(1 / 3, 4)
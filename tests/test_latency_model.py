@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from src.latency_model import LatencyModel, sample_rows
+
+SAMPLE_COLUMNS = ["Serial", "Query", "Time", "Char-Len", "Turn", "InFlight", "Status", "Warmup"]
+
+
+def test_fit_without_rows_leaves_the_model_unfitted():
+    model = LatencyModel().fit(pd.DataFrame(columns=SAMPLE_COLUMNS), pd.DataFrame(columns=["Sample", "Tool"]))
+    assert model.coefficients is None
+    assert model.drivers().empty
+
+
+def test_fit_with_only_failed_rows_leaves_the_model_unfitted():
+    samples = pd.DataFrame({"Serial": [1, 2], "Query": ["a", "b"], "Time": [None, None], "Char-Len": [0, 0],
+                            "Turn": [1, 1], "InFlight": [1, 1], "Status": ["timeout", "throttled"],
+                            "Warmup": [False, False]})
+    assert LatencyModel().fit(samples, pd.DataFrame(columns=["Sample", "Tool"])).coefficients is None
+
+
+def test_fit_recovers_the_cost_per_step():
+    rng = np.random.default_rng(0)
+    n = 200
+    steps = rng.integers(0, 4, n)
+    samples = pd.DataFrame({"Serial": np.arange(1, n + 1), "Query": "q", "Time": 0.5 + 0.25 * steps + rng.normal(0, 0.01, n),
+                            "Char-Len": 500, "Turn": 1, "InFlight": 1, "Status": "ok", "Warmup": False})
+    spans = pd.DataFrame({"Sample": np.repeat(samples["Serial"], steps), "Tool": "search"})
+    drivers = LatencyModel().fit(samples, spans).drivers().set_index("Driver")
+    assert abs(drivers.loc["Steps", "Cost (s)"] - 0.25) < 0.01
+    assert abs(drivers.loc["Intercept", "Cost (s)"] - 0.5) < 0.01
+
+
+def test_sample_rows_is_bounded_and_keeps_reading_order():
+    frames = [pd.DataFrame({"Serial": range(i * 100, (i + 1) * 100)}) for i in range(10)]
+    sampled = sample_rows(iter(frames), 50, np.random.default_rng(1))
+    assert len(sampled) == 50
+    assert sampled["Serial"].is_monotonic_increasing
+    assert len(sample_rows(iter(frames), 5000, np.random.default_rng(1))) == 1000
@@ -0,0 +1,114 @@
+import asyncio
+
+import aiohttp
+from microsoft_agents.activity import Activity
+
+from src.AgentProcessor import AgentProcessor
+from src.corpus import Query
+from src.load_engine import LoadEngine
+from src.scenario import Scenario
+
+
+class Conversation:
+    def __init__(self, id):
+        self.id = id
+
+
+class Action:
+    def __init__(self, conversation_id):
+        self.conversation = Conversation(conversation_id)
+        self.text = None
+
+
+class FlakyClient:
+    # Every conversation start in `failures` (by call number) is answered with
+    # HTTP 429; with throttle_asks every question is too
+    def __init__(self, failures, throttle_asks=False):
+        self.failures = set(failures)
+        self.throttle_asks = throttle_asks
+        self.starts = 0
+
+    async def start_conversation(self, emit_start_conversation_event=True):
+        self.starts += 1
+        if self.starts in self.failures:
+            raise aiohttp.ClientError("Error sending request: 429")
+        yield Action(f"conversation-{self.starts}")
+
+    async def ask_question(self, question, conversation_id=None):
+        if self.throttle_asks:
+            raise aiohttp.ClientError("Error sending request: 429")
+        yield Activity(type="message", text=f"Answer to {question}")
+
+
+def run(engine, queries, rate=None):
+    async def drive():
+        async for _ in engine.run(queries, rate):
+            pass
+
+    asyncio.run(drive())
+
+
+def test_failed_start_is_a_row_and_the_run_goes_on():
+    processor = AgentProcessor("test", FlakyClient(failures={1}))
+    run(LoadEngine(processor), ["q1", "q2", "q3"])
+    samples = processor.samples.to_frame()
+    assert list(samples["Status"]) == ["throttled", "ok", "ok"]
+    assert samples.loc[0, "ConversationId"] is None
+    assert "Conversation start failed" in samples.loc[0, "Error"]
+    # The user started again at its next query and kept that conversation
+    assert set(samples.loc[1:, "ConversationId"]) == {"conversation-2"}
+
+
+def test_failed_start_in_open_loop():
+    # Both users fail to start up front; only the arrival whose retry fails again is lost
+    processor = AgentProcessor("test", FlakyClient(failures={1, 2, 3}))
+    run(LoadEngine(processor, users=2, concurrency=2), ["q1", "q2", "q3", "q4"], rate=50)
+    samples = processor.samples.to_frame()
+    assert len(samples) == 4
+    assert list(samples.sort_values("Offset")["Status"]) == ["throttled", "ok", "ok", "ok"]
+
+
+def test_run_where_every_query_failed_still_summarizes():
+    processor = AgentProcessor("test", FlakyClient(failures=set(), throttle_asks=True))
+    run(LoadEngine(processor, users=2, concurrency=2), ["q1", "q2", "q3"])
+    assert list(processor.samples.to_frame()["Status"]) == ["throttled"] * 3
+    assert processor.summary()["Error Rate"] == 1.0
+    model = processor.latency_drivers()
+    assert model.coefficients is None
+    assert model.drivers().empty and model.outliers().empty and model.explained() is None
+
+
+class SlowStartClient(FlakyClient):
+    async def start_conversation(self, emit_start_conversation_event=True):
+        await asyncio.sleep(0.05)
+        async for action in super().start_conversation(emit_start_conversation_event):
+            yield action
+
+
+def test_open_loop_session_first_turn_is_measured_from_its_schedule():
+    processor = AgentProcessor("test", SlowStartClient(failures=set()))
+    scenario = Scenario("s1", [Query("a"), Query("b")], [lambda: 0.0] * 2)
+    run(LoadEngine(processor), [scenario], rate=50)
+    samples = processor.samples.to_frame()
+    # The conversation start happened after the session was due, so it is the first turn's send lag
+    assert samples.loc[0, "SendLag"] >= 0.04
+    assert samples.loc[1, "SendLag"] == 0
+
+
+class SlowClient(FlakyClient):
+    async def ask_question(self, question, conversation_id=None):
+        await asyncio.sleep(0.05)
+        async for activity in super().ask_question(question, conversation_id):
+            yield activity
+
+
+def test_open_loop_conversations_are_capped():
+    processor = AgentProcessor("test", SlowClient(failures=set()))
+    engine = LoadEngine(processor, max_conversations=2)
+    run(engine, [f"q{index}" for index in range(6)], rate=100)
+    samples = processor.samples.to_frame()
+    assert len(engine.conversations) == 2 and processor.connection.starts == 2
+    assert list(samples["Status"]) == ["ok"] * 6
+    assert samples["ConversationId"].nunique() == 2
+    # Arrivals past the cap waited for a free conversation, and that wait is their send lag
+    assert samples["SendLag"].max() >= 0.04
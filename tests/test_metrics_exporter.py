@@ -0,0 +1,38 @@
+from src.AgentProcessor import AgentProcessor
+from src.load_engine import LoadEngine
+from src.metrics_exporter import PREFIX, MetricsExporter, MetricsText
+from src.streaming_stats import LatencyHistogram
+from tests.test_load_engine import FlakyClient, run
+
+
+def test_histogram_family_is_cumulative():
+    histogram = LatencyHistogram()
+    for value in [0.02, 0.2, 0.2, 3.0]:
+        histogram.record(value)
+    text = MetricsText()
+    text.family("phase_seconds", "histogram", "Phases")
+    text.histogram("phase_seconds", histogram, {"phase": "Time"})
+    lines = text.render().splitlines()
+    assert lines[:2] == [f"# HELP {PREFIX}phase_seconds Phases", f"# TYPE {PREFIX}phase_seconds histogram"]
+    assert f'{PREFIX}phase_seconds_bucket{{phase="Time",le="0.025"}} 1' in lines
+    assert f'{PREFIX}phase_seconds_bucket{{phase="Time",le="0.25"}} 3' in lines
+    assert f'{PREFIX}phase_seconds_bucket{{phase="Time",le="+Inf"}} 4' in lines
+    assert f'{PREFIX}phase_seconds_count{{phase="Time"}} 4' in lines
+
+
+def test_openmetrics_names_counters_without_total_and_ends_with_eof():
+    text = MetricsText(openmetrics=True)
+    text.family("requests_total", "counter", "Queries")
+    text.sample("requests_total", 3, {"status": 'a"b'})
+    assert text.render() == (f"# HELP {PREFIX}requests Queries\n# TYPE {PREFIX}requests counter\n"
+                             f'{PREFIX}requests_total{{status="a\\"b"}} 3\n# EOF\n')
+
+
+def test_exporter_renders_a_run():
+    processor = AgentProcessor("test", FlakyClient(failures={1}))
+    run(LoadEngine(processor), ["q1", "q2", "q3"])
+    lines = MetricsExporter(processor).render().splitlines()
+    assert f'{PREFIX}requests_total{{agent="test",status="ok"}} 2' in lines
+    assert f'{PREFIX}requests_total{{agent="test",status="throttled"}} 1' in lines
+    assert f'{PREFIX}phase_seconds_count{{agent="test",phase="Time"}} 2' in lines
+    assert MetricsExporter(processor).render(openmetrics=True).endswith("# EOF\n")
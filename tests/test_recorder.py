@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timezone
+
+import aiohttp
+from microsoft_agents.activity import Activity, ConversationAccount
+
+from src.AgentProcessor import AgentProcessor
+from src.failures import RetryPolicy
+from src.load_engine import LoadEngine
+from src.recorder import ActivityRecorder, RecordingClient, ReplayClient
+
+
+class ThrottlingClient:
+    # The first ask of every question in `throttled` is answered with HTTP 429,
+    # the retry succeeds; questions in `failed` are always throttled
+    def __init__(self, throttled=(), failed=()):
+        self.throttled = set(throttled)
+        self.failed = set(failed)
+        self.starts = 0
+
+    async def start_conversation(self, emit_start_conversation_event=True):
+        self.starts += 1
+        yield Activity(type="event", conversation=ConversationAccount(id=f"conversation-{self.starts}"))
+
+    async def ask_question(self, question, conversation_id=None):
+        if question in self.failed:
+            raise aiohttp.ClientError("Error sending request: 429")
+        if question in self.throttled:
+            self.throttled.discard(question)
+            raise aiohttp.ClientError("Error sending request: 429")
+        yield Activity(type="message", text=f"Answer to {question}", timestamp=datetime.now(timezone.utc))
+
+
+def run(processor, queries):
+    async def drive():
+        async for _ in LoadEngine(processor).run(queries):
+            pass
+
+    asyncio.run(drive())
+
+
+def test_replay_gives_the_recorded_statuses(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    queries = ["q1", "q2", "q3", "q4"]
+    recorder = ActivityRecorder(path)
+    live = AgentProcessor("test", RecordingClient(ThrottlingClient(throttled={"q2"}, failed={"q3"}), recorder))
+    live.retry_policy = RetryPolicy(1, backoff=0.001)
+    run(live, queries)
+    recorder.close()
+
+    replay = ReplayClient(path, speed=0)
+    # One entry per logical query, retries are attempts of it
+    assert replay.queries() == queries
+    assert replay.conversations() == 1
+    replayed = AgentProcessor("test", replay)
+    replayed.retry_policy = RetryPolicy(1, backoff=0.001)
+    run(replayed, replay.queries())
+
+    recorded, replayed = live.samples.to_frame(), replayed.samples.to_frame()
+    assert list(recorded["Status"]) == ["ok", "ok", "throttled", "ok"]
+    assert list(replayed["Status"]) == list(recorded["Status"])
+    assert list(replayed["Retries"]) == list(recorded["Retries"]) == [0, 1, 1, 0]
+
+
+def test_replay_has_no_server_time_split(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    recorder = ActivityRecorder(path)
+    live = AgentProcessor("test", RecordingClient(ThrottlingClient(), recorder))
+    run(live, ["q1", "q2"])
+    recorder.close()
+    assert live.time_split.summary()
+
+    # The recorded server stamps would give a clock offset against the recording's clock
+    replayed = AgentProcessor("test", ReplayClient(path, speed=0))
+    run(replayed, ["q1", "q2"])
+    assert replayed.time_split.summary() == {}
+    assert replayed.samples.to_frame()["ClockOffset"].isna().all()
@@ -0,0 +1,19 @@
+import numpy as np
+
+from src.result_store import ResultStore
+
+COLUMNS = {"Serial": "int64", "Query": object, "Time": "float64"}
+
+
+def test_spilled_rows_come_back_in_to_frame(tmp_path):
+    store = ResultStore(COLUMNS, spill=str(tmp_path / "samples"), chunk_rows=4)
+    for serial in range(1, 11):
+        store.append({"Serial": serial, "Query": f"q{serial}", "Time": None if serial == 5 else serial / 10})
+    # Two chunks of four on disk, two rows still in memory
+    assert len(store.chunks) == 2 and len(store) == 10
+    frame = store.to_frame()
+    assert list(frame.index) == list(range(10))
+    assert list(frame["Serial"]) == list(range(1, 11))
+    assert list(frame["Query"]) == [f"q{serial}" for serial in range(1, 11)]
+    assert np.isnan(frame.loc[4, "Time"]) and frame.loc[9, "Time"] == 1.0
+    assert list(store.to_frame(6)["Serial"]) == [7, 8, 9, 10]
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from src.run import main
+from src.run_store import regressions
+
+
+def comparison(*rows):
+    return pd.DataFrame(rows, columns=["Metric", "Baseline", "Candidate", "Delta", "Delta %"])
+
+
+def test_error_rate_rise_from_zero_is_a_regression():
+    flagged = regressions(comparison(["Error Rate %", 0.0, 75.0, 75.0, None]), 10)
+    assert list(flagged["Metric"]) == ["Error Rate %"]
+
+
+def test_error_rate_is_judged_in_points():
+    rows = comparison(["Error Rate %", 10.0, 10.5, 0.5, 5.0], ["Time p95", 1.0, 1.05, 0.05, 5.0])
+    assert regressions(rows, 1).empty is False
+    assert list(regressions(rows, 1)["Metric"]) == ["Time p95"]
+    assert list(regressions(rows, 1, error_points=0.25)["Metric"]) == ["Error Rate %", "Time p95"]
+
+
+def test_metric_rising_from_zero_baseline_is_a_regression():
+    rows = comparison(["Tool search p50", 0.0, 0.2, 0.2, None], ["Time p50", 0.0, 0.0, 0.0, None],
+                      ["Time p95", 1.0, 1.05, 0.05, 5.0])
+    assert list(regressions(rows, 10)["Metric"]) == ["Tool search p50"]
+
+
+def test_baseline_needs_the_run_stored():
+    with pytest.raises(SystemExit) as exit:
+        main(["--baseline", "20260101-000000", "--no-store"])
+    assert exit.value.code == 2
@@ -0,0 +1,25 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from src.scheduler import ArrivalScheduler
+
+
+def test_constant_offsets_are_evenly_spaced():
+    offsets = list(itertools.islice(ArrivalScheduler(4, "constant").offsets(), 5))
+    assert offsets == [0.0, 0.25, 0.5, 0.75, 1.0]
+
+
+def test_poisson_offsets_have_the_rate_and_follow_the_seed():
+    offsets = list(itertools.islice(ArrivalScheduler(20, "poisson", seed=3).offsets(), 20001))
+    assert offsets[0] == 0.0 and all(np.diff(offsets) >= 0)
+    assert abs(np.mean(np.diff(offsets)) - 1 / 20) < 0.001
+    assert offsets[:10] == list(itertools.islice(ArrivalScheduler(20, "poisson", seed=3).offsets(), 10))
+
+
+def test_invalid_schedules_are_rejected():
+    with pytest.raises(ValueError):
+        ArrivalScheduler(0)
+    with pytest.raises(ValueError):
+        ArrivalScheduler(1, "burst")
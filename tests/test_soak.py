@@ -0,0 +1,34 @@
+import pandas as pd
+
+from src.soak import RollingWindows
+
+
+def test_queries_land_in_the_window_of_their_offset(tmp_path):
+    path = tmp_path / "windows.csv"
+    windows = RollingWindows(window=10.0, path=str(path))
+    windows.add(1.0, 0.5)
+    windows.add(9.9, 1.5)
+    windows.add(12.0, 2.0, ok=False)
+    # Nothing in the third window; the fourth holds the last query
+    windows.add(35.0, 4.0)
+    assert len(windows.frame()) == 3
+    assert len(windows.frame(current=True)) == 4
+    windows.finish()
+    frame = windows.frame()
+    assert list(frame["Window"]) == [1, 2, 3, 4]
+    assert list(frame["Queries"]) == [2, 1, 0, 1]
+    assert list(frame["Errors"]) == [0, 1, 0, 0]
+    assert frame.loc[0, "Mean"] == 1.0 and frame.loc[0, "Max"] == 1.5
+    assert frame["p50"].isna().tolist() == [False, True, True, False]
+    assert list(pd.read_csv(path)["Queries"]) == [2, 1, 0, 1]
+
+
+def test_drift_is_the_p95_slope_per_hour():
+    windows = RollingWindows(window=600.0)
+    for index in range(12):
+        windows.add(index * 600 + 1, 1.0 + index * 0.05)
+    windows.finish()
+    drift = windows.drift()
+    assert abs(drift["p95 Drift s/h"] - 0.3) < 0.01
+    assert drift["p95 Last Hour"] > drift["p95 First Hour"]
+    assert RollingWindows().drift() is None
@@ -0,0 +1,30 @@
+import numpy as np
+
+from src.streaming_stats import LatencyHistogram, StreamingStats
+
+
+def test_histogram_percentiles_are_within_one_percent():
+    values = np.random.default_rng(1).lognormal(0.0, 0.8, 20000)
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    for q in [50, 90, 95, 99, 99.9]:
+        assert abs(histogram.percentile(q) - np.percentile(values, q)) <= 0.01 * np.percentile(values, q)
+
+
+def test_merged_stats_equal_one_pass():
+    rng = np.random.default_rng(2)
+    values, lengths = rng.exponential(1.5, 3000), rng.integers(10, 500, 3000)
+    whole, parts = StreamingStats(), [StreamingStats() for _ in range(3)]
+    for index, (value, length) in enumerate(zip(values, lengths)):
+        whole.add(value, length)
+        parts[index % 3].add(value, length)
+    merged = StreamingStats()
+    for part in parts:
+        merged.merge(part)
+    assert merged.count == whole.count
+    assert np.isclose(merged.mean, whole.mean) and np.isclose(merged.std, whole.std)
+    assert np.isclose(merged.correlation, whole.correlation)
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    assert (merged.histogram.counts == whole.histogram.counts).all()
+    assert np.isclose(merged.std, np.std(values, ddof=1))